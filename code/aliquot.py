@@ -0,0 +1,147 @@
+import json
+import os
+import sqlite3
+
+# Aliquot parts as (u0, v0, u1, v1) rectangles inside the area they divide,
+# with u running east and v running south from its NW corner
+WHOLE = (0.0, 0.0, 1.0, 1.0)
+HALVES = {
+    "north": (0.0, 0.0, 1.0, 0.5),
+    "south": (0.0, 0.5, 1.0, 1.0),
+    "east": (0.5, 0.0, 1.0, 1.0),
+    "west": (0.0, 0.0, 0.5, 1.0),
+}
+QUARTERS = {
+    "nw": (0.0, 0.0, 0.5, 0.5),
+    "ne": (0.5, 0.0, 1.0, 0.5),
+    "se": (0.5, 0.5, 1.0, 1.0),
+    "sw": (0.0, 0.5, 0.5, 1.0),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS areas (
+    key TEXT PRIMARY KEY,
+    points TEXT NOT NULL
+);
+"""
+
+
+def compose(outer, inner):
+    """
+    Returns the rectangle that inner covers inside outer, in outer's own terms.
+    """
+    u0, v0, u1, v1 = outer
+    width, height = u1 - u0, v1 - v0
+    return (u0 + inner[0] * width, v0 + inner[1] * height, u0 + inner[2] * width, v0 + inner[3] * height)
+
+
+def bilinear_point(quad, u, v):
+    (nw_x, nw_y), (ne_x, ne_y), (se_x, se_y), (sw_x, sw_y) = quad
+    north = (nw_x + (ne_x - nw_x) * u, nw_y + (ne_y - nw_y) * u)
+    south = (sw_x + (se_x - sw_x) * u, sw_y + (se_y - sw_y) * u)
+    return north[0] + (south[0] - north[0]) * v, north[1] + (south[1] - north[1]) * v
+
+
+def rectangle_area(quad, rectangle):
+    """
+    Returns the NW, NE, SE and SW points of a rectangle inside a (NW, NE, SE, SW) quadrilateral.
+
+    Halving along a side and then joining the halfway points is the same as
+    mapping the rectangle through the quadrilateral's bilinear interpolation,
+    so any chain of halves and quarters ends up here in a single step.
+    """
+    u0, v0, u1, v1 = rectangle
+    return [
+        bilinear_point(quad, u0, v0),
+        bilinear_point(quad, u1, v0),
+        bilinear_point(quad, u1, v1),
+        bilinear_point(quad, u0, v1),
+    ]
+
+
+def section_point(quarter, u, v):
+    # Each quarter of a section is surveyed separately, so a point goes through
+    # the quarter that holds it
+    column, u = ("w", u * 2) if u <= 0.5 else ("e", u * 2 - 1)
+    row, v = ("n", v * 2) if v <= 0.5 else ("s", v * 2 - 1)
+    return bilinear_point(quarter(row + column), u, v)
+
+
+def section_rectangle_area(quarter, rectangle):
+    """
+    Returns the NW, NE, SE and SW points of a rectangle inside a section, where
+    quarter(corner) returns the (NW, NE, SE, SW) points of one of its quarters.
+
+    A rectangle inside a single quarter goes through that quarter alone, while
+    one that spans several, like a half, has each corner mapped through the
+    quarter it falls in, so it still lines up with the surveyed quarter corners.
+    Only the quarters the rectangle touches are ever looked up, since plenty of
+    sections along the edge of the survey are missing some of their corners.
+    """
+    u0, v0, u1, v1 = rectangle
+    for corner, (q0, r0, q1, r1) in QUARTERS.items():
+        if q0 <= u0 and u1 <= q1 and r0 <= v0 and v1 <= r1:
+            inner = ((u0 - q0) * 2, (v0 - r0) * 2, (u1 - q0) * 2, (v1 - r0) * 2)
+            return rectangle_area(quarter(corner), inner)
+    return [section_point(quarter, u, v) for u, v in ((u0, v0), (u1, v0), (u1, v1), (u0, v1))]
+
+
+class AliquotCache:
+    """
+    Remembers the area every division chain works out to, across documents and runs.
+
+    Lookups go to a dictionary first and then to SQLite, so a chain only ever
+    gets worked out once. New areas are held until flush(), so they're written
+    in a single transaction. The connection is opened on first use, and again
+    in any worker process, since SQLite connections can't be shared across a
+    fork. Everything is thrown out whenever version changes.
+    """
+
+    def __init__(self, path, version=None):
+        self.path = path
+        self.version = json.dumps(version)
+        self.memory = {}
+        self.pending = {}
+        self.pid = None
+        self.connection = None
+
+    def connect(self):
+        if self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=30)
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.executescript(SCHEMA)
+            with self.connection:
+                row = self.connection.execute("SELECT value FROM settings WHERE name = 'version'").fetchone()
+                if row is None or row[0] != self.version:
+                    self.connection.execute("DELETE FROM areas")
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO settings (name, value) VALUES ('version', ?)", (self.version,)
+                    )
+            self.pid = os.getpid()
+        return self.connection
+
+    def get(self, key):
+        if key in self.memory:
+            return self.memory[key]
+        row = self.connect().execute("SELECT points FROM areas WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        area = self.memory[key] = [tuple(point) for point in json.loads(row[0])]
+        return area
+
+    def set(self, key, area):
+        self.memory[key] = self.pending[key] = area
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO areas (key, points) VALUES (?, ?)",
+                [(key, json.dumps(area)) for key, area in self.pending.items()]
+            )
+        self.pending = {}
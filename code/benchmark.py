@@ -0,0 +1,315 @@
+"""
+Times the hot paths of the pipeline against synthetic data, at several
+multiples of the size of the real corpus, and keeps a history of the results
+so a slowdown shows up next to the commit that caused it.
+
+    python3 benchmark.py
+    python3 benchmark.py --scale 1 --scale 10 --repeat 5
+
+Filings, deeds and result pages are all made up from a fixed seed, so every
+run times exactly the same work.
+"""
+import argparse
+import datetime
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from collections import OrderedDict
+
+import yaml
+
+import eagleweb
+import featurewriter
+import standin
+from aliquot import AliquotCache
+from compiled import compile_filings, load_plss
+from lotgrid import lot_grid
+from plssindex import QUARTERS
+from projection import reproject_all
+from traverse import TraverseBatch, bearings, make_points
+
+HISTORY_PATH = '../maps.data/benchmarks.json'
+PLSS_PATH = '../maps.data/plss.yaml'
+SCALES = [1, 10, 100]
+
+# Roughly the size of the real corpus when this was written
+BASE_SIZES = {
+    'filings': 280,
+    'deeds': 200,
+    'pages': 50,
+}
+
+# How much slower than the last run counts as a regression
+REGRESSION = 1.2
+
+SUBDIVISIONS = ['munger', 'bay lake acres', 'reedy creek', 'lake buena vista']
+
+
+def load_script(name, filename):
+    # Scripts with hyphens in their names can't be imported the usual way
+    spec = importlib.util.spec_from_file_location(name, os.path.join(os.path.dirname(__file__), filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_angle(generator, maximum=90):
+    return f'{generator.randint(0, maximum - 1):02d} {generator.randint(0, 59):02d} {generator.randint(0, 59):02d}'
+
+
+def make_line(generator):
+    return f"{generator.choice('NS')} {make_angle(generator)} {generator.choice('EW')} {generator.uniform(10, 800):.2f}"
+
+
+def make_curve(generator):
+    radius = generator.uniform(20, 2000)
+    return f"{generator.choice('LR')} {radius:.2f} {make_angle(generator)} {generator.uniform(10, 500):.2f}"
+
+
+def make_filings(count, corners, seed=0):
+    """
+    Makes up a filings.yaml with count filings, a quarter of whose calls are curves.
+    """
+    generator = random.Random(seed)
+    filings = []
+    for i in range(count):
+        shape = [
+            make_curve(generator) if generator.random() < 0.25 else make_line(generator)
+            for call in range(generator.randint(3, 12))
+        ]
+        filings.append({
+            'date': datetime.date(1967, 1, 1) + datetime.timedelta(days=generator.randint(0, 365 * 30)),
+            'doc': f'DOCC{1000000 + i}',
+            'desc': f'Synthetic filing {i}',
+            'property': {
+                'origin': generator.choice(corners),
+                'beginning': [make_line(generator) for call in range(generator.randint(1, 3))],
+                'shape': shape,
+            },
+        })
+    return yaml.safe_dump_all(filings, sort_keys=False)
+
+
+def make_description(generator, sections):
+    (township, range_number, section), surveyed = generator.choice(sections)
+    location = f'section {section}, township {township} south, range {range_number} east'
+    kind = generator.random()
+    # Lots are laid out over the whole section, so they need all of it surveyed
+    if kind < 0.2 and len(surveyed) == len(QUARTERS):
+        first = generator.randint(1, 120)
+        return f'lots {first} through {first + generator.randint(0, 8)} of {generator.choice(SUBDIVISIONS)} subdivision in {location}'
+    quarters = [generator.choice(list(QUARTERS)) for i in range(generator.randint(0, 2))] + [generator.choice(surveyed)]
+    quarters = ' of the '.join(f'{quarter} 1/4' for quarter in quarters)
+    if kind < 0.5:
+        quarters = f"{generator.choice(['north', 'south', 'east', 'west'])} 1/2 of the {quarters}"
+    if kind > 0.8:
+        quarters = f"{quarters} less the {generator.choice(['north', 'south', 'east', 'west'])} {generator.randint(10, 300)} feet"
+    return f'the {quarters} of {location}'
+
+
+def make_deeds(count, sections, seed=0):
+    """
+    Makes up OCR text for count deeds, each with one to three property descriptions.
+    """
+    generator = random.Random(seed)
+    deeds = []
+    for i in range(count):
+        descriptions = [make_description(generator, sections) for i in range(generator.randint(1, 3))]
+        deeds.append(
+            'WARRANTY DEED\nThis indenture witnesseth that\n' +
+            '\nAND\n'.join(description.upper() for description in descriptions) +
+            '\nIN WITNESS WHEREOF\n'
+        )
+    return deeds
+
+
+def make_pages(count, seed=0):
+    """
+    Renders count pages of search results, each linking to the next.
+    """
+    pages = []
+    for i in range(count):
+        records = standin.make_records({'seed': str(seed), 'page': str(i)}, count=standin.PAGE_SIZE)
+        next_url = f'SearchResults.jsp?searchId=0&page={i + 2}' if i < count - 1 else None
+        pages.append(standin.render_results_page(records, next_url))
+    return pages
+
+
+def surveyed_sections(plss):
+    """
+    Returns every section with at least one quarter surveyed, along with the
+    quarters that are.
+
+    Sections along the edge of the survey are missing some of their corners,
+    but real deeds still describe the quarters of them that are surveyed, so
+    they're mixed in with the complete ones.
+    """
+    corners = {}
+    for key in plss:
+        township, range_number, section, corner = key.split()
+        corners.setdefault((int(township), int(range_number), int(section)), set()).add(corner)
+    sections = []
+    for section, found in sorted(corners.items()):
+        surveyed = [quarter for quarter, needed in QUARTERS.items() if found.issuperset(needed)]
+        if surveyed:
+            sections.append((section, surveyed))
+    return sections
+
+
+def time_best(function, repeat):
+    best = None
+    for i in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_scale(scale, repeat, plss, deeds_module):
+    sizes = {name: size * scale for name, size in BASE_SIZES.items()}
+    timings = {}
+
+    # Filings: parsing calls, walking traverses, reprojecting and writing them out
+    filings_yaml = make_filings(sizes['filings'], list(plss), seed=scale)
+    timings['filings_yaml'] = time_best(lambda: compile_filings(filings_yaml), repeat)
+    filings = compile_filings(filings_yaml)
+
+    def parse_calls():
+        parsed = []
+        for filing in filings:
+            beginning = list(bearings(filing['property']['beginning']))
+            shape = list(bearings(filing['property']['shape'], bearing=beginning[-1][0]))
+            parsed.append((plss[filing['property']['origin']], beginning, shape))
+        return parsed
+    timings['bearings'] = time_best(parse_calls, repeat)
+    traverses = parse_calls()
+
+    def walk():
+        return [list(make_points(origin, beginning, shape, closed=True)) for origin, beginning, shape in traverses]
+    timings['make_points'] = time_best(walk, repeat)
+
+    def walk_batch():
+        batch = TraverseBatch()
+        for origin, beginning, shape in traverses:
+            batch.add(origin, beginning, shape, closed=True)
+        return batch.compute()
+    timings['traverse_batch'] = time_best(walk_batch, repeat)
+    points = walk_batch()
+
+    # A fresh cache each time, or every run after the first would be free
+    coordinates = [[point for point, interpolated in traverse] for traverse in points]
+    timings['reprojection'] = time_best(lambda: reproject_all(coordinates, cache=OrderedDict()), repeat)
+    projected = reproject_all(coordinates, cache=OrderedDict())
+
+    features = [
+        {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [ring]}, 'properties': {'doc': filing['doc']}}
+        for filing, ring in zip(filings, projected)
+    ]
+
+    def write_geojson():
+        with featurewriter.FeatureCollectionWriter(io.StringIO()) as writer:
+            writer.write_all(features)
+    timings['geojson_writing'] = time_best(write_geojson, repeat)
+
+    # Deeds: tokenizing OCR text, then working out each property's area
+    texts = make_deeds(sizes['deeds'], surveyed_sections(plss), seed=scale)
+    timings['tokenize'] = time_best(
+        lambda: [list(deeds_module.tokenize(deeds_module.normalize(text))) for text in texts], repeat
+    )
+    descriptions = []
+    for text in texts:
+        parts = []
+        for match, token in deeds_module.tokenize(deeds_module.normalize(text)):
+            parts.append(token)
+            if isinstance(token, deeds_module.Range):
+                descriptions.append(parts)
+                parts = []
+
+    def calculate_areas():
+        # Start from empty caches, so each run measures a fresh corpus
+        deeds_module.ALIQUOTS = AliquotCache(':memory:')
+        lot_grid.cache_clear()
+        for parts in descriptions:
+            sum(parts).calculate()
+    timings['area_calculate'] = time_best(calculate_areas, repeat)
+
+    # Search results: parsing pages of results the way get_results() does
+    pages = make_pages(sizes['pages'], seed=scale)
+    results_url = 'http://127.0.0.1:8080/recorder/eagleweb/SearchResults.jsp'
+    timings['parse_results'] = time_best(lambda: [eagleweb.parse_results(page, results_url) for page in pages], repeat)
+
+    return sizes, timings
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    try:
+        with open(path) as history_file:
+            return json.load(history_file)
+    except (IOError, ValueError):
+        return []
+
+
+def save_history(path, history):
+    temporary_path = f'{path}.{os.getpid()}'
+    with open(temporary_path, 'w') as history_file:
+        json.dump(history, history_file, indent=2)
+    os.replace(temporary_path, path)
+
+
+def report(run, previous):
+    for scale, entry in run['results'].items():
+        print(f"{scale}x ({', '.join(f'{size} {name}' for name, size in entry['sizes'].items())})")
+        before = (previous or {}).get('results', {}).get(scale, {}).get('timings', {})
+        for name, seconds in entry['timings'].items():
+            line = f'  {name:<16} {seconds * 1000:10.1f} ms'
+            if before.get(name):
+                ratio = seconds / before[name]
+                line += f'  {ratio:5.2f}x last run'
+                if ratio > REGRESSION:
+                    line += '  SLOWER'
+            print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times the hot paths of the pipeline against synthetic data')
+    parser.add_argument('--scale', type=int, action='append', metavar='N', help='multiple of the real corpus to test at (default: 1, 10 and 100)')
+    parser.add_argument('--repeat', type=int, default=3, metavar='N', help='take the best of N runs of each benchmark')
+    parser.add_argument('--history', default=HISTORY_PATH, metavar='JSON', help='where to keep the results of every run')
+    parser.add_argument('--no-save', action='store_true', help="don't add this run to the history")
+    args = parser.parse_args()
+
+    plss = load_plss(PLSS_PATH)
+    deeds_module = load_script('parse_deeds', 'parse-deeds.py')
+
+    run = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'results': {},
+    }
+    for scale in args.scale or SCALES:
+        sizes, timings = run_scale(scale, args.repeat, plss, deeds_module)
+        run['results'][str(scale)] = {'sizes': sizes, 'timings': timings}
+
+    history = load_history(args.history)
+    report(run, history[-1] if history else None)
+    if not args.no_save:
+        history.append(run)
+        save_history(args.history, history)
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import pickle
+import sys
+from collections.abc import Mapping
+
+import numpy
+import yaml
+
+
+# Bump this whenever the layout of the compiled data changes
+CACHE_VERSION = 1
+
+
+def cache_path(path, variant=None):
+    directory, filename = os.path.split(path)
+    if variant:
+        return os.path.join(directory, ".%s.%s.cache" % (filename, variant))
+    return os.path.join(directory, ".%s.cache" % filename)
+
+
+def load_compiled(path, compile, variant=None, version=None):
+    """
+    Loads the compiled form of a YAML file, compiling it first if necessary.
+
+    The compiled data is pickled alongside the source file, keyed on a hash of
+    its contents, so the YAML only gets parsed again after it changes. Different
+    compiled forms of the same file are told apart by variant, and version
+    invalidates a cache when the code that compiles it changes.
+    """
+    with open(path, 'rb') as source_file:
+        source = source_file.read()
+    key = (CACHE_VERSION, version, hashlib.sha256(source).hexdigest())
+
+    compiled_path = cache_path(path, variant)
+    try:
+        with open(compiled_path, 'rb') as compiled_file:
+            cached_key, data = pickle.load(compiled_file)
+        if cached_key == key:
+            return data
+    except FileNotFoundError:
+        pass
+    except Exception as exc:
+        # Anything from a truncated file to a class that has since been renamed
+        # or moved just means compiling it again
+        print("Recompiling %s: %s: %s" % (path, exc.__class__.__name__, exc), file=sys.stderr)
+
+    data = compile(source)
+    # Write to a temporary file first, so a half-written cache never gets used
+    temporary_path = "%s.%d" % (compiled_path, os.getpid())
+    try:
+        with open(temporary_path, 'wb') as compiled_file:
+            pickle.dump((key, data), compiled_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, compiled_path)
+    except (IOError, pickle.PicklingError):
+        # Not being able to write the cache shouldn't stop anything from running
+        pass
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return data
+
+
+class Corners(Mapping):
+    """
+    PLSS corners, stored as an array of (x, y) points with an index of their keys.
+
+    Looking up a key like "24 27 11 NE" returns an [x, y] list, just like the
+    dictionary that comes straight out of plss.yaml.
+    """
+
+    def __init__(self, keys, points):
+        self.keys_list = keys
+        self.points = points
+        self.index = {key: i for i, key in enumerate(keys)}
+
+    def __getitem__(self, key):
+        return self.points[self.index[key]].tolist()
+
+    def __iter__(self):
+        return iter(self.keys_list)
+
+    def __len__(self):
+        return len(self.keys_list)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __getstate__(self):
+        return self.keys_list, self.points
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+def compile_filings(source):
+    return list(yaml.safe_load_all(source))
+
+
+def compile_plss(source):
+    corners = yaml.safe_load(source)
+    keys = list(corners)
+    points = numpy.array([corners[key] for key in keys], dtype=float)
+    points.shape = (len(keys), 2)
+    return Corners(keys, points)
+
+
+def load_filings(path):
+    return load_compiled(path, compile_filings)
+
+
+def load_plss(path):
+    return load_compiled(path, compile_plss)
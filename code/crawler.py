@@ -0,0 +1,175 @@
+import asyncio
+import random
+import time
+from collections import defaultdict, namedtuple
+from urllib.parse import urljoin, urlparse
+
+import aiohttp
+
+import eagleweb
+from downloads import DownloadManager
+
+Response = namedtuple('Response', ['status', 'url', 'headers', 'body'])
+
+# Statuses that are worth trying again after a little while
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Allows bursts of up to capacity requests, refilling at rate requests per second.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Crawler:
+    """
+    Crawls the eagleweb records search with a single pooled, keep-alive session.
+
+    Every request goes through a per-host concurrency limit and a token bucket,
+    and is retried with exponential backoff if it fails in a way that looks
+    temporary. Searches fetch their next page while the current one is parsed
+    in a worker thread, and downloads run in the background the whole time
+    (see downloads.DownloadManager), so paging, parsing and downloading all
+    overlap.
+    """
+
+    def __init__(
+        self,
+        base_url=eagleweb.BASE_URL,
+        concurrency=4,
+        rate=4.0,
+        retries=4,
+        backoff=1.0,
+        timeout=120,
+        max_downloads=16,
+        ledger=None,
+    ):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate) if rate else None
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.host_limits = defaultdict(lambda: asyncio.Semaphore(self.concurrency))
+        self.session = None
+        self.downloads = DownloadManager(self, ledger, initial=concurrency, maximum=max_downloads)
+
+    async def __aenter__(self):
+        # Downloads are limited separately, so leave room for them alongside the searches
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.concurrency + self.downloads.limit.maximum,
+            keepalive_timeout=60,
+        )
+        # Unsafe only in the sense that it also keeps cookies for bare IP addresses,
+        # which a local stand-in server needs
+        cookies = aiohttp.CookieJar(unsafe=True)
+        self.session = aiohttp.ClientSession(connector=connector, cookie_jar=cookies, timeout=self.timeout)
+        await self.login()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        try:
+            if exc_info[0] is None:
+                await self.finish_downloads()
+        finally:
+            self.downloads.close()
+            await self.session.close()
+
+    def url(self, path):
+        return urljoin(self.base_url, path)
+
+    async def login(self):
+        # Accept the usage terms
+        await self.request('POST', self.url(eagleweb.LOGIN_PATH))
+
+    async def request(self, method, url, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._request(method, url, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RetryableError) as exc:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt * (1 + random.random())
+                print(f'Retrying {url} in {delay:.1f}s after {exc.__class__.__name__}: {exc}')
+                await asyncio.sleep(delay)
+
+    async def _request(self, method, url, **kwargs):
+        async with self.host_limits[urlparse(url).netloc]:
+            if self.bucket:
+                await self.bucket.acquire()
+            async with self.session.request(method, url, **kwargs) as response:
+                if response.status in RETRY_STATUSES:
+                    raise RetryableError(f'HTTP {response.status}')
+                response.raise_for_status()
+                return Response(response.status, str(response.url), response.headers, await response.read())
+
+    async def get_text(self, url):
+        response = await self.request('GET', url)
+        return response.body.decode('utf-8', errors='replace')
+
+    async def search(self, params, parse=eagleweb.parse_results):
+        """
+        Yields every result for a search, across all of its pages.
+        """
+        response = await self.request('POST', self.url(eagleweb.SEARCH_PATH), data=params, allow_redirects=False)
+        results_url = urljoin(self.url(eagleweb.SEARCH_PATH), response.headers['Location'])
+        page = asyncio.ensure_future(self.get_text(results_url))
+
+        try:
+            while page is not None:
+                content = await page
+
+                # Pick out the next page's link without parsing and start on it
+                # straight away, so it's downloading while this page is parsed
+                next_url = eagleweb.find_next_url(content, results_url)
+                page = asyncio.ensure_future(self.get_text(next_url)) if next_url else None
+                results, parsed_next_url = await asyncio.to_thread(parse, content, results_url)
+
+                if parsed_next_url != next_url:
+                    # The quick search got it wrong, so go with the parser
+                    if page is not None:
+                        page.cancel()
+                    next_url = parsed_next_url
+                    page = asyncio.ensure_future(self.get_text(next_url)) if next_url else None
+                results_url = next_url
+
+                for result in results:
+                    yield result
+        finally:
+            # Don't leave the next page loading if the caller stopped early
+            if page is not None and not page.done():
+                page.cancel()
+
+    def queue_download(self, url, local_path):
+        """
+        Schedules a download to happen in the background while crawling continues.
+        """
+        self.downloads.queue_download(url, local_path)
+
+    def is_downloaded(self, local_path):
+        return self.downloads.is_complete(local_path)
+
+    async def finish_downloads(self):
+        await self.downloads.finish()
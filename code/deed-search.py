@@ -1,67 +1,44 @@
+import argparse
+import asyncio
+import collections
 import datetime
 import functools
-import grequests
 import json
 import os.path
 import pprint
 import re
-import requests
-from collections import defaultdict
-from lxml import html
-from urllib.parse import parse_qsl, urljoin, urlparse
 
-DATE_FORMAT = '%m/%d/%Y'
+from crawler import Crawler
+from downloads import DownloadLedger
+from eagleweb import DATE_FORMAT, strpdate
+from frontier import Frontier
+from resultstore import ResultStore, subject_key
+
 OUTPUT_DIRECTORY = '../maps.documents/deeds.new'
-SEARCH_URL = 'https://or.occompt.com/recorder/eagleweb/docSearchPOST.jsp'
-FILENAME_RE = re.compile(r'parent=(.+)$')
+CONCURRENCY = 4  # Simultaneous requests to the records search
+RATE_LIMIT = 4  # Requests per second
+MAX_DEPTH = 1  # How many sales back to follow each chain of title
+FAN_OUT = None  # Most grantors to follow from each deed, or None for all of them
 SCRIPT_DIR = os.path.dirname(__file__)
 VALID_PERSON = re.compile(r'^[A-Za-z]+')
 TODAY = datetime.date.today()
 
-# Load in a cache of prior results
-RESULTS_PATH = os.path.join(SCRIPT_DIR, OUTPUT_DIRECTORY, 'deed-results.json')
-try:
-    with open(RESULTS_PATH) as input_file:
-        prior_results = json.load(input_file)
-except:
-    prior_results = {"searches": [], "documents": []}
-
-START_OVER = not prior_results["searches"]
-START_OVER = True
-
-# Accept the usage terms
-session = requests.Session()
-response = session.post('https://or.occompt.com/recorder/web/loginPOST.jsp?guest=true')
-
-
-def json_converter(o):
-    if isinstance(o, datetime.date):
-        return o.strftime('%Y-%m-%d')
-    if isinstance(o, set):
-        return list(o)
-
+# Cache of every search run so far, and the documents each one found
+RESULTS_PATH = os.path.join(SCRIPT_DIR, OUTPUT_DIRECTORY, 'deed-results.sqlite3')
+LEGACY_RESULTS_PATH = os.path.join(SCRIPT_DIR, OUTPUT_DIRECTORY, 'deed-results.json')
+# Every document downloaded in full so far
+LEDGER_PATH = os.path.join(SCRIPT_DIR, OUTPUT_DIRECTORY, 'downloads.sqlite3')
 
-def strpdate(date_string, date_format=DATE_FORMAT):
-    return datetime.datetime.strptime(date_string, date_format).date()
+# Searches for the same name wait their turn, so overlapping date ranges are only fetched once
+SUBJECT_LOCKS = collections.defaultdict(asyncio.Lock)
 
 
-prior_results = prior_results["searches"]
-deferred_searches = []
-if START_OVER:
-    prior_results = []
-prior_searches = []
-for search, results in prior_results:
-    if results == 'DEFERRED':
-        deferred_searches.append((search, results))
-        continue
-    search = search.copy()
-    start_date = search.get('start_date')
-    end_date = search.get('end_date')
-    if start_date:
-        search['start_date'] = strpdate(start_date, date_format='%Y-%m-%d')
-    if end_date:
-        search['end_date'] = strpdate(end_date, date_format='%Y-%m-%d')
-    prior_searches.append(search)
+def open_store(path=RESULTS_PATH, legacy_path=LEGACY_RESULTS_PATH):
+    new_store = not os.path.exists(path)
+    store = ResultStore(path)
+    if new_store and os.path.exists(legacy_path):
+        store.import_json(legacy_path)
+    return store
 
 
 def search_params_for_value(value, field=''):
@@ -77,14 +54,15 @@ def search_params_for_value(value, field=''):
     }
 
 
-def search(
+async def search(
+    crawler,
+    store,
     start_date,
     end_date,
     grantor=None,
     grantee=None,
     both=None,
     legal=None,
-    prior_results=prior_results,
 ):
     params = {
         'start_date': start_date.strftime('%Y-%m-%d'),
@@ -121,85 +99,128 @@ def search(
         # No dates were added
         raise ValueError("Must supply additional parameters")
 
-    for p, results in prior_results:
-        if p == params:
-            if results == 'TODO':
-                # These were determined previously and need to be run this time, so pretend it didn't exist
-                pass
-            else:
-                return False, raw_params, results
-
-    return True, raw_params, get_results(raw_params)
-
-
-def get_results(params):
-    # Search for records
-    response = session.post(SEARCH_URL, data=params, allow_redirects=False)
-    results_url = urljoin(SEARCH_URL, response.headers['Location'])
-    results = []
-
-    while True:
-        content = session.get(results_url).text
-        tree = html.fromstring(content.replace('><', '>\n<'))
-        for result in tree.xpath("//tr[@class]"):
-            doc_type, doc_number = result.xpath(".//strong")[0].text_content().split()
-            parent = result.xpath(".//a[@oid][not(@class)]/@oid")[0]
-            attrs = dict(re.findall(r'\b(.+?): +(.*?) *\n+', re.sub('\xa0|&nbsp;?', '\n', result.text_content())))
-
-            local_filename = f'{parent}.pdf'
-            remote_path = f'downloads/{local_filename}?parent={parent}'
-            remote_url = urljoin(results_url, remote_path)
-
-            try:
-                yield {
-                    'doc_type': doc_type,
-                    'number': doc_number,
-                    'parent': parent,
-                    'filename': local_filename,
-                    'url': remote_url,
-                    'recorded_date': str(strpdate(attrs['Rec Date'].split()[0])),
-                    'book_page': re.findall('.: ([0-9]+)', attrs['BookPage']),
-                    'related': attrs['Related'],
-                    'related_book_page': re.findall('.: ([0-9]+)', attrs['Related BP']),
-                    'grantors': attrs['Grantor'].split(', '),
-                    'grantees': attrs['Grantee'].split(', '),
-                    'location': attrs.get('Legal'),
-                    'doc_deed_tax': attrs['Doc Deed Tax'],
-                }
-            except KeyError as e:
-                print(result.text_content())
-                print(attrs)
-                raise
-
-        next_url = tree.xpath("//a[text()='Next']/@href")
-        if next_url:
-            results_url = urljoin(results_url, next_url[0])
-        else:
-            break
+    async with SUBJECT_LOCKS[subject_key(params)]:
+        results = store.results(params)
+        if results is not None:
+            return False, raw_params, results
+
+        # Only ask for the parts of the date range that earlier searches haven't covered
+        gaps = store.gaps(params)
+        await asyncio.gather(*(
+            search_gap(crawler, store, params, raw_params, gap_start, gap_end)
+            for gap_start, gap_end in gaps
+        ))
+        results = store.covered_results(params)
+        store.save(params, results)
+        return bool(gaps), raw_params, results
+
 
+async def search_gap(crawler, store, params, raw_params, start_date, end_date):
+    params = dict(params, start_date=start_date, end_date=end_date)
+    raw_params = dict(
+        raw_params,
+        RecordingDateIDStart=start_date.strftime(DATE_FORMAT),
+        RecordingDateIDEnd=end_date.strftime(DATE_FORMAT),
+    )
+    store.save(params, await get_results(crawler, raw_params))
 
 
-def download_files(filenames):
-    queue = []
+async def get_results(crawler, params):
+    return [result async for result in crawler.search(params)]
+
+
+def download_files(crawler, filenames):
     for local_path, remote_url in filenames:
-        # Prepare the requests
-        if os.path.exists(local_path):
+        if crawler.is_downloaded(local_path):
             print('Skipping %s' % os.path.basename(local_path))
         else:
-            req = grequests.get(remote_url, session=session)
-            queue.append(req)
-
-    # Send the requests and write out the results
-    for response in grequests.imap(queue, size=4, stream=True):
-        local_filename = '%s.pdf' % FILENAME_RE.search(response.request.url).group(1)
-        local_path = os.path.join(OUTPUT_DIRECTORY, local_filename)
-        with open(local_path, 'wb') as f:
-            print('Writing %s...' % local_path, end='')
-            for chunk in response.iter_content(chunk_size=1024): 
-                if chunk: # filter out keep-alive new chunks
-                    f.write(chunk)
-            f.flush()
-            print('done')
+            # Downloads run in the background while the crawl carries on
+            crawler.queue_download(remote_url, local_path)
+
+
+def queue_missing_downloads(crawler, store):
+    # Pick up any downloads an earlier run didn't get to finish
+    for result in store.documents():
+        local_path = os.path.join(OUTPUT_DIRECTORY, result['filename'])
+        if not crawler.is_downloaded(local_path):
+            crawler.queue_download(result['url'], local_path)
+
+
+async def crawl(searches, max_depth=MAX_DEPTH, fan_out=FAN_OUT, restart=False):
+    with open_store() as store:
+        frontier = Frontier(store, today=TODAY)
+        if restart:
+            frontier.clear()
+        # Run the original searches every time, so a deeper --depth follows their chains further
+        for params in searches:
+            frontier.add(params, depth=0, requeue=True)
+        ledger = DownloadLedger(LEDGER_PATH)
+        async with Crawler(concurrency=CONCURRENCY, rate=RATE_LIMIT, ledger=ledger) as crawler:
+            queue_missing_downloads(crawler, store)
+            await crawl_frontier(crawler, store, frontier, max_depth, fan_out)
+
+
+async def crawl_frontier(crawler, store, frontier, max_depth, fan_out):
+    """
+    Runs searches from the frontier, most recent first, several at a time,
+    until there's nothing left within max_depth of the original searches.
+    """
+    fresh_count = 0
+    processed = 0
+    running = set()
+    while frontier or running:
+        while frontier and len(running) < CONCURRENCY:
+            params, depth = frontier.pop()
+            running.add(asyncio.ensure_future(visit(crawler, store, frontier, params, depth, max_depth, fan_out)))
+
+        finished, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            fresh_count += task.result()
+            processed += 1
+
+        total = processed + len(running) + len(frontier)
+        print('%2.2f%% %4d / %4d' % (processed / total * 100, processed, total))
+
+    print('Found %d new records' % fresh_count)
+
+
+async def visit(crawler, store, frontier, params, depth, max_depth, fan_out):
+    """
+    Runs a single search, saves its records and queues searches for whoever
+    sold the land in each of them. Returns the number of new records.
+    """
+    # print('Search', params)
+    fresh, raw_params, results = await search(crawler, store, **params)
+
+    # Work back along the chain of title: whoever sold the land must have bought it earlier
+    chain = 'grantee' in params and 'grantor' not in params
+    follow_grantors = chain and depth < max_depth
+
+    for result in sorted(results, key=lambda r: r['recorded_date']):
+        base_path = os.path.join(OUTPUT_DIRECTORY, result['filename'])
+        download_files(crawler, [(
+            base_path,
+            result['url'],
+        )])
+        with open(f'{base_path}.json', 'w') as json_file:
+            json.dump(result, json_file, indent=2, sort_keys=True)
+
+        if follow_grantors:
+            recorded_date = strpdate(result['recorded_date'], date_format='%Y-%m-%d')
+            grantors = [grantor for grantor in result['grantors'] if VALID_PERSON.match(grantor)]
+            for grantor in grantors[:fan_out]:
+                frontier.add({
+                    'start_date': datetime.date(year=1800, month=1, day=1),
+                    'end_date': recorded_date - datetime.timedelta(days=1),
+                    'grantee': grantor,
+                }, depth + 1)
+
+        # print("{icon} {recorded_date} {grantors} -> {grantees}".format(icon='+' if fresh else ' ', **result))
+
+    # Searches at the edge of the crawl stay queued, in case a later crawl goes deeper
+    if follow_grantors or not chain:
+        frontier.done(params)
+    return len(results) if fresh else 0
 
 
 if __name__ == '__main__':
@@ -245,104 +266,14 @@ if __name__ == '__main__':
     #     # dict(founding, grantee='helliwell paul'),  # definitely disney properties
     #     dict(founding, grantee='smith philip n'),  # definitely disney properties
     # ]
-    # if not START_OVER:
-    #     searches = prior_searches
-    update_cache = False
 
-    fresh_count = 0
-    document_ids = set()
-    processed = 0
-    depth = 1
-    new_searches = []
-    new_results = []
-    result_pdfs = []
-    while depth and searches:
-        unprocessed = len(searches)
-        total = processed + unprocessed
-        print('%2.2f%% %4d / %4d' % (processed / total * 100, processed, total))
-        params = searches.pop(0)
-        records = []
-
-        related_people = defaultdict(int)
-        if 'grantor' in params and 'grantee' in params:
-            related_field = None
-        elif 'grantor' in params:
-            related_field = 'grantees'
-        elif 'grantee' in params:
-            related_field = 'grantors'
-        else:
-            related_field = None
-
-        # print('Search', params)
-        fresh, raw_params, results = search(**params)
-
-        if True or fresh:
-            for result in sorted(results, key=lambda r: '' if isinstance(r, str) else r['recorded_date']):
-                try:
-                    base_path = os.path.join(OUTPUT_DIRECTORY, result['filename'])
-                except Exception as e:
-                    print('Result', result)
-                    raise
-                result_pdfs.append((
-                    base_path,
-                    result['url'],
-                ))
-                with open(f'{base_path}.json', 'w') as json_file:
-                    json.dump(result, json_file, indent=2, sort_keys=True)
-                if depth > 1 and related_field is not None:
-                    related_people[tuple(result[related_field])] += 1
-                    for related_person in result[related_field]:
-                        if related_field == 'grantors' and related_person and related_person[0].isalpha():
-                            recorded_date = strpdate(result['recorded_date'], date_format='%Y-%m-%d')
-                            # print(recorded_date, related_person)
-                            new_search = {
-                                'start_date': datetime.date(year=1800, month=1, day=1),
-                                'end_date': recorded_date - datetime.timedelta(days=1),
-                                'grantee': related_person,
-                            }
-                            print('Result', new_search)
-                            new_searches.append((new_search, 'TODO'))
-                            # searches.append(new_search)
-                            # searches.sort(key=lambda p: TODAY - p['end_date'])
-
-                            # For now, only process the first grantor. It significantly reduce the number of
-                            # searches to perform, but might theoretically miss some deeds along the way.
-                            break
-
-                document_ids.add(f"{result['number']}:{result['parent']}")
-                fresh_count += 1
-
-                # print("{icon} {recorded_date} {grantors} -> {grantees}".format(icon='+' if fresh else ' ', **result))
-                records.append(result)
-
-            # Temporary break after the first result, just to see if this goes back in time the way I think it should
-            # break
-
-        # if fresh:
-        #     new_results.append((params, records))
-        new_results.append((params, records))
-
-        # for people in related_people:
-        #     print('  %4d %s' % (len(people), people))
-        # print('%4d %s records' % (len(records), 'new' if fresh else 'cached'))
-        # break
-        processed += 1
-        # depth -= 1
-
-
-    if update_cache:
-        new_results.extend(new_searches)
-        new_results.extend(deferred_searches)
-        with open(RESULTS_PATH, 'w') as output_file:
-            json.dump({
-                "searches": new_results,
-                "documents": document_ids
-            }, output_file, indent=2, default=json_converter)
-
-    print('%2.2f%% %4d / %4d' % (processed / total * 100, processed, total))
-    print('Found %d new records' % fresh_count)
+    parser = argparse.ArgumentParser(description='Searches for deeds, following each chain of title back through its grantors')
+    parser.add_argument('--depth', type=int, default=MAX_DEPTH, help='how many sales back to follow each chain of title')
+    parser.add_argument('--fan-out', type=int, default=FAN_OUT, help='most grantors to follow from each deed (default: all)')
+    parser.add_argument('--restart', action='store_true', help='forget the frontier of an earlier, unfinished crawl')
+    args = parser.parse_args()
 
-    download_files(result_pdfs)
+    asyncio.run(crawl(searches, max_depth=args.depth, fan_out=args.fan_out, restart=args.restart))
 
 
 if False:# results:
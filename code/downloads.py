@@ -0,0 +1,270 @@
+import asyncio
+import datetime
+import hashlib
+import os
+import random
+import sqlite3
+import time
+
+import aiohttp
+
+CHUNK_SIZE = 1024 * 1024
+PARTIAL_SUFFIX = '.part'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    path TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    completed TEXT NOT NULL
+);
+"""
+
+
+class IncompleteDownload(Exception):
+    pass
+
+
+class DownloadLedger:
+    """
+    Remembers every file that has been downloaded completely, with its size and hash.
+
+    Paths are kept relative to the ledger itself, so the ledger stays valid
+    whichever directory the scripts are run from.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.directory = os.path.dirname(os.path.abspath(path)) if path != ':memory:' else os.getcwd()
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def key(self, local_path):
+        return os.path.relpath(os.path.abspath(local_path), self.directory)
+
+    def get(self, local_path):
+        return self.connection.execute(
+            'SELECT url, size, sha256 FROM downloads WHERE path = ?', (self.key(local_path),)
+        ).fetchone()
+
+    def record(self, local_path, url, size, sha256):
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO downloads (path, url, size, sha256, completed) VALUES (?, ?, ?, ?, ?)',
+                (self.key(local_path), url, size, sha256, datetime.datetime.now().isoformat(timespec='seconds'))
+            )
+
+    def is_complete(self, local_path, verify=False):
+        """
+        Checks that a file was downloaded completely and hasn't been cut short since.
+
+        With verify=True the file is hashed again too, rather than just checking its size.
+        """
+        entry = self.get(local_path)
+        if entry is None:
+            return False
+        url, size, sha256 = entry
+        try:
+            if os.path.getsize(local_path) != size:
+                return False
+        except OSError:
+            return False
+        return not verify or file_sha256(local_path) == sha256
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AdaptiveLimit:
+    """
+    Limits how many downloads run at once, finding the limit as it goes.
+
+    The limit grows by one after each limit's worth of quick, successful
+    downloads, and halves whenever one fails or the server is slow to respond
+    (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, slow=10.0):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.slow = slow
+        self.active = 0
+        self.successes = 0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def __aexit__(self, *exc_info):
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def succeeded(self, latency):
+        if latency > self.slow:
+            self.back_off()
+            return
+        self.successes += 1
+        if self.successes >= self.limit and self.limit < self.maximum:
+            self.limit += 1
+            self.successes = 0
+
+    def back_off(self):
+        self.limit = max(self.minimum, self.limit // 2)
+        self.successes = 0
+
+
+class DownloadManager:
+    """
+    Downloads files in the background through a Crawler's session.
+
+    Each file is written to a .part file next to it and only renamed into place
+    once its length has been checked against what the server said it would be,
+    so a file under its final name is always complete. An interrupted download
+    picks up where it left off with a Range request, and every completed file
+    goes in the ledger, so later runs skip it without touching the network.
+    A file is only ever queued once at a time, however many searches turn it
+    up, so two workers never write the same .part file.
+    """
+
+    def __init__(self, crawler, ledger=None, initial=4, maximum=16, chunk_size=CHUNK_SIZE):
+        self.crawler = crawler
+        self.ledger = ledger or DownloadLedger()
+        self.limit = AdaptiveLimit(initial=min(initial, maximum), maximum=maximum)
+        self.chunk_size = chunk_size
+        self.queue = None
+        self.workers = []
+        self.failures = []
+        # Ledger keys of every file that's queued or still downloading
+        self.pending = set()
+
+    def is_complete(self, local_path):
+        return self.ledger.is_complete(local_path)
+
+    async def download(self, url, local_path):
+        partial_path = local_path + PARTIAL_SUFFIX
+        if os.path.exists(local_path) and not os.path.exists(partial_path):
+            # Something's already there, but it isn't in the ledger, so it might
+            # have been cut short. Treat it as a partial download, which only
+            # costs a request if it turns out to be complete.
+            os.replace(local_path, partial_path)
+
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        digest = hashlib.sha256()
+
+        crawler = self.crawler
+        if crawler.bucket:
+            await crawler.bucket.acquire()
+        started = time.monotonic()
+        async with crawler.session.get(url, headers=headers) as response:
+            latency = time.monotonic() - started
+            if response.status == 416 and offset:
+                # Nothing past what we already have, which is only the whole
+                # file if it's as long as the server says the file is
+                total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                if not total.isdigit() or int(total) != offset:
+                    os.truncate(partial_path, 0)
+                    raise IncompleteDownload(f'{url}: had {offset} bytes of {total or "unknown"}, starting again')
+                expected_size = offset
+                mode = 'ab'
+            else:
+                response.raise_for_status()
+                if response.status == 206:
+                    mode = 'ab'
+                    total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                    expected_size = int(total) if total.isdigit() else None
+                else:
+                    # The server ignored the range, so start again
+                    mode, offset = 'wb', 0
+                    expected_size = response.content_length
+
+            if mode == 'ab' and offset:
+                with open(partial_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                        digest.update(chunk)
+
+            size = offset
+            with open(partial_path, mode, buffering=self.chunk_size) as f:
+                if response.status != 416:
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+
+        if expected_size is not None and size != expected_size:
+            raise IncompleteDownload(f'{url}: got {size} of {expected_size} bytes')
+
+        os.replace(partial_path, local_path)
+        self.ledger.record(local_path, url, size, digest.hexdigest())
+        self.limit.succeeded(latency)
+        print(f'Wrote {local_path}')
+
+    def queue_download(self, url, local_path):
+        """
+        Schedules a download to happen in the background while crawling continues.
+        """
+        key = self.ledger.key(local_path)
+        if key in self.pending:
+            return
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            self.workers = [asyncio.ensure_future(self._worker()) for i in range(self.limit.maximum)]
+        self.pending.add(key)
+        self.queue.put_nowait((url, local_path))
+
+    async def _worker(self):
+        crawler = self.crawler
+        while True:
+            url, local_path = await self.queue.get()
+            try:
+                for attempt in range(crawler.retries + 1):
+                    try:
+                        async with self.limit:
+                            await self.download(url, local_path)
+                        break
+                    except (aiohttp.ClientError, asyncio.TimeoutError, IncompleteDownload) as exc:
+                        self.limit.back_off()
+                        if attempt == crawler.retries:
+                            self.failed(url, local_path, exc)
+                        else:
+                            await asyncio.sleep(crawler.backoff * 2 ** attempt * (1 + random.random()))
+                    except OSError as exc:
+                        # Trying again won't help a full disk or a bad path,
+                        # but the worker has to carry on with the rest
+                        self.failed(url, local_path, exc)
+                        break
+                    except Exception as exc:
+                        # Anything else is a bug, but it shouldn't take the
+                        # worker, and every download after this one, with it
+                        self.failed(url, local_path, f'{exc.__class__.__name__}: {exc}')
+                        break
+            finally:
+                self.pending.discard(self.ledger.key(local_path))
+                self.queue.task_done()
+
+    def failed(self, url, local_path, exc):
+        self.failures.append((url, local_path, str(exc)))
+        print(f'Failed to download {url}: {exc}')
+
+    async def finish(self):
+        if self.queue is not None:
+            await self.queue.join()
+        if self.failures:
+            print(f'{len(self.failures)} downloads failed')
+
+    def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.ledger.close()
@@ -0,0 +1,161 @@
+import datetime
+import os
+import re
+from html import unescape
+from urllib.parse import parse_qsl, urljoin, urlparse
+
+from lxml import etree
+
+DATE_FORMAT = '%m/%d/%Y'
+
+# Point this at a local stand-in server (see standin.py) to test without the real thing
+BASE_URL = os.environ.get('EAGLEWEB_URL', 'https://or.occompt.com/recorder/')
+LOGIN_PATH = 'web/loginPOST.jsp?guest=true'
+SEARCH_PATH = 'eagleweb/docSearchPOST.jsp'
+FILENAME_RE = re.compile(r'parent=(.+)$')
+
+# A cheap way to find the next page before the whole page has been parsed
+NEXT_RE = re.compile(r"""<a\s[^>]*?href=["']([^"']*)["'][^>]*>Next</a>""")
+ATTRIBUTE_RE = re.compile(r'\b(.+?): +(.*?) *\n+')
+SEPARATOR_RE = re.compile('\xa0|&nbsp;?')
+NUMBER_RE = re.compile('.: ([0-9]+)')
+
+DOCUMENT_NUMBER = etree.XPath('string(.//strong)')
+PARENT = etree.XPath('.//a[@oid][not(@class)]/@oid')
+LINK = etree.XPath('self::a[@oid][not(@class)]/@href')
+
+# Elements without an end tag, so there's no gap between their start and end
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+CHUNK_SIZE = 64 * 1024
+
+
+def strpdate(date_string, date_format=DATE_FORMAT):
+    return datetime.datetime.strptime(date_string, date_format).date()
+
+
+def parse_date(date_string):
+    # Much quicker than strpdate() when there are thousands of them
+    month, day, year = date_string.split('/')
+    return datetime.date(int(year), int(month), int(day))
+
+
+def find_next_url(content, results_url):
+    """
+    Finds the link to the next page of results with a regular expression, without parsing the page.
+    """
+    match = NEXT_RE.search(content)
+    if match:
+        return urljoin(results_url, unescape(match.group(1)))
+    return None
+
+
+def iterparse(content, tags):
+    """
+    Parses a page a piece at a time, yielding each of the given elements as it's completed.
+
+    Rows inside another row are held back and yielded after it, in document
+    order, so the outer row is still whole when it's looked at. Once a
+    top-level row has been dealt with, it's thrown away along with the rows
+    before it, so the tree never holds much more than the row being looked at.
+    """
+    parser = etree.HTMLPullParser(events=('end',), tag=tags)
+
+    def completed():
+        for event, element in parser.read_events():
+            if element.tag != 'tr':
+                yield element
+            elif next(element.iterancestors('tr'), None) is None:
+                yield from element.iter('tr')
+                element.clear(keep_tail=True)
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+    for start in range(0, len(content), CHUNK_SIZE):
+        parser.feed(content[start:start + CHUNK_SIZE])
+        yield from completed()
+    parser.close()
+    yield from completed()
+
+
+def row_text(element, parts=None):
+    """
+    Returns the text of an element with a line break wherever two tags meet
+    with nothing between them, so the text of neighbouring cells is kept apart.
+    """
+    top = parts is None
+    if top:
+        parts = []
+    if element.tag not in VOID_ELEMENTS:
+        parts.append(element.text or '\n')
+    for child in element:
+        if isinstance(child.tag, str):
+            row_text(child, parts)
+        parts.append(child.tail or '\n')
+    if top:
+        return ''.join(parts)
+
+
+def parse_results(content, results_url):
+    """
+    Parses a page of search results, returning its results and the URL of the next page.
+    """
+    results = []
+    next_url = None
+    downloads_url = urljoin(results_url, 'downloads/')
+    for element in iterparse(content, ('tr', 'a')):
+        if element.tag == 'a':
+            if element.text == 'Next' and len(element) == 0 and element.get('href') is not None:
+                next_url = element.get('href')
+            continue
+        if element.get('class') is None:
+            continue
+
+        doc_type, doc_number = DOCUMENT_NUMBER(element).split()
+        parent = PARENT(element)[0]
+        attrs = dict(ATTRIBUTE_RE.findall(SEPARATOR_RE.sub('\n', row_text(element))))
+
+        local_filename = f'{parent}.pdf'
+        remote_url = f'{downloads_url}{local_filename}?parent={parent}'
+
+        try:
+            results.append({
+                'doc_type': doc_type,
+                'number': doc_number,
+                'parent': parent,
+                'filename': local_filename,
+                'url': remote_url,
+                'recorded_date': str(parse_date(attrs['Rec Date'].split()[0])),
+                'book_page': NUMBER_RE.findall(attrs['BookPage']),
+                'related': attrs['Related'],
+                'related_book_page': NUMBER_RE.findall(attrs['Related BP']),
+                'grantors': attrs['Grantor'].split(', '),
+                'grantees': attrs['Grantee'].split(', '),
+                'location': attrs.get('Legal'),
+                'doc_deed_tax': attrs['Doc Deed Tax'],
+            })
+        except KeyError as e:
+            print(row_text(element))
+            print(attrs)
+            raise
+
+    if next_url:
+        return results, urljoin(results_url, next_url)
+    return results, None
+
+
+def parse_links(content, results_url):
+    """
+    Parses a page of search results, returning (parent, download URL) pairs and the next page.
+    """
+    links = []
+    next_url = None
+    for element in iterparse(content, 'a'):
+        if element.text == 'Next' and len(element) == 0 and element.get('href') is not None:
+            next_url = element.get('href')
+        for pdf_path in LINK(element):
+            parent = dict(parse_qsl(urlparse(pdf_path).query))['parent']
+            links.append((parent, urljoin(results_url, f'downloads/{parent}.pdf?parent={parent}')))
+
+    if next_url:
+        return links, urljoin(results_url, next_url)
+    return links, None
@@ -0,0 +1,124 @@
+import json
+import sys
+import time
+
+from topology import DEFAULT_QUANTIZATION, topology
+
+
+class FeatureCollectionWriter:
+    """
+    Writes features out one at a time as they're produced.
+
+    Normally the output is a single FeatureCollection, identical to dumping the
+    whole collection at once, but only one feature is ever held in memory. With
+    newline_delimited=True, each feature is written on its own line instead
+    (newline-delimited GeoJSON), so downstream tools can read them as they go.
+
+    Output is flushed after every flush_every features, or once flush_interval
+    seconds have passed since the last flush, whichever comes first.
+    """
+
+    def __init__(self, file=sys.stdout, newline_delimited=False, flush_every=100, flush_interval=1.0, dumps=json.dumps):
+        self.file = file
+        self.newline_delimited = newline_delimited
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.dumps = dumps
+        self.count = 0
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        if not self.newline_delimited:
+            self.file.write('{"type": "FeatureCollection", "features": [')
+
+    def write(self, feature):
+        if self.newline_delimited:
+            self.file.write(f"{self.dumps(feature)}\n")
+        elif self.count:
+            self.file.write(f", {self.dumps(feature)}")
+        else:
+            self.file.write(self.dumps(feature))
+        self.count += 1
+        self.unflushed += 1
+
+        if self.unflushed >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def write_all(self, features):
+        for feature in features:
+            self.write(feature)
+
+    def flush(self):
+        self.file.flush()
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if not self.newline_delimited:
+            self.file.write(']}\n')
+        self.flush()
+
+
+class TopologyWriter:
+    """
+    Writes features out as a single TopoJSON topology, rather than GeoJSON.
+
+    Boundaries can only be shared once every feature is in, so unlike
+    FeatureCollectionWriter this holds on to all of them until it's closed.
+    """
+
+    def __init__(self, file=sys.stdout, name='features', quantization=DEFAULT_QUANTIZATION, dumps=json.dumps):
+        self.file = file
+        self.name = name
+        self.quantization = quantization
+        self.dumps = dumps
+        self.features = []
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        pass
+
+    def write(self, feature):
+        self.features.append(feature)
+
+    def write_all(self, features):
+        self.features.extend(features)
+
+    def close(self):
+        self.file.write(self.dumps(topology(self.features, self.name, self.quantization)))
+        self.file.write('\n')
+        self.file.flush()
+
+
+def add_arguments(parser):
+    parser.add_argument("--ndjson", action="store_true", help="write newline-delimited GeoJSON features")
+    parser.add_argument("--flush-every", type=int, default=100, metavar="N", help="flush output after every N features")
+    parser.add_argument("--flush-interval", type=float, default=1.0, metavar="SECONDS", help="flush output at least this often")
+    parser.add_argument("--topojson", action="store_true", help="write a TopoJSON topology, with shared boundaries stored once")
+    parser.add_argument("--quantization", type=int, default=DEFAULT_QUANTIZATION, metavar="N", help="grid size TopoJSON coordinates are snapped to")
+
+
+def from_arguments(args, file=sys.stdout, name='features', **kwargs):
+    if args.topojson:
+        return TopologyWriter(file, name=name, quantization=args.quantization, **kwargs)
+    return FeatureCollectionWriter(
+        file,
+        newline_delimited=args.ndjson,
+        flush_every=args.flush_every,
+        flush_interval=args.flush_interval,
+        **kwargs
+    )
@@ -1,87 +1,52 @@
 from __future__ import division
 
+import argparse
+import csv
 import datetime
+import functools
 import json
-import pyproj
+import os
 import re
 import sys
-import yaml
 from math import ceil, cos, degrees as deg, pi, radians, sin, tan
-# from pyproj import Proj, transform
 
-line_re = re.compile(r'(N|S) +(\d+) +(\d+) +([\d.]+) +(E|W) +([\d.]+)')
-curve_re = re.compile(r'(L|R) +([\d.]+) +(\d+) +(\d+) +([\d.]+)(?: +([\d.]+))?')
-# proj = Proj('EPSG:2236')
-THRESHOLD = 1  # feet
+import featurewriter
+import projection
+import temporal
+import traverse
+from compiled import compile_filings, load_compiled, load_filings, load_plss
+from geometrycache import GeometryCache, geometry_key
+from manifest import file_hash
+from projection import reproject_all
+from temporal import TemporalIndex, end_dates
+from traverse import OffsetEnding, TraverseBatch, bearings, densify, end_bearing
 
-class OffsetEnding(ValueError):
-    pass
+WGS84 = os.environ.get('WGS84', False)
 
 def make_url(doc):
     return 'http://or.occompt.com/recorder/eagleweb/downloads/{0}.pdf?parent={0}'.format(doc)
 
-def make_points(origin, beginning, shape, include_origin=False, closed=False, ignore_end=True):
-    if include_origin:
-        yield origin, False  # Origin
-
-    x, y = origin
-
-    for bearing, distance, interpolated in beginning:
-        horizontal = sin(bearing) * distance
-        vertical = cos(bearing) * distance
-        x += horizontal
-        y += vertical
-
-        if include_origin:
-            yield (x, y), interpolated  # Point from origin to beginning
-
-    beginning = (x, y)
-    if not include_origin:
-        yield beginning, False  # Only if the origin wasn't already included
-
-    shape = list(shape)
-    last_i = len(shape) - 1
-
-    for i, (bearing, distance, interpolated) in enumerate(shape):
-        horizontal = sin(bearing) * distance
-        vertical = cos(bearing) * distance
-        x += horizontal
-        y += vertical
-        if i == last_i:
-            off = point_distance((x, y), beginning)
-            if off < THRESHOLD:
-                # Reached the end and it's close enough to the beginning that the
-                # difference is likely just floating point error
-                yield beginning, False
-            elif ignore_end:
-                yield (x, y), interpolated
-                if closed:
-                    yield beginning, False
-            else:
-                raise OffsetEnding("End differs from beginning by %s" % off)
-        else:
-            yield (x, y), interpolated
-
-def point_distance(a, b):
-    return (abs(a[0] - b[0]) ** 2 + abs(a[1] - b[1]) ** 2) ** .5
-
-s_crs = pyproj.Proj('+proj=tmerc +lat_0=24.33333333333333 +lon_0=-81 +k=0.999941177 +x_0=200000.0001016002 +y_0=0 +ellps=GRS80 +towgs84=0,0,0,0,0,0,0 +units=us-ft +no_defs')
-t_crs = pyproj.Proj(proj='latlong', datum='WGS84')
-def reproject(points):
-    return list(points)
-    # return list(points)
-    # return [s_crs(x, y, inverse=True) for x, y in points]
-    # return [s_crs(x, y, inverse=True) for x, y in points]
-    # x = []
-    # y = []
-    # for p in points:
-    #     x.append(p[0])
-    #     y.append(p[1])
-    # x, y = pyproj.transform(s_crs, t_crs, x, y)
-    # return [(x[i], y[i]) for i in range(len(x))]
-
-def make_polygon(point, beginning, shape, **kwargs):
-    points = reproject(make_points(point, beginning, shape, closed=True))
+def reproject(traverses):
+    # Output stays in State Plane (EPSG:2236) unless asked otherwise, since
+    # filings.sh hands it off to ogr2ogr for reprojection
+    if not WGS84:
+        return traverses
+
+    # Every vertex of every traverse goes through PROJ in a single batch
+    valid = [points for points in traverses if not isinstance(points, Exception)]
+    transformed = iter(reproject_all(
+        [coordinates for coordinates, interpolated in points]
+        for points in valid
+    ))
+    return [
+        points if isinstance(points, Exception) else [
+            (coordinates, interpolated)
+            for coordinates, (original, interpolated) in zip(next(transformed), points)
+        ]
+        for points in traverses
+    ]
+
+def make_polygon(points, **kwargs):
     for coordinates, interpolated in points:
         yield {
             'type': 'Point',
@@ -96,8 +61,7 @@ def make_polygon(point, beginning, shape, **kwargs):
     }
     # return 'POLYGON((%s))' % ','.join('%s %s' % p for p in points)
 
-def make_linestring(point, beginning, shape, width, **kwargs):
-    points = reproject(make_points(point, beginning, shape, closed=False, ignore_end=True))
+def make_linestring(points, width, **kwargs):
     for coordinates, interpolated in points:
         yield {
             'type': 'Point',
@@ -118,102 +82,119 @@ make_shapes = {
     'outline': make_polygon,
 }
 
-def make_angle(degrees, minutes=0, seconds=0):
-    return radians(degrees + (minutes + seconds / 60) / 60)
-
-def rotate(bearing, angle, right):
-    return (bearing + angle * (1 if right else -1)) % radians(360)
-
-def bearings(strings, angle_step=2, angle_steps=None, bearing=None):
-    for string in strings:
-
-        # Lines
-
-        match = line_re.match(string)
-        if match:
-            ns, degrees, minutes, seconds, ew, distance = match.groups()
-            north = ns == 'N'
-            south = not north
-
-            east = ew == 'E'
-            west = not east
-
-            degrees = int(degrees)
-            minutes = int(minutes)
-            seconds = float(seconds)
-
-            degrees += (minutes + seconds / 60) / 60
-
-            if north and east:
-                pass
-            if north and west:
-                degrees = -degrees
-            if south and west:
-                degrees = 180 + degrees
-            if south and east:
-                degrees = 180 - degrees
-
-            bearing = radians(degrees)
-
-            yield bearing, float(distance), False  # Not interpolated
-
-        # Curves
-        # TODO: Use actual trigonometry to calculate points along the curve
-
-        match = curve_re.match(string)
-        if match:
-            lr, radius, degrees, minutes, seconds, distance = match.groups()
-            right = lr == 'R'
-            angle = make_angle(int(degrees), int(minutes), float(seconds))
-            radius = float(radius) or (angle / radians(360)) / pi / 2
-            distance = float(distance or 0)
-
-            steps = angle_steps or int(ceil(angle / make_angle(angle_step)))
-            step_angle = angle / (steps or 1)
-            step_distance = 2 * (sin(step_angle / 2) * radius)
-
-            # Entering the curve requires half of the continuing angle
-            bearing = rotate(bearing, step_angle / 2, right)
-            yield bearing, step_distance, True  # Interpolated
-
-            for step in range(1, steps):
-                bearing = rotate(bearing, step_angle, right)
-                yield bearing, step_distance, step == steps - 1  # All but the last step are interpolated
-
-            # Adjust the final bearing for future calculations
-            bearing = rotate(bearing, step_angle / 2, right)
-
-plss = yaml.load(open('../maps.data/plss.yaml'))
-
-def get_subdivision()
-
-known_geometries = {}
+# Arguments passed along to make_points() for each type of shape
+shape_points = {
+    'centerline': dict(closed=False, ignore_end=True),
+    'outline': dict(closed=True),
+}
 
-def get_geometry(identifier, property):
-    if isinstance(property, str):
-        if identifier in known_geometries:
-            yield known_geometries[identifier]
-        else:
-            raise Exception('Unknown property %r' % property)
-
-    shape_type = property.pop('type', 'outline')
-    make_shape = make_shapes[shape_type]
-    origin = plss[property.pop('origin')]
-    beginning = list(bearings(property.pop('beginning')))
-    shape = property.pop('shape')
-    for geometry in make_shape(
+FILINGS_PATH = '../maps.data/filings.yaml'
+PLSS_PATH = '../maps.data/plss.yaml'
+
+GEOMETRY_CACHE_PATH = '../maps.data/geometries.sqlite3'
+
+plss = load_plss(PLSS_PATH)
+
+def open_geometry_cache(path=GEOMETRY_CACHE_PATH):
+    # Cached points are only as good as the code that calculated them
+    version = [file_hash(source) for source in (__file__, traverse.__file__)]
+    return GeometryCache(path, version=version)
+
+def describe_geometry(property, adjust=False):
+    """
+    Splits a property description into its geometry key, the arguments for
+    its shape, and the traverse to calculate if the key isn't cached yet.
+    """
+    options = dict(property)
+    shape_type = options.pop('type', 'outline')
+    origin = plss[options.pop('origin')]
+    beginning = options.pop('beginning')
+    shape = options.pop('shape')
+    # Adjusted shapes are cached separately from the shapes exactly as described
+    key_options = dict(options, adjust=True) if adjust and shape_points[shape_type].get('closed') else options
+    key = geometry_key(origin, beginning, shape, shape_type, key_options)
+    return key, (shape_type, options), (origin, beginning, shape, shape_type)
+
+def add_traverse(batch, origin, beginning, shape, shape_type):
+    # The shape carries on from the tangent at the end of the beginning,
+    # which isn't the bearing of its last chord if it ends on a curve
+    beginning = list(bearings(beginning, arcs=True))
+    return batch.add(
         origin,
-        beginning,
-        bearings(shape, bearing=beginning[-1][0]),
-        **property
-    ):
-        yield geometry
-
-    known_geometries[identifier] = geometry
-
-    # return geometry
-
-def get_features(filings):
+        densify(beginning),
+        bearings(shape, bearing=end_bearing(beginning)),
+        **shape_points[shape_type]
+    )
+
+def compute_geometries(traverses, adjust=False):
+    batch = TraverseBatch()
+    keys = []
+    computed = {}
+    for key, traverse_args in traverses.items():
+        try:
+            add_traverse(batch, *traverse_args)
+            keys.append(key)
+        except Exception as exc:
+            computed[key] = exc
+    computed.update(zip(keys, batch.compute(adjust=adjust)))
+    return computed
+
+def closure_report(filings):
+    """
+    Measures the closure of every outline, returning (filing, Closure) pairs
+    with the worst precision first.
+    """
+    batch = TraverseBatch()
+    measured = []
+    for filing in filings:
+        property = filing.get('property')
+        if 'hidden' in filing or not isinstance(property, dict):
+            continue
+        if not shape_points[property.get('type', 'outline')].get('closed'):
+            continue
+        try:
+            add_traverse(batch, *describe_geometry(property)[2])
+        except Exception as exc:
+            print('%s %s: %s' % (filing.get('doc'), exc.__class__.__name__, exc), file=sys.stderr)
+            continue
+        measured.append(filing)
+    return sorted(zip(measured, batch.closures()), key=lambda pair: pair[1].precision)
+
+def write_closure_report(path, report):
+    with open(path, 'w', newline='') as report_file:
+        writer = csv.writer(report_file)
+        writer.writerow(['doc', 'date', 'desc', 'length', 'misclosure', 'dx', 'dy', 'precision', 'angular'])
+        for filing, closure in report:
+            writer.writerow([
+                filing['doc'], filing['date'], filing.get('desc', ''),
+                '%.2f' % closure.length, '%.3f' % closure.misclosure, '%.3f' % closure.dx, '%.3f' % closure.dy,
+                '%.0f' % closure.precision, '%.4f' % closure.angular,
+            ])
+
+def resolve_reference(reference, keys, references):
+    # References can point at filings that come later, or at other references
+    seen = set()
+    while reference not in keys:
+        if reference not in references or reference in seen:
+            raise Exception('Unknown property %r' % reference)
+        seen.add(reference)
+        reference = references[reference]
+    return keys[reference]
+
+def get_geometry(points, shape_type, options):
+    if isinstance(points, Exception):
+        raise points
+    return make_shapes[shape_type](points, **options)
+
+def get_features(filings, cache, vertices=True, adjust=False):
+    # Every property description gets reduced to a geometry key up front, so
+    # references can be resolved in either direction, and only the traverses
+    # that aren't already in the cache need calculating, all in one batch
+    keys = {}
+    references = {}
+    shapes = {}
+    traverses = {}
+    queue = []
     for filing in filings:
         if 'hidden' in filing:
             continue
@@ -231,23 +212,103 @@ def get_features(filings):
             properties['source:geometry'] = 'orccompt'
             properties['source:geometry:method'] = 'plss'
             properties['source:geometry:url'] = properties['url']
-            for geometry in get_geometry(doc, property_description):
-                yield geometry, dict(properties, **geometry.pop('properties', {}))
+            if isinstance(property_description, str):
+                key = None
+                references[doc] = property_description
+            else:
+                # Some documents cover several properties, and references go to the last one
+                key, shape, traverse_args = describe_geometry(property_description, adjust)
+                keys[doc] = key
+                shapes[key] = shape
+                traverses[key] = traverse_args
+            queue.append((doc, properties, key))
         except Exception as exc:
             print('%s %s: %s' % (doc, exc.__class__.__name__, exc), file=sys.stderr)
 
+    computed = cache.get_many(traverses)
+    missing = {key: args for key, args in traverses.items() if key not in computed}
+    if missing:
+        new = compute_geometries(missing, adjust)
+        cache.set_many({key: points for key, points in new.items() if isinstance(points, (list, OffsetEnding))})
+        computed.update(new)
+
+    # Reprojection works on State Plane points, so the cache never needs to know about it
+    computed_keys = list(computed)
+    computed = dict(zip(computed_keys, reproject([computed[key] for key in computed_keys])))
 
-features = [
-    {
+    for doc, properties, key in queue:
+        try:
+            if key is None:
+                # Just the shape itself, since its vertices belong to the filing it refers to
+                key = resolve_reference(references[doc], keys, references)
+                geometries = list(get_geometry(computed[key], *shapes[key]))[-1:]
+            else:
+                geometries = get_geometry(computed[key], *shapes[key])
+                if not vertices:
+                    geometries = list(geometries)[-1:]
+            for geometry in geometries:
+                yield geometry, dict(properties, **geometry.pop('properties', {}))
+        except Exception as exc:
+            print('%s %s: %s' % (doc, exc.__class__.__name__, exc), file=sys.stderr)
+
+def make_feature(geometry, properties):
+    return {
         'type': 'Feature',
         'geometry': geometry,
         'properties': properties,
     }
-    for (geometry, properties) in
-    get_features(yaml.load_all(open('../maps.data/filings.yaml')))
-]
-
-print(json.dumps({
-    'type': 'FeatureCollection',
-    'features': features,
-}), file=sys.stdout)
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+def compile_temporal_index(source, vertices=True, adjust=False):
+    filings = compile_filings(source)
+    superseded = end_dates(filings)
+    features = []
+    intervals = []
+    cache = open_geometry_cache()
+    for geometry, properties in get_features(filings, cache, vertices=vertices, adjust=adjust):
+        intervals.append((parse_date(properties['date']), superseded.get(properties['doc']), len(features)))
+        features.append(make_feature(geometry, properties))
+    cache.close()
+    return TemporalIndex(features, intervals)
+
+def load_temporal_index(path=FILINGS_PATH, vertices=True, adjust=False):
+    # The index is only as current as the code and survey data that made it
+    sources = (__file__, traverse.__file__, temporal.__file__, projection.__file__, PLSS_PATH)
+    version = [file_hash(source) for source in sources]
+    # Each combination of options that changes the features gets its own index
+    variant = '-'.join(['temporal'] + [
+        name for name, used in (('wgs84', WGS84), ('outlines', not vertices), ('adjusted', adjust)) if used
+    ])
+    return load_compiled(
+        path, functools.partial(compile_temporal_index, vertices=vertices, adjust=adjust),
+        variant=variant, version=tuple(version),
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Converts filings.yaml into GeoJSON features')
+    featurewriter.add_arguments(parser)
+    parser.add_argument('--date', type=parse_date, help='only write the features that were current on this date (YYYY-MM-DD)')
+    parser.add_argument('--changed', type=parse_date, nargs=2, metavar=('START', 'END'), help='only write the features that started or ended after START, up to END')
+    parser.add_argument('--no-vertices', dest='vertices', action='store_false', help="don't write a Point feature for every vertex")
+    parser.add_argument('--adjust', action='store_true', help='close every outline with the compass rule, spreading its misclosure along it')
+    parser.add_argument('--closure-report', metavar='CSV', help='also write the misclosure of every outline to a CSV file, worst first')
+    args = parser.parse_args()
+
+    if args.closure_report:
+        write_closure_report(args.closure_report, closure_report(load_filings(FILINGS_PATH)))
+
+    with featurewriter.from_arguments(args, name='filings') as writer:
+        if args.date:
+            writer.write_all(load_temporal_index(vertices=args.vertices, adjust=args.adjust).at(args.date))
+        elif args.changed:
+            started, ended = load_temporal_index(vertices=args.vertices, adjust=args.adjust).changed_between(*args.changed)
+            writer.write_all(dict(feature, properties=dict(feature['properties'], change='started')) for feature in started)
+            writer.write_all(dict(feature, properties=dict(feature['properties'], change='ended')) for feature in ended)
+        else:
+            cache = open_geometry_cache()
+            for geometry, properties in get_features(load_filings(FILINGS_PATH), cache, vertices=args.vertices, adjust=args.adjust):
+                writer.write(make_feature(geometry, properties))
+            cache.close()
@@ -4,4 +4,5 @@ if [ -f ../maps.data/filings.epsg4326.geojson ]; then
 fi
 ogr2ogr -f GeoJSON -s_srs EPSG:2236 -t_srs EPSG:4326 ../maps.data/filings.epsg4326.geojson ../maps.data/filings.epsg2236.geojson
 python3 strip-crs.py ../maps.data/filings.epsg4326.geojson
+python3 tiles.py ../maps.data/tiles --filings ../maps.data/filings.epsg4326.geojson --filings-yaml ../maps.data/filings.yaml
 date
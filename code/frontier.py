@@ -0,0 +1,113 @@
+import datetime
+import heapq
+import itertools
+import json
+
+from resultstore import normalize_params, parse_params, search_key
+
+QUEUED = 'queued'
+DONE = 'done'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    key TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL CHECK (status IN ('queued', 'done'))
+);
+CREATE INDEX IF NOT EXISTS frontier_status ON frontier (status);
+"""
+
+
+class Frontier:
+    """
+    The searches a chain-of-title crawl still has to run, most recent first.
+
+    Every search is only queued once, however many deeds lead to it, at the
+    shallowest depth it's been reached from; reaching a search by a shorter
+    chain queues it again, so its own grantors get followed far enough. The
+    frontier is kept in the result store alongside the results, and each search
+    is checked off as it finishes, so an interrupted crawl picks up where it
+    left off the next time it's run.
+    """
+
+    def __init__(self, store, today=None):
+        self.store = store
+        self.today = today or datetime.date.today()
+        self.heap = []
+        self.pending = {}
+        self.counter = itertools.count()
+        self.store.connection.executescript(SCHEMA)
+
+        # Pick up whatever an earlier crawl didn't get to
+        rows = self.store.connection.execute(
+            'SELECT params, depth, priority FROM frontier WHERE status = ? ORDER BY rowid', (QUEUED,)
+        )
+        for params, depth, priority in rows:
+            self.push(parse_params(params), depth, priority)
+
+    def __len__(self):
+        self.discard_stale()
+        return len(self.heap)
+
+    def priority(self, params):
+        # Searches closest to the present go first, the way a title search works backwards
+        end_date = normalize_params(params).get('end_date')
+        if end_date is None:
+            return 0
+        return (self.today - datetime.date.fromisoformat(end_date)).days
+
+    def push(self, params, depth, priority):
+        key = search_key(params)
+        if key in self.pending and self.pending[key] <= depth:
+            return
+        self.pending[key] = depth
+        heapq.heappush(self.heap, (priority, next(self.counter), params, depth))
+
+    def discard_stale(self):
+        # A search queued again from a shorter chain leaves its first entry behind
+        while self.heap:
+            priority, count, params, depth = self.heap[0]
+            if self.pending.get(search_key(params)) == depth:
+                break
+            heapq.heappop(self.heap)
+
+    def add(self, params, depth, requeue=False):
+        """
+        Queues a search, unless it has been queued before at the same depth or
+        shallower. requeue queues it again even if it has already been run.
+        Returns whether it was added.
+        """
+        priority = self.priority(params)
+        with self.store.transaction() as connection:
+            row = connection.execute(
+                'INSERT INTO frontier (key, params, depth, priority, status) VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT (key) DO UPDATE SET depth = MIN(depth, excluded.depth), status = excluded.status'
+                ' WHERE excluded.depth < frontier.depth OR ?'
+                ' RETURNING depth',
+                (search_key(params), json.dumps(normalize_params(params), sort_keys=True), depth, priority, QUEUED,
+                 requeue)
+            ).fetchone()
+        if row is not None:
+            self.push(params, row[0], priority)
+        return row is not None
+
+    def pop(self):
+        self.discard_stale()
+        priority, count, params, depth = heapq.heappop(self.heap)
+        del self.pending[search_key(params)]
+        return params, depth
+
+    def done(self, params):
+        with self.store.transaction() as connection:
+            connection.execute('UPDATE frontier SET status = ? WHERE key = ?', (DONE, search_key(params)))
+
+    def clear(self):
+        with self.store.transaction() as connection:
+            connection.execute('DELETE FROM frontier')
+        self.heap = []
+        self.pending = {}
+
+    def counts(self):
+        return dict(self.store.connection.execute('SELECT status, count(*) FROM frontier GROUP BY status'))
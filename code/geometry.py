@@ -0,0 +1,163 @@
+"""
+Helpers for working with the GeoJSON that filings-geojson.py and parse-deeds.py write.
+"""
+import json
+
+from projection import reproject_all
+
+
+def geometry_parts(geometry):
+    """
+    Breaks a geometry down into a type ('polygon', 'line' or 'point') and its parts.
+    """
+    kind = geometry['type']
+    coordinates = geometry['coordinates']
+    if kind == 'Polygon':
+        return 'polygon', [coordinates]
+    if kind == 'MultiPolygon':
+        return 'polygon', coordinates
+    if kind == 'LineString':
+        return 'line', [coordinates]
+    if kind == 'MultiLineString':
+        return 'line', coordinates
+    if kind == 'Point':
+        return 'point', [coordinates]
+    if kind == 'MultiPoint':
+        return 'point', coordinates
+    raise ValueError(f'Unsupported geometry {kind}')
+
+
+def map_parts(kind, parts, function):
+    if kind == 'polygon':
+        return [[[function(point) for point in ring] for ring in polygon] for polygon in parts]
+    if kind == 'line':
+        return [[function(point) for point in line] for line in parts]
+    return [function(point) for point in parts]
+
+
+def all_points(kind, parts):
+    if kind == 'polygon':
+        return [point for polygon in parts for ring in polygon for point in ring]
+    if kind == 'line':
+        return [point for line in parts for point in line]
+    return parts
+
+
+def read_features(path):
+    """
+    Reads a FeatureCollection, or newline-delimited features, from a file.
+    """
+    with open(path) as input_file:
+        content = input_file.read()
+    try:
+        return json.loads(content)['features']
+    except ValueError:
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def load_features(path, points=False):
+    """
+    Loads the features in a GeoJSON file as (feature, kind, parts), with
+    coordinates in longitude and latitude. Points are left out unless asked for.
+    """
+    features = [
+        feature for feature in read_features(path)
+        if feature.get('geometry') and (points or geometry_parts(feature['geometry'])[0] != 'point')
+    ]
+    parts = [geometry_parts(feature['geometry']) for feature in features]
+
+    # Filings come out in State Plane unless WGS84 was set, so reproject
+    # them if the coordinates are clearly not longitudes and latitudes
+    if any(abs(x) > 360 for kind, feature_parts in parts for x, y in all_points(kind, feature_parts)[:1]):
+        transformed = iter(reproject_all(
+            [tuple(point) for point in all_points(kind, feature_parts)]
+            for kind, feature_parts in parts
+        ))
+        reprojected = []
+        for kind, feature_parts in parts:
+            points_iter = iter(next(transformed))
+            reprojected.append((kind, map_parts(kind, feature_parts, lambda point: next(points_iter))))
+        parts = reprojected
+
+    return [(feature, kind, feature_parts) for feature, (kind, feature_parts) in zip(features, parts)]
+
+
+def clip_line(line, bounds):
+    """
+    Clips a line to a rectangle (Liang-Barsky), returning the pieces left inside it.
+    """
+    minx, miny, maxx, maxy = bounds
+    pieces = []
+    current = []
+    for (x1, y1), (x2, y2) in zip(line, line[1:]):
+        dx, dy = x2 - x1, y2 - y1
+        t0, t1 = 0.0, 1.0
+        for p, q in ((-dx, x1 - minx), (dx, maxx - x1), (-dy, y1 - miny), (dy, maxy - y1)):
+            if p == 0:
+                if q < 0:
+                    t0, t1 = 1.0, 0.0
+                    break
+            else:
+                t = q / p
+                if p < 0:
+                    t0 = max(t0, t)
+                else:
+                    t1 = min(t1, t)
+        if t0 > t1:
+            if len(current) > 1:
+                pieces.append(current)
+            current = []
+            continue
+        start = (x1 + t0 * dx, y1 + t0 * dy)
+        end = (x1 + t1 * dx, y1 + t1 * dy)
+        if not current:
+            current = [start]
+        current.append(end)
+        if t1 < 1.0:
+            # The line leaves the tile here
+            pieces.append(current)
+            current = []
+    if len(current) > 1:
+        pieces.append(current)
+    return pieces
+
+
+def point_in_polygons(point, polygons):
+    """
+    Checks whether a point falls inside any of a list of polygons (each a list of rings).
+
+    Holes are handled by counting ring crossings across every ring of a polygon
+    (the even-odd rule).
+    """
+    x, y = point
+    for polygon in polygons:
+        inside = False
+        for ring in polygon:
+            previous_x, previous_y = ring[-1]
+            for ring_x, ring_y in ring:
+                if (ring_y > y) != (previous_y > y):
+                    crossing_x = ring_x + (y - ring_y) * (previous_x - ring_x) / (previous_y - ring_y)
+                    if x < crossing_x:
+                        inside = not inside
+                previous_x, previous_y = ring_x, ring_y
+        if inside:
+            return True
+    return False
+
+
+def intersects_bbox(kind, parts, bounds):
+    """
+    Checks whether a geometry actually touches a rectangle, not just its bounding box.
+    """
+    minx, miny, maxx, maxy = bounds
+    if kind == 'point':
+        return any(minx <= x <= maxx and miny <= y <= maxy for x, y in parts)
+    if kind == 'line':
+        return any(clip_line(line, bounds) for line in parts)
+    # Either an edge of the polygon crosses into the rectangle (or lies
+    # entirely within it), or the rectangle lies entirely within the polygon
+    for polygon in parts:
+        for ring in polygon:
+            if clip_line(list(ring) + [ring[0]], bounds):
+                return True
+    return point_in_polygons((minx, miny), parts)
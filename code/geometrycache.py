@@ -0,0 +1,87 @@
+import hashlib
+import json
+import sqlite3
+
+from traverse import OffsetEnding
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS geometries (
+    key TEXT PRIMARY KEY,
+    points TEXT,
+    error TEXT
+);
+"""
+
+
+def geometry_key(origin, beginning, shape, shape_type, options):
+    """
+    Hashes everything that goes into a traverse's points, so identical property
+    descriptions share a key no matter which filing they come from.
+
+    origin is the corner's actual coordinates, rather than its name, so moving a
+    corner in plss.yaml changes the key of every traverse that starts from it.
+    """
+    description = [list(origin), list(beginning), list(shape), shape_type, options]
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class GeometryCache:
+    """
+    Keeps the computed points of every traverse, keyed by geometry_key(), so each
+    distinct traverse is only ever calculated once.
+
+    Points are kept in State Plane, just as TraverseBatch.compute() returns them,
+    along with any OffsetEnding a traverse raised. Everything in the cache is
+    thrown out whenever version changes, since the code that calculated it has.
+    """
+
+    def __init__(self, path=':memory:', version=None):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+
+        version = json.dumps(version)
+        with self.connection:
+            row = self.connection.execute("SELECT value FROM settings WHERE name = 'version'").fetchone()
+            if row is None or row[0] != version:
+                self.connection.execute('DELETE FROM geometries')
+                self.connection.execute("INSERT OR REPLACE INTO settings (name, value) VALUES ('version', ?)", (version,))
+
+    def close(self):
+        self.connection.close()
+
+    def get_many(self, keys):
+        """
+        Returns a dictionary of the points (or OffsetEnding) cached for any of the keys.
+        """
+        found = {}
+        keys = list(set(keys))
+        # Stay under SQLite's limit on the number of parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.connection.execute(
+                'SELECT key, points, error FROM geometries WHERE key IN (%s)' % ','.join('?' * len(chunk)), chunk
+            )
+            for key, points, error in rows:
+                if error is not None:
+                    found[key] = OffsetEnding(error)
+                else:
+                    found[key] = [(tuple(coordinates), interpolated) for coordinates, interpolated in json.loads(points)]
+        return found
+
+    def set_many(self, computed):
+        """
+        Caches points (or an OffsetEnding) from a dictionary of keys.
+        """
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO geometries (key, points, error) VALUES (?, ?, ?)',
+                [
+                    (key, None, str(points)) if isinstance(points, Exception) else (key, json.dumps(points), None)
+                    for key, points in computed.items()
+                ]
+            )
@@ -0,0 +1,185 @@
+import sys
+from functools import lru_cache
+
+import numpy
+
+# Lots per row and rows per section, numbered back and forth from the NE corner
+LOT_COUNTS = (16, 8)
+
+# Which way round each lot's edges go, as (row, column) steps between mesh
+# nodes, clockwise from its NW corner
+CELL_EDGES = [
+    ((0, 0), (0, 1)),
+    ((0, 1), (1, 1)),
+    ((1, 1), (1, 0)),
+    ((1, 0), (0, 0)),
+]
+
+
+def lot_positions(lot_counts=LOT_COUNTS):
+    """
+    Returns the (column, row) of every lot, in lot number order.
+
+    Rows run from north to south, with the first row numbered from east to
+    west, the next from west to east, and so on.
+    """
+    x_count, y_count = lot_counts
+    rows, columns = numpy.divmod(numpy.arange(x_count * y_count), x_count)
+    columns = numpy.where(rows % 2 == 0, x_count - columns - 1, columns)
+    return numpy.stack([columns, rows], axis=1)
+
+
+def lot_mesh(quad, lot_counts=LOT_COUNTS):
+    """
+    Returns every lot corner in a (NW, NE, SE, SW) quadrilateral, as an array of
+    (rows + 1, columns + 1) points, by bilinear interpolation between its corners.
+    """
+    x_count, y_count = lot_counts
+    nw, ne, se, sw = numpy.array(quad, dtype=float)
+    u = numpy.linspace(0, 1, x_count + 1)[None, :, None]
+    v = numpy.linspace(0, 1, y_count + 1)[:, None, None]
+    west = nw + (sw - nw) * v
+    east = ne + (se - ne) * v
+    return west + (east - west) * u
+
+
+class LotGrid:
+    """
+    Every lot in a subdivided area, worked out all at once.
+
+    Lots are looked up by number, and a set of lots is turned into as few
+    polygons as possible, with lots that share an edge merged together.
+    """
+
+    def __init__(self, quad, lot_counts=LOT_COUNTS):
+        self.lot_counts = lot_counts
+        self.mesh = lot_mesh(quad, lot_counts)
+        self.positions = lot_positions(lot_counts)
+
+    def cell(self, number):
+        if not 1 <= number <= len(self.positions):
+            raise ValueError(f"Lot {number} is out of range")
+        column, row = self.positions[number - 1].tolist()
+        return row, column
+
+    def lot(self, number):
+        """
+        Returns the NW, NE, SE and SW points of a lot.
+        """
+        row, column = self.cell(number)
+        return [tuple(self.mesh[row + dr, column + dc].tolist()) for (dr, dc), end in CELL_EDGES]
+
+    def polygons(self, numbers):
+        """
+        Returns a list of polygons covering the lots, each a list of rings of points.
+
+        Lot numbers that don't fit in the grid are left out, rather than losing
+        the rest of the lots along with them.
+        """
+        cells = set()
+        for number in numbers:
+            try:
+                cells.add(self.cell(int(number)))
+            except ValueError as exc:
+                print(f"{exc}, skipping it", file=sys.stderr)
+        return [
+            [[tuple(self.mesh[node].tolist()) for node in ring] for ring in outline(component)]
+            for component in connected(cells)
+        ]
+
+
+def connected(cells):
+    # Lots only belong together if they share an edge, not just a corner
+    remaining = set(cells)
+    components = []
+    while remaining:
+        stack = [remaining.pop()]
+        component = set(stack)
+        while stack:
+            row, column = stack.pop()
+            for neighbour in ((row - 1, column), (row + 1, column), (row, column - 1), (row, column + 1)):
+                if neighbour in remaining:
+                    remaining.remove(neighbour)
+                    component.add(neighbour)
+                    stack.append(neighbour)
+        components.append(sorted(component))
+    return sorted(components)
+
+
+def outline(cells):
+    """
+    Traces the boundary of a group of cells, as rings of (row, column) mesh nodes.
+
+    Edges between two of the cells run both ways and cancel out, so whatever is
+    left is the boundary. The outer ring comes first, followed by any holes.
+
+    Where two cells only touch at a corner, two rings meet at that node. Rings
+    run with the cells on their right, so turning left there keeps each ring
+    around the gap it was following, and the outer ring never runs into a hole.
+    """
+    edges = set()
+    for row, column in cells:
+        for (r0, c0), (r1, c1) in CELL_EDGES:
+            edge = ((row + r0, column + c0), (row + r1, column + c1))
+            reverse = (edge[1], edge[0])
+            if reverse in edges:
+                edges.remove(reverse)
+            else:
+                edges.add(edge)
+
+    following = {}
+    for start, end in sorted(edges):
+        following.setdefault(start, []).append(end)
+
+    rings = []
+    while following:
+        # The lowest node left is always on the outer ring, so that comes first
+        start = min(following)
+        ring = [start]
+        node = start
+        direction = None
+        while True:
+            ends = following[node]
+            end = next_node(node, direction, ends)
+            if not ends:
+                del following[node]
+            if end == start:
+                break
+            ring.append(end)
+            direction = (end[0] - node[0], end[1] - node[1])
+            node = end
+        ring = simplify_ring(ring)
+        rings.append(ring + ring[:1])
+    return rings
+
+
+def next_node(node, direction, ends):
+    if direction is None or len(ends) == 1:
+        return ends.pop()
+    # Left, then straight on, then right, with rows running down the page
+    dr, dc = direction
+    for step_r, step_c in ((-dc, dr), (dr, dc), (dc, -dr)):
+        end = (node[0] + step_r, node[1] + step_c)
+        if end in ends:
+            ends.remove(end)
+            return end
+    return ends.pop()
+
+
+def simplify_ring(ring):
+    # Mesh rows and columns are straight lines, so nodes partway along one add nothing
+    kept = []
+    for i, node in enumerate(ring):
+        previous, following = ring[i - 1], ring[(i + 1) % len(ring)]
+        if (node[0] - previous[0], node[1] - previous[1]) != (following[0] - node[0], following[1] - node[1]):
+            kept.append(node)
+    return kept
+
+
+@lru_cache(maxsize=None)
+def lot_grid(quad, lot_counts=LOT_COUNTS):
+    """
+    Returns the LotGrid for a (NW, NE, SE, SW) tuple of points, building it only
+    the first time that area comes up.
+    """
+    return LotGrid(quad, lot_counts)
@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+
+
+def file_hash(path):
+    try:
+        with open(path, 'rb') as source_file:
+            return hashlib.sha256(source_file.read()).hexdigest()
+    except IOError:
+        return None
+
+
+class Manifest:
+    """
+    Records which version of each input a document's output was built from.
+
+    Each entry maps a document to the hashes of its source files and the version
+    of the rules that processed them, so a later run can tell which documents
+    are unchanged and reuse their output instead of building it again.
+    """
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        try:
+            with open(path) as manifest_file:
+                self.entries = json.load(manifest_file)
+        except (IOError, ValueError):
+            self.entries = {}
+        self.changed = False
+
+    def is_current(self, key, sources):
+        entry = self.entries.get(key)
+        return (
+            entry is not None
+            and None not in sources.values()
+            and entry['version'] == self.version
+            and entry['sources'] == sources
+        )
+
+    def outputs(self, key):
+        return self.entries[key]['outputs']
+
+    def record(self, key, sources, outputs):
+        if None in sources.values():
+            # Missing sources can't be compared later, so there's nothing to record
+            return
+        self.entries[key] = {
+            'version': self.version,
+            'sources': sources,
+            'outputs': outputs,
+        }
+        self.changed = True
+
+    def forget(self, key):
+        if self.entries.pop(key, None) is not None:
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        temporary_path = f"{self.path}.{os.getpid()}"
+        with open(temporary_path, 'w') as manifest_file:
+            json.dump(self.entries, manifest_file, indent=1, sort_keys=True)
+        os.replace(temporary_path, self.path)
+        self.changed = False
@@ -1,20 +1,23 @@
+import argparse
 import contextlib
 import glob
+import hashlib
 import inspect
 import json
+import multiprocessing
 import os
 import re
 import sys
 
 import geojson
 import numpy
-import yaml
-from pyproj import CRS, Transformer
 
-
-FLORIDA_EAST = CRS.from_epsg(2236)
-WEB_MERCATOR = CRS.from_epsg(4326)
-TRANSFORMER = Transformer.from_crs(FLORIDA_EAST, WEB_MERCATOR)
+import featurewriter
+import manifest
+from aliquot import HALVES, QUARTERS, WHOLE, AliquotCache, compose, section_rectangle_area
+from lotgrid import LOT_COUNTS, lot_grid, lot_positions
+from plssindex import load_index
+from projection import reproject, reproject_all
 
 FILENAMES = [
     "/Users/gulopine/Dropbox/maps.documents/deeds/ocr/DOCC547925.pdf.txt",
@@ -25,7 +28,9 @@ FILENAMES = [
 
 WHITESPACE_RE = re.compile(r"\s+")
 GROUP_NAME_RE = re.compile(r"\(\?P<(\w+)>")
-PLSS = yaml.safe_load(open('../maps.data/plss.yaml'))
+PLSS_FILENAME = '../maps.data/plss.yaml'
+ALIQUOT_CACHE_FILENAME = '../maps.data/aliquots.sqlite3'
+PLSS = load_index(PLSS_FILENAME)
 
 key_lists = {
     ("nw", "nw"): "NW",
@@ -49,13 +54,6 @@ key_lists = {
     ("sw", "sw"): "SW",
 }
 
-KEY_LISTS = {
-    "nw": ["NW", "N", "C", "W"],
-    "ne": ["N", "NE", "E", "C"],
-    "se": ["C", "E", "SE", "S"],
-    "sw": ["W", "C", "S", "SW"],
-}
-
 DEBUG = os.environ.get("DEBUG", False)
 def debug(*args):
     if args and callable(args[0]):
@@ -269,7 +267,7 @@ def get_half(direction, points):
 
 
 def get_edge(direction, amount, points):
-    return get_subarea(direction, get_edgepoint, amount, points, include=amount > 0)
+    return get_subarea(direction, get_edgepoint, amount, points)
 
     # nw, ne, se, sw = points
     # distance = abs(float(amount))
@@ -368,26 +366,8 @@ def get_lot_position(index, lot_counts=(16, 8)):
     return x, y
 
 
-def get_lot_area(number, *, section, lot_counts=(16, 8)):
-    nw, ne, se, sw = section
-    x_count, y_count = lot_counts
-
-    # Math below is easier if this is 0-indexed
-    number -= 1
-
-    x, y = get_lot_position(number, lot_counts=lot_counts)
-
-    n1 = get_ratio_point(y / y_count, nw, sw)
-    n2 = get_ratio_point(y / y_count, ne, se)
-    s1 = get_ratio_point((y + 1) / y_count, nw, sw)
-    s2 = get_ratio_point((y + 1) / y_count, ne, se)
-
-    nw = get_ratio_point(x / x_count, n1, n2)
-    ne = get_ratio_point((x + 1) / x_count, n1, n2)
-    se = get_ratio_point((x + 1) / x_count, s1, s2)
-    sw = get_ratio_point(x / x_count, s1, s2)
-
-    return nw, ne, se, sw
+def get_lot_area(number, *, section, lot_counts=LOT_COUNTS):
+    return lot_grid(tuple(map(tuple, section)), lot_counts).lot(number)
 
 
 lot_examples = [
@@ -415,6 +395,8 @@ for lot_number, position, right_of_way in lot_examples:
     x, y = get_lot_position(lot_index)
     assert (x, y) == position
 
+    assert tuple(lot_positions()[lot_index]) == position
+
     points = [(0, 0), (100, 0), (100, 100), (0, 100)]
     for direction in ["north", "east", "south", "west"]:
         assert get_half(direction, points) == get_ratio_edge(direction, 0.5, points)
@@ -426,6 +408,7 @@ class Area:
         self.subdivision = None
         self.divisions = []
         self.lots = []
+        self.polygons = None
         self.add_data(obj)
 
     def __add__(self, other):
@@ -480,8 +463,12 @@ class Area:
 
     def divide_Quarter(self, area, quarter):
         if not area:
-            plss_prefix = f"{self.township.number} {self.range.number} {self.section.number}"
-            return [tuple(PLSS[f"{plss_prefix} {key}"]) for key in KEY_LISTS[quarter.corner]]
+            return PLSS.quarter(
+                int(self.township.number),
+                int(self.range.number),
+                int(self.section.number),
+                quarter.corner,
+            )
         else:
             return get_corner(quarter.corner, area)
 
@@ -491,33 +478,109 @@ class Area:
     def divide_LessEdge(self, area, edge):
         return get_edge(edge.direction, -edge.amount, area)
 
+    def divide_all(self, area, divisions):
+        for division in divisions:
+            debug(repr(division))
+            area = self.divide_area(area, division)
+            if DEBUG:
+                for x, y in reproject(area):
+                    debug(f"{y}, {x}")
+                debug()
+        return area
+
+    def aliquot_area(self):
+        """
+        Works out the area left by a chain of divisions that starts with a half or quarter section.
+
+        Every half and quarter folds into a single rectangle inside the section,
+        so chains that describe the same land share a key, however they're
+        worded. Only the divisions measured in feet still need working out one
+        at a time, and only the first time that exact chain comes up.
+        """
+        divisions = list(self.divisions)
+        rectangle = WHOLE
+        while divisions and isinstance(divisions[0], (Half, Quarter)):
+            division = divisions.pop(0)
+            if isinstance(division, Half):
+                rectangle = compose(rectangle, HALVES[division.direction])
+            else:
+                rectangle = compose(rectangle, QUARTERS[division.corner])
+
+        township, range, section = int(self.township.number), int(self.range.number), int(self.section.number)
+        key = json.dumps([
+            township, range, section, rectangle,
+            [division.key() for division in divisions],
+        ])
+        area = ALIQUOTS.get(key)
+        if area is None:
+            area = section_rectangle_area(
+                lambda corner: PLSS.quarter(township, range, section, corner), rectangle
+            )
+            area = self.divide_all(area, divisions)
+            ALIQUOTS.set(key, area)
+        return area
+
+    def section_area(self):
+        return [
+            PLSS.corner(int(self.township.number), int(self.range.number), int(self.section.number), corner)
+            for corner in ("NW", "NE", "SE", "SW")
+        ]
+
+    def calculate_lots(self, area):
+        """
+        Lays the lots out over the area (or the whole section), merging any
+        that share an edge, and returns all of their points together.
+        """
+        grid = lot_grid(tuple(area or self.section_area()))
+        polygons = grid.polygons(lot.number for lot in self.lots)
+        self.polygons = [[len(ring) for ring in polygon] for polygon in polygons]
+        return [point for polygon in polygons for ring in polygon for point in ring]
+
     def calculate(self):
         area = []
 
-        if self.subdivision:
-            # TODO: Figure out a good way to deal with this later.
-            # Lot numbers and sizes look predictable so far, so maybe I can auto-generate areas for them?
-            stderr(f"Skipping {len(self.lots)} lots in {self.subdivision}")
-            # for lot in self.lots:
-            #     stderr(f"  {lot}")
+        if self.subdivision and not self.lots:
+            stderr(f"Skipping {self.subdivision} without any lots")
             return area
 
-        for division in self.divisions:
-            debug(repr(division))
-            area = self.divide_area(area, division)
-            for x, y in area:
-                x, y = TRANSFORMER.transform(x, y)
-                debug(f"{x}, {y}")
-            debug()
+        if self.divisions and isinstance(self.divisions[0], (Half, Quarter)):
+            area = self.aliquot_area()
+        else:
+            area = self.divide_all(area, self.divisions)
+
+        if self.subdivision:
+            return self.calculate_lots(area)
         return area
 
-    def as_geometry(self):
-        area = [tuple(reversed(TRANSFORMER.transform(x, y))) for x, y in self.calculate()]
-        # return geojson.Polygon(area)
-        return geojson.Polygon([area])
+    def as_geometry(self, area=None):
+        # Callers that already reprojected a batch of areas can pass the result in
+        if area is None:
+            area = reproject(self.calculate())
+        if self.polygons is None:
+            # return geojson.Polygon(area)
+            return geojson.Polygon([area])
+
+        # Lots come back as one list of points, so split it into their rings again
+        points = iter(area)
+        polygons = [[[next(points) for i in range(length)] for length in polygon] for polygon in self.polygons]
+        if len(polygons) == 1:
+            return geojson.Polygon(polygons[0])
+        return geojson.MultiPolygon(polygons)
+
+
+def collapse_whitespace(value):
+    return WHITESPACE_RE.sub(' ', value)
 
 
 class Expression:
+    # Arguments that need cleaning up before they're passed along, like
+    # collapse_whitespace(), while the rest are passed along just as they matched
+    normalizers = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.compile_plan()
+
     def __add__(self, other):
         debug('__add__', self, other)
         return Area(self) + other
@@ -536,15 +599,39 @@ class Expression:
         return rf"(?P<{cls.__name__}>{prefixed})"
 
     @classmethod
-    def from_groupdict(cls, groupdict):
-        sig = inspect.signature(cls.__init__)
-        args = list(sig.parameters.keys())[1:]
-        return cls(**{arg: WHITESPACE_RE.sub(' ', groupdict[f"{cls.__name__}_{arg}"]) for arg in args if groupdict.get(f"{cls.__name__}_{arg}")})
+    def compile_plan(cls):
+        # Work out once, when the class is created, which group feeds each
+        # argument and how to clean it up. Groups are numbered relative to the
+        # class's own outer group, which stays valid wherever the pattern is
+        # embedded in a larger one.
+        groups = re.compile(cls.pattern()).groupindex
+        args = list(inspect.signature(cls.__init__).parameters)[1:]
+        cls.plan = [
+            (arg, groups[f"{cls.__name__}_{arg}"] - 1, cls.normalizers.get(arg))
+            for arg in args
+            if f"{cls.__name__}_{arg}" in groups
+        ]
+
+    @classmethod
+    def from_match(cls, match, index=None):
+        """
+        Builds an instance from a match, given the index of the class's outer group.
+        """
+        if index is None:
+            index = match.re.groupindex[cls.__name__]
+        kwargs = {}
+        for arg, offset, normalize in cls.plan:
+            value = match.group(index + offset)
+            if value:
+                kwargs[arg] = normalize(value) if normalize else value
+        return cls(**kwargs)
 
 
 class Acres(Expression):
     r"(?:consisting\s+of\s+)(?P<amount>[0-9.]+|[a-z](?:[a-z]|\s)+)\s+ac(?:-\s+)?res(?:\s+more\s+or\s+less)?"
 
+    normalizers = {"amount": collapse_whitespace}
+
     def __init__(self, amount):
         self.amount = amount
 
@@ -618,11 +705,17 @@ class Edge(Expression):
     def __str__(self):
         return f"{self.direction} {self.amount} {self.unit}".title()
 
+    def key(self):
+        return [self.direction, self.amount, self.unit]
+
 
 class LessEdge(Edge):
     # Format strings don't work as native docstrings, but we can use an assignment to get around that
     __doc__ = rf"less{Edge.__doc__}"
 
+    def key(self):
+        return [self.direction, -self.amount, self.unit]
+
 
 class Lot(Expression):
     r"lot\s+(?P<number>[0-9]+)\s+"
@@ -658,6 +751,8 @@ class Lots(Expression):
 class Subdivision(Expression):
     r"(?:in\s+|of\s+)?(?P<name>.+?)\s+(?:subdivision|s/d)"
 
+    normalizers = {"name": collapse_whitespace}
+
     def __init__(self, name):
         self.name = name
 
@@ -665,92 +760,234 @@ class Subdivision(Expression):
         return f"{self.name} subdivision".title()
 
 
-PROPERTY_RE = re.compile("|".join([
-    Acres.pattern(),
-    Quarter.pattern(),
-    Half.pattern(),
-    Section.pattern(),
-    Township.pattern(),
-    Range.pattern(),
-    LessEdge.pattern(),
-    Edge.pattern(),
-    Lot.pattern(),
-    Lots.pattern(),
-    Subdivision.pattern(),
-]))
+# Bump this whenever a change in the parsing or geometry code would change the output
+PARSER_VERSION = 4
+
+# Order matters here, since earlier expressions take precedence over later ones
+EXPRESSIONS = [
+    Acres,
+    Quarter,
+    Half,
+    Section,
+    Township,
+    Range,
+    LessEdge,
+    Edge,
+    Lot,
+    Lots,
+    Subdivision,
+]
+
+PROPERTY_RE = re.compile("|".join(expression.pattern() for expression in EXPRESSIONS))
+
+# Each expression's outer group is the last one to close when it matches, so
+# a match's lastindex points straight at the class that should handle it
+DISPATCH = {PROPERTY_RE.groupindex[expression.__name__]: expression for expression in EXPRESSIONS}
+
+
+def normalize(text):
+    return text.lower()
+
+
+def tokenize(content):
+    """
+    Yields a (match, token) pair for each Expression found in normalized content.
+    """
+    for match in PROPERTY_RE.finditer(content):
+        yield match, DISPATCH[match.lastindex].from_match(match, match.lastindex)
+
+RULES_VERSION = hashlib.sha256(
+    f"{PARSER_VERSION}:{manifest.file_hash(PLSS_FILENAME)}:{PROPERTY_RE.pattern}".encode()
+).hexdigest()
+
+# Areas only need working out again if the rules or the survey change
+ALIQUOTS = AliquotCache(ALIQUOT_CACHE_FILENAME, version=RULES_VERSION)
+
+DOCUMENTS_DIRECTORY = "/Users/gulopine/Dropbox/maps.documents/deeds"
+GEOJSON_DIRECTORY = "/Users/gulopine/Dropbox/maps.data/deeds"
+# How many documents to get through between saves of the manifest
+MANIFEST_SAVE_INTERVAL = 100
+
+
+def process_document(json_filename):
+    metadata = json.load(open(json_filename))
+    debug(f"{metadata['parent']}:")
+    txt_filename = f"{DOCUMENTS_DIRECTORY}/ocr/{metadata['filename']}.txt"
+    extract_filename = f"{DOCUMENTS_DIRECTORY}/ocr/{metadata['filename']}.extract.txt"
+    content = normalize(open(txt_filename).read())
+
+    if 'division' in content:
+        # TODO: Figure out subdivisions later, this is too much of a mess right now
+        stderr(f"Skipping subdivision reference in {metadata['parent']}")
+
+    tokens = list(tokenize(content))
+
+    start = 0
+    end = len(content)
+    parts = []
+    try:
+        extract = open(extract_filename).read()
+    except IOError:
+        with open(extract_filename, "w") as extract_file:
+            extract = content[tokens[0][0].start():tokens[-1][0].end()]
+            extract_file.write(extract)
+
+    areas = []
+    complete = True
+    for match, token in tokens:
+        if start == 0:
+            start = match.start()
+        end = match.end()
+        parts.append(token)
+        if isinstance(token, Range):
+            # Range is presumed to be the last entry in a property description
+            debug(content[start:end])
+            for part in parts:
+                debug(f"  {part}")
+            area = sum(parts)
+            try:
+                bbox = area.calculate()
+                if bbox:
+                    stderr(f"Outputting {metadata['parent']}")
+                    areas.append((area, bbox))
+            except Exception:
+                stderr(f"Error occured while processing {metadata['parent']}")
+                complete = False
+            start = 0
+            end = len(content)
+            parts = []
+
+    # Everything this document added to the aliquot cache goes in at once
+    ALIQUOTS.flush()
+
+    # Every area in the document gets reprojected in a single batch
+    features = [
+        geojson.Feature(
+            id=metadata["parent"],
+            geometry=area.as_geometry(coordinates),
+            properties=metadata,
+        )
+        for (area, bbox), coordinates in zip(areas, reproject_all(bbox for area, bbox in areas))
+    ]
+    return metadata, features, complete
+
+
+def try_process_document(json_filename):
+    # Worker processes report their own errors, so one bad document doesn't
+    # take the rest of the run down with it
+    try:
+        return process_document(json_filename)
+    except Exception:
+        stderr(f"Error occured while processing {os.path.basename(json_filename)}")
+        return None, [], False
+
+
+def document_sources(json_filename):
+    metadata = json.load(open(json_filename))
+    return metadata, {
+        "json": manifest.file_hash(json_filename),
+        "txt": manifest.file_hash(f"{DOCUMENTS_DIRECTORY}/ocr/{metadata['filename']}.txt"),
+    }
+
+
+def load_features(metadata):
+    geojson_filename = f"{GEOJSON_DIRECTORY}/{metadata['parent']}.pdf.geojson"
+    with open(geojson_filename) as geojson_file:
+        return geojson.load(geojson_file)["features"]
+
+
+def process_documents(filenames, workers=1, documents=None):
+    """
+    Yields (metadata, features, fresh, complete) for each document, in the same
+    order as filenames, where complete is False if any part of it failed.
+
+    Documents that the manifest shows haven't changed since their last run are
+    loaded from their existing GeoJSON, rather than being processed again,
+    unless that GeoJSON has gone missing.
+    """
+    if documents is None:
+        stale = filenames
+    else:
+        stale = [filename for filename in filenames if filename not in documents]
+
+    if workers == 1:
+        results = map(try_process_document, stale)
+    else:
+        pool = multiprocessing.Pool(workers or None)
+        results = pool.imap(try_process_document, stale, chunksize=4)
+
+    try:
+        for filename in filenames:
+            if documents is not None and filename in documents:
+                metadata, has_features = documents[filename]
+                try:
+                    features = load_features(metadata) if has_features else []
+                except (IOError, ValueError):
+                    stderr(f"Reprocessing {metadata['parent']}, its GeoJSON is missing")
+                else:
+                    yield metadata, features, False, True
+                    continue
+                metadata, features, complete = try_process_document(filename)
+                yield metadata, features, True, complete
+            else:
+                metadata, features, complete = next(results)
+                yield metadata, features, True, complete
+    finally:
+        if workers != 1:
+            pool.terminate()
+
 
 if __name__ == "__main__":
-    FILENAMES = sorted(glob.glob("/Users/gulopine/Dropbox/maps.documents/deeds/DOCC*.pdf.json"))
-    print(FILENAMES)
+    parser = argparse.ArgumentParser(description="Converts property descriptions in OCRed deeds into GeoJSON")
+    parser.add_argument("--workers", type=int, default=1, metavar="N", help="number of worker processes (0 for one per CPU)")
+    parser.add_argument("--limit", type=int, metavar="N", help="only process the first N documents")
+    parser.add_argument("--rebuild", action="store_true", help="process every document, even if it hasn't changed")
+    featurewriter.add_arguments(parser)
+    args = parser.parse_args()
+
+    FILENAMES = sorted(glob.glob(f"{DOCUMENTS_DIRECTORY}/DOCC*.pdf.json"))[:args.limit]
+    # Standard output is reserved for the features themselves
+    debug(FILENAMES)
     # FILENAMES = [
-    #     "/Users/gulopine/Dropbox/maps.documents/deeds/DOCC589892.pdf.json",
+    #     f"{DOCUMENTS_DIRECTORY}/DOCC589892.pdf.json",
     # ]
-    all_features = []
-    for i, json_filename in enumerate(FILENAMES):
-        metadata = json.load(open(json_filename))
-        debug(f"{metadata['parent']}:")
-        txt_filename = f"/Users/gulopine/Dropbox/maps.documents/deeds/ocr/{metadata['filename']}.txt"
-        extract_filename = f"/Users/gulopine/Dropbox/maps.documents/deeds/ocr/{metadata['filename']}.extract.txt"
-        content = open(txt_filename).read().lower()
-
-        if 'division' in content.lower():
-            # TODO: Figure out subdivisions later, this is too much of a mess right now
-            stderr(f"Skipping subdivision reference in {metadata['parent']}")
-
-        start = 0
-        end = len(content)
-        parts = []
+
+    # Documents whose metadata, OCR text and parsing rules are all unchanged
+    # since the last run can reuse the GeoJSON that run produced
+    build_manifest = manifest.Manifest(f"{GEOJSON_DIRECTORY}/manifest.json", RULES_VERSION)
+    sources = {}
+    current = {}
+    for json_filename in FILENAMES:
         try:
-            extract = open(extract_filename).read()
-        except IOError:
-            with open(extract_filename, "w") as extract_file:
-                matches = list(PROPERTY_RE.finditer(content.lower()))
-                extract = content[matches[0].start():matches[-1].end()]
-                extract_file.write(extract)
-
-        features = []
-        for match in PROPERTY_RE.finditer(content.lower()):
-            if start == 0:
-                start = match.start()
-            end = match.end()
-            klass = ""
-            kwargs = {}
-            for key, val in match.groupdict().items():
-                if key[0].isupper() and val:
-                    klass = locals()[key]
-                    break
-            if klass:
-                # parts.append(klass(**kwargs))
-                parts.append(klass.from_groupdict(match.groupdict()))
-            if match.groupdict()['Range']:
-                # Range is presumed to be the last entry in a property description
-                debug(content[start:end])
-                for part in parts:
-                    debug(f"  {part}")
-                area = sum(parts)
-                try:
-                    bbox = area.calculate()
-                    if bbox:
-                        stderr(f"Outputting {metadata['parent']}")
-                        feature = geojson.Feature(
-                            id=metadata["parent"],
-                            geometry=area.as_geometry(),
-                            properties=metadata,
-                        )
-                        features.append(feature)
-                except Exception:
-                    stderr(f"Error occured while processing {metadata['parent']}")
-                start = 0
-                end = len(content)
-                parts = []
-        if features:
-            geojson_filename = f"/Users/gulopine/Dropbox/maps.data/deeds/{metadata['parent']}.pdf.geojson"
-            with open(geojson_filename, "w") as geojson_file:
-                geojson.dump(geojson.FeatureCollection(features), geojson_file)
-            all_features.extend(features)
-        # break
-        if i == 100:
-            break
+            metadata, sources[json_filename] = document_sources(json_filename)
+        except Exception:
+            continue
+        if not args.rebuild and build_manifest.is_current(metadata["parent"], sources[json_filename]):
+            current[json_filename] = metadata, bool(build_manifest.outputs(metadata["parent"]))
+
+    writer = featurewriter.from_arguments(args, name="deeds", dumps=geojson.dumps)
+    writer.open()
+    results = process_documents(FILENAMES, workers=args.workers, documents=current)
+    try:
+        for count, (json_filename, (metadata, features, fresh, complete)) in enumerate(zip(FILENAMES, results), 1):
+            if fresh and metadata:
+                outputs = []
+                if features:
+                    geojson_filename = f"{GEOJSON_DIRECTORY}/{metadata['parent']}.pdf.geojson"
+                    with open(geojson_filename, "w") as geojson_file:
+                        geojson.dump(geojson.FeatureCollection(features), geojson_file)
+                    outputs.append(os.path.basename(geojson_filename))
+                if not complete:
+                    # Leave it out, so the next run tries it again
+                    build_manifest.forget(metadata["parent"])
+                elif json_filename in sources:
+                    build_manifest.record(metadata["parent"], sources[json_filename], outputs)
+            writer.write_all(features)
+            if count % MANIFEST_SAVE_INTERVAL == 0:
+                build_manifest.save()
+        writer.close()
+    finally:
+        # Keep whatever got done, even if the run was cut short
+        build_manifest.save()
     debug("\n-----\n")
-    print(geojson.dumps(geojson.FeatureCollection(all_features)))
     # print(geojson.dumps(collection, indent=2, sort_keys=True))
@@ -0,0 +1,191 @@
+from collections import defaultdict, namedtuple
+
+import numpy
+
+from compiled import Corners, load_plss
+from projection import unproject
+
+
+# Each section has nine surveyed points, laid out in a 3x3 grid from its NW corner
+CORNERS = ["NW", "N", "NE", "W", "C", "E", "SW", "S", "SE"]
+CORNER_CODES = {corner: code for code, corner in enumerate(CORNERS)}
+
+# The points that bound each quarter section, in NW, NE, SE, SW order
+QUARTERS = {
+    "nw": ["NW", "N", "C", "W"],
+    "ne": ["N", "NE", "E", "C"],
+    "se": ["C", "E", "SE", "S"],
+    "sw": ["W", "C", "S", "SW"],
+}
+QUARTER_NAMES = list(QUARTERS)
+
+# Roughly the size of a quarter section, in feet
+GRID_SIZE = 2640.0
+
+Location = namedtuple("Location", ["township", "range", "section", "quarter", "quarter_quarter"])
+
+
+def describe(location):
+    return (
+        f"{location.quarter_quarter.upper()} 1/4 of the {location.quarter.upper()} 1/4 "
+        f"of Section {location.section}, Township {location.township} South, Range {location.range} East"
+    )
+
+
+class PLSSIndex(Corners):
+    """
+    PLSS corners with integer township/range/section/corner codes.
+
+    Forward lookups go straight from numbers to points, without building any
+    strings. Reverse lookups find the section, quarter and quarter-quarter that
+    contain a point, by way of a coarse grid over the quarter sections.
+    """
+
+    def __init__(self, keys, points):
+        super().__init__(keys, points)
+        codes = numpy.array([
+            [int(township), int(range), int(section), CORNER_CODES[corner]]
+            for township, range, section, corner in (key.split() for key in keys)
+        ], dtype=numpy.int16)
+        codes.shape = (len(keys), 4)
+        self.townships, self.ranges, self.sections, self.corner_codes = codes.T
+        self.rows = {tuple(row): i for i, row in enumerate(codes.tolist())}
+        self.quarter_rows = {}
+        self._grid = None
+
+    def corner(self, township, range, section, corner):
+        return tuple(self.points[self.rows[township, range, section, CORNER_CODES[corner]]].tolist())
+
+    def quarter(self, township, range, section, quarter):
+        """
+        Returns the NW, NE, SE and SW points of a quarter section.
+        """
+        key = (township, range, section, quarter)
+        if key not in self.quarter_rows:
+            self.quarter_rows[key] = [
+                self.rows[township, range, section, CORNER_CODES[corner]]
+                for corner in QUARTERS[quarter]
+            ]
+        return [tuple(point) for point in self.points[self.quarter_rows[key]].tolist()]
+
+    def build_grid(self):
+        # Every quarter section with all four of its points surveyed becomes a
+        # quadrilateral, stored as (NW, NE, SE, SW) points in one array
+        quads = []
+        labels = []
+        for section in sorted({row[:3] for row in self.rows}):
+            for quarter_code, quarter in enumerate(QUARTER_NAMES):
+                try:
+                    quads.append([self.rows[section + (CORNER_CODES[corner],)] for corner in QUARTERS[quarter]])
+                except KeyError:
+                    continue
+                labels.append(section + (quarter_code,))
+
+        quads = self.points[numpy.array(quads, dtype=int).reshape(-1, 4)]
+        labels = numpy.array(labels, dtype=numpy.int16).reshape(-1, 4)
+        origin = self.points.min(axis=0)
+
+        # Each grid cell lists every quadrilateral whose bounding box touches it
+        cells = defaultdict(list)
+        low = numpy.floor((quads.min(axis=1) - origin) / GRID_SIZE).astype(int)
+        high = numpy.floor((quads.max(axis=1) - origin) / GRID_SIZE).astype(int)
+        for i, ((x0, y0), (x1, y1)) in enumerate(zip(low.tolist(), high.tolist())):
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    cells[cx, cy].append(i)
+
+        # Candidates are padded out to the same length, so a whole batch of points
+        # can be checked against them at once
+        width = max(len(candidates) for candidates in cells.values())
+        shape = tuple(high.max(axis=0) + 1)
+        candidates = numpy.full(shape + (width,), -1, dtype=int)
+        for (cx, cy), quad_ids in cells.items():
+            candidates[cx, cy, :len(quad_ids)] = quad_ids
+
+        self._grid = quads, labels, origin, candidates
+        return self._grid
+
+    def locate_many(self, x, y):
+        """
+        Finds the quarter section containing each State Plane point.
+
+        Returns the index of each point's quarter section (or -1 if it falls
+        outside of all of them), along with its (u, v) position inside that
+        quarter, measured east and south from its NW corner.
+        """
+        quads, labels, origin, candidates = self._grid or self.build_grid()
+        x = numpy.atleast_1d(numpy.asarray(x, dtype=float))
+        y = numpy.atleast_1d(numpy.asarray(y, dtype=float))
+
+        cx = numpy.floor((x - origin[0]) / GRID_SIZE).astype(int)
+        cy = numpy.floor((y - origin[1]) / GRID_SIZE).astype(int)
+        inside = (cx >= 0) & (cy >= 0) & (cx < candidates.shape[0]) & (cy < candidates.shape[1])
+
+        found = numpy.full(len(x), -1, dtype=int)
+        found_u = numpy.full(len(x), numpy.nan)
+        found_v = numpy.full(len(x), numpy.nan)
+
+        point_ids = numpy.flatnonzero(inside)
+        for column in range(candidates.shape[2]):
+            quad_ids = candidates[cx[point_ids], cy[point_ids], column]
+            checking = (quad_ids >= 0) & (found[point_ids] < 0)
+            if not checking.any():
+                continue
+            ids = point_ids[checking]
+            u, v = invert_bilinear(quads[quad_ids[checking]], x[ids], y[ids])
+            hit = (u >= -1e-9) & (u <= 1 + 1e-9) & (v >= -1e-9) & (v <= 1 + 1e-9)
+            found[ids[hit]] = quad_ids[checking][hit]
+            found_u[ids[hit]] = u[hit]
+            found_v[ids[hit]] = v[hit]
+
+        return found, found_u, found_v
+
+    def location(self, quad_id, u, v):
+        if quad_id < 0:
+            return None
+        quads, labels, origin, candidates = self._grid or self.build_grid()
+        township, range, section, quarter_code = labels[quad_id].tolist()
+        quarter_quarter = ("n" if v < 0.5 else "s") + ("w" if u < 0.5 else "e")
+        return Location(township, range, section, QUARTER_NAMES[quarter_code], quarter_quarter)
+
+    def locate(self, x, y):
+        """
+        Returns the Location containing a single State Plane point, or None.
+        """
+        (quad_id,), (u,), (v,) = self.locate_many([x], [y])
+        return self.location(quad_id, u, v)
+
+    def locate_lonlat(self, longitude, latitude):
+        return self.locate(*unproject([(longitude, latitude)])[0])
+
+    def locate_many_lonlat(self, longitudes, latitudes):
+        return self.locate_many(*unproject(zip(longitudes, latitudes), arrays=True))
+
+
+def invert_bilinear(quads, x, y, iterations=6):
+    """
+    Finds (u, v) for each point inside its (NW, NE, SE, SW) quadrilateral.
+
+    Quarter sections are very nearly square, so a few rounds of Newton's method
+    starting from the middle converge well past the precision of the survey.
+    """
+    nw, ne, se, sw = quads[:, 0], quads[:, 1], quads[:, 2], quads[:, 3]
+    u = numpy.full(len(x), 0.5)
+    v = numpy.full(len(x), 0.5)
+    target = numpy.stack([x, y], axis=1)
+    for i in range(iterations):
+        north = nw + (ne - nw) * u[:, None]
+        south = sw + (se - sw) * u[:, None]
+        point = north + (south - north) * v[:, None]
+        du = (ne - nw) * (1 - v[:, None]) + (se - sw) * v[:, None]
+        dv = south - north
+        error = target - point
+        determinant = du[:, 0] * dv[:, 1] - du[:, 1] * dv[:, 0]
+        u = u + (error[:, 0] * dv[:, 1] - error[:, 1] * dv[:, 0]) / determinant
+        v = v + (du[:, 0] * error[:, 1] - du[:, 1] * error[:, 0]) / determinant
+    return u, v
+
+
+def load_index(path):
+    corners = load_plss(path)
+    return PLSSIndex(corners.keys_list, corners.points)
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+import numpy
+from pyproj import CRS, Transformer
+
+
+FLORIDA_EAST = CRS.from_epsg(2236)
+WGS84 = CRS.from_epsg(4326)
+
+# Always (x, y) in, (longitude, latitude) out, which is the order GeoJSON wants
+TRANSFORMER = Transformer.from_crs(FLORIDA_EAST, WGS84, always_xy=True)
+INVERSE_TRANSFORMER = Transformer.from_crs(WGS84, FLORIDA_EAST, always_xy=True)
+
+# PLSS corners (and the midpoints between them) show up in document after
+# document, so their transformed values are kept around for the whole run,
+# with the ones that haven't come up for longest making way for new ones
+CACHE_SIZE = 100000
+CACHE = OrderedDict()
+
+
+def reproject_all(point_lists, transformer=TRANSFORMER, cache=CACHE):
+    """
+    Reprojects several lists of State Plane (x, y) points at once.
+
+    Every point that hasn't been seen before is gathered into a single pair of
+    arrays and sent through PROJ in one call, rather than one call per point.
+    Returns a list of (longitude, latitude) tuples for each list of points.
+
+    cache is an OrderedDict kept in least recently used order, which never
+    grows past CACHE_SIZE.
+    """
+    point_lists = [list(points) for points in point_lists]
+
+    found = {}
+    missing = set()
+    for points in point_lists:
+        for point in map(tuple, points):
+            if point in found:
+                continue
+            if point in cache:
+                found[point] = cache[point]
+                cache.move_to_end(point)
+            else:
+                missing.add(point)
+
+    if missing:
+        missing = list(missing)
+        x, y = numpy.array(missing, dtype=float).T
+        longitudes, latitudes = transformer.transform(x, y)
+        transformed = dict(zip(missing, zip(longitudes.tolist(), latitudes.tolist())))
+        found.update(transformed)
+        cache.update(transformed)
+        while len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+
+    return [[found[point] for point in map(tuple, points)] for points in point_lists]
+
+
+def reproject(points, **kwargs):
+    return reproject_all([points], **kwargs)[0]
+
+
+def unproject(points, arrays=False, transformer=INVERSE_TRANSFORMER):
+    """
+    Converts (longitude, latitude) points back into State Plane (x, y) points.
+    """
+    longitudes, latitudes = numpy.array(list(points), dtype=float).reshape(-1, 2).T
+    x, y = transformer.transform(longitudes, latitudes)
+    if arrays:
+        return x, y
+    return list(zip(x.tolist(), y.tolist()))
@@ -0,0 +1,297 @@
+import datetime
+import json
+import re
+import sqlite3
+from contextlib import contextmanager
+
+# Statuses a search can be in
+DONE = 'done'
+TODO = 'todo'
+DEFERRED = 'deferred'
+
+SEARCH_FIELDS = ('grantor', 'grantee', 'both', 'legal')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    key TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL CHECK (status IN ('done', 'todo', 'deferred')),
+    updated TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS searches_status ON searches (status);
+
+CREATE TABLE IF NOT EXISTS documents (
+    parent TEXT PRIMARY KEY,
+    number TEXT NOT NULL,
+    recorded_date TEXT NOT NULL,
+    result TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS search_documents (
+    search TEXT NOT NULL REFERENCES searches (key) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    parent TEXT NOT NULL REFERENCES documents (parent),
+    PRIMARY KEY (search, position)
+);
+
+-- Date ranges that have been completely searched for each subject (the
+-- search parameters other than its dates), and the documents found in them
+CREATE TABLE IF NOT EXISTS coverage (
+    subject TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    PRIMARY KEY (subject, start_date)
+);
+
+CREATE TABLE IF NOT EXISTS subject_documents (
+    subject TEXT NOT NULL,
+    parent TEXT NOT NULL REFERENCES documents (parent),
+    PRIMARY KEY (subject, parent)
+);
+"""
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def normalize_date(value):
+    if isinstance(value, datetime.date):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+def normalize_params(params):
+    """
+    Puts search parameters in a canonical form, so that searches the records
+    search would treat the same way end up with the same key.
+    """
+    normalized = {}
+    for name, value in params.items():
+        if value is None:
+            continue
+        if name in SEARCH_FIELDS:
+            value = re.sub(r'\s+', ' ', value).strip().lower()
+        else:
+            value = normalize_date(value)
+        normalized[name] = value
+    return normalized
+
+
+def parse_params(params):
+    params = json.loads(params)
+    for name in ('start_date', 'end_date'):
+        if name in params:
+            params[name] = datetime.date.fromisoformat(params[name])
+    return params
+
+
+def search_key(params):
+    return json.dumps(normalize_params(params), sort_keys=True)
+
+
+def subject_key(params):
+    normalized = normalize_params(params)
+    normalized.pop('start_date', None)
+    normalized.pop('end_date', None)
+    return json.dumps(normalized, sort_keys=True)
+
+
+def date_range(params):
+    start_date, end_date = params.get('start_date'), params.get('end_date')
+    if start_date is None or end_date is None:
+        return None
+    if isinstance(start_date, str):
+        start_date = datetime.date.fromisoformat(start_date)
+    if isinstance(end_date, str):
+        end_date = datetime.date.fromisoformat(end_date)
+    return start_date, end_date
+
+
+class ResultStore:
+    """
+    Keeps every search that's been run, and the documents it found, in SQLite.
+
+    Searches are looked up by a key made from their normalized parameters, so
+    checking the cache takes the same time however many searches it holds. Each
+    search is written in its own transaction as soon as it finishes, so an
+    interrupted crawl keeps everything it had done up to that point.
+
+    It also keeps track of which date ranges have been searched for each name,
+    so a search that overlaps earlier ones only has to fetch the gaps between
+    them (see gaps() and covered_results()).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextmanager
+    def transaction(self):
+        with self.connection:
+            yield self.connection
+
+    def status(self, params):
+        row = self.connection.execute(
+            'SELECT status FROM searches WHERE key = ?', (search_key(params),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def results(self, params):
+        """
+        Returns the cached results of a finished search, or None if it hasn't been run.
+        """
+        key = search_key(params)
+        if self.status(params) != DONE:
+            return None
+        rows = self.connection.execute(
+            'SELECT documents.result FROM search_documents'
+            ' JOIN documents ON documents.parent = search_documents.parent'
+            ' WHERE search_documents.search = ? ORDER BY search_documents.position',
+            (key,)
+        )
+        return [json.loads(result) for result, in rows]
+
+    def _set_status(self, connection, params, status):
+        connection.execute(
+            'INSERT INTO searches (key, params, status, updated) VALUES (?, ?, ?, ?)'
+            ' ON CONFLICT (key) DO UPDATE SET status = excluded.status, updated = excluded.updated',
+            (search_key(params), json.dumps(normalize_params(params), sort_keys=True), status,
+             datetime.datetime.now().isoformat(timespec='seconds'))
+        )
+
+    def _add_documents(self, connection, results):
+        connection.executemany(
+            'INSERT INTO documents (parent, number, recorded_date, result) VALUES (?, ?, ?, ?)'
+            ' ON CONFLICT (parent) DO UPDATE SET'
+            ' number = excluded.number, recorded_date = excluded.recorded_date, result = excluded.result',
+            [
+                (result['parent'], result['number'], result['recorded_date'], json.dumps(result, sort_keys=True))
+                for result in results
+            ]
+        )
+
+    def _add_coverage(self, connection, params, results):
+        dates = date_range(params)
+        if dates is None:
+            return
+        subject = subject_key(params)
+        connection.executemany(
+            'INSERT OR IGNORE INTO subject_documents (subject, parent) VALUES (?, ?)',
+            [(subject, result['parent']) for result in results]
+        )
+
+        # Merge the new range with any it overlaps or touches
+        start_date, end_date = dates
+        rows = connection.execute(
+            'SELECT start_date, end_date FROM coverage WHERE subject = ? AND start_date <= ? AND end_date >= ?',
+            (subject, normalize_date(end_date + ONE_DAY), normalize_date(start_date - ONE_DAY))
+        ).fetchall()
+        for row_start, row_end in rows:
+            start_date = min(start_date, datetime.date.fromisoformat(row_start))
+            end_date = max(end_date, datetime.date.fromisoformat(row_end))
+        connection.executemany(
+            'DELETE FROM coverage WHERE subject = ? AND start_date = ?',
+            [(subject, row_start) for row_start, row_end in rows]
+        )
+        connection.execute(
+            'INSERT INTO coverage (subject, start_date, end_date) VALUES (?, ?, ?)',
+            (subject, normalize_date(start_date), normalize_date(end_date))
+        )
+
+    def gaps(self, params):
+        """
+        Returns the (start_date, end_date) ranges of a search that haven't been searched yet.
+        """
+        start_date, end_date = date_range(params)
+        rows = self.connection.execute(
+            'SELECT start_date, end_date FROM coverage'
+            ' WHERE subject = ? AND start_date <= ? AND end_date >= ? ORDER BY start_date',
+            (subject_key(params), normalize_date(end_date), normalize_date(start_date))
+        )
+        gaps = []
+        for row_start, row_end in rows:
+            row_start = datetime.date.fromisoformat(row_start)
+            if row_start > start_date:
+                gaps.append((start_date, row_start - ONE_DAY))
+            start_date = max(start_date, datetime.date.fromisoformat(row_end) + ONE_DAY)
+        if start_date <= end_date:
+            gaps.append((start_date, end_date))
+        return gaps
+
+    def covered_results(self, params):
+        """
+        Returns the cached results for a search whose whole date range has been covered.
+        """
+        start_date, end_date = date_range(params)
+        rows = self.connection.execute(
+            'SELECT documents.result FROM subject_documents'
+            ' JOIN documents ON documents.parent = subject_documents.parent'
+            ' WHERE subject_documents.subject = ? AND documents.recorded_date BETWEEN ? AND ?'
+            ' ORDER BY documents.recorded_date, documents.rowid',
+            (subject_key(params), normalize_date(start_date), normalize_date(end_date))
+        )
+        return [json.loads(result) for result, in rows]
+
+    def save(self, params, results):
+        """
+        Records a finished search and its results.
+        """
+        key = search_key(params)
+        with self.transaction() as connection:
+            self._add_documents(connection, results)
+            self._add_coverage(connection, params, results)
+            self._set_status(connection, params, DONE)
+            connection.execute('DELETE FROM search_documents WHERE search = ?', (key,))
+            connection.executemany(
+                'INSERT INTO search_documents (search, position, parent) VALUES (?, ?, ?)',
+                [(key, position, result['parent']) for position, result in enumerate(results)]
+            )
+
+    def mark(self, params, status):
+        """
+        Queues a search to be run later (TODO), or puts it aside (DEFERRED).
+
+        Searches that have already been run are left alone.
+        """
+        if self.status(params) == DONE:
+            return
+        with self.transaction() as connection:
+            self._set_status(connection, params, status)
+
+    def searches(self, status=None):
+        if status is None:
+            rows = self.connection.execute('SELECT params FROM searches ORDER BY rowid')
+        else:
+            rows = self.connection.execute('SELECT params FROM searches WHERE status = ? ORDER BY rowid', (status,))
+        return [parse_params(params) for params, in rows]
+
+    def documents(self):
+        for result, in self.connection.execute('SELECT result FROM documents ORDER BY rowid'):
+            yield json.loads(result)
+
+    def document_count(self):
+        return self.connection.execute('SELECT count(*) FROM documents').fetchone()[0]
+
+    def import_json(self, path):
+        """
+        Loads searches from the old deed-results.json cache.
+        """
+        with open(path) as input_file:
+            prior_results = json.load(input_file)
+        for params, results in prior_results['searches']:
+            if results == 'TODO':
+                self.mark(params, TODO)
+            elif results == 'DEFERRED':
+                self.mark(params, DEFERRED)
+            else:
+                self.save(params, results)
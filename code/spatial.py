@@ -0,0 +1,210 @@
+"""
+A spatial index over the filing and deed geometries, for finding which of
+them cover a spot or touch an area.
+
+Build it from the GeoJSON written by filings-geojson.py and parse-deeds.py,
+then ask it about a point or a bounding box (in longitude and latitude):
+
+    python3 spatial.py build ../maps.data/spatial.index --filings ../maps.data/filings.epsg4326.geojson
+    python3 spatial.py point ../maps.data/spatial.index -81.5812 28.4187
+    python3 spatial.py bbox ../maps.data/spatial.index -81.59 28.41 -81.57 28.43
+"""
+import argparse
+import math
+import os
+import pickle
+
+import numpy
+
+from geometry import all_points, intersects_bbox, load_features, point_in_polygons
+
+# Bump this whenever the layout of the saved index changes
+INDEX_VERSION = 1
+NODE_CAPACITY = 16
+
+# Where each layer keeps its identifier and date
+LAYER_FIELDS = {
+    'filings': ('doc', 'date'),
+    'deeds': ('parent', 'recorded_date'),
+}
+
+
+def str_order(boxes, capacity):
+    """
+    Orders boxes by Sort-Tile-Recursive packing: sorted into vertical slices by
+    their centers' x, then by y within each slice, so that each consecutive run
+    of capacity boxes is a compact group.
+    """
+    count = len(boxes)
+    if count == 0:
+        return numpy.arange(0)
+    centers_x = (boxes[:, 0] + boxes[:, 2]) / 2
+    centers_y = (boxes[:, 1] + boxes[:, 3]) / 2
+    slice_size = math.ceil(math.sqrt(math.ceil(count / capacity))) * capacity
+    order = numpy.argsort(centers_x, kind='stable')
+    for start in range(0, count, slice_size):
+        chunk = order[start:start + slice_size]
+        order[start:start + slice_size] = chunk[numpy.argsort(centers_y[chunk], kind='stable')]
+    return order
+
+
+def group_boxes(boxes, capacity):
+    starts = numpy.arange(0, len(boxes), capacity)
+    ends = numpy.minimum(starts + capacity, len(boxes))
+    grouped = numpy.column_stack([
+        numpy.minimum.reduceat(boxes[:, 0], starts),
+        numpy.minimum.reduceat(boxes[:, 1], starts),
+        numpy.maximum.reduceat(boxes[:, 2], starts),
+        numpy.maximum.reduceat(boxes[:, 3], starts),
+    ])
+    return grouped, starts, ends
+
+
+def overlaps(boxes, bounds):
+    minx, miny, maxx, maxy = bounds
+    return (boxes[:, 0] <= maxx) & (boxes[:, 2] >= minx) & (boxes[:, 1] <= maxy) & (boxes[:, 3] >= miny)
+
+
+class SpatialIndex:
+    """
+    An R-tree, bulk loaded with STR packing, over a fixed set of geometries.
+
+    Every level of the tree is a set of arrays (node boxes, and the range of
+    children below each node), so each step down the tree checks all of its
+    candidate nodes at once. Anything whose box matches is then checked
+    against its actual geometry.
+    """
+
+    def __init__(self, entries, capacity=NODE_CAPACITY):
+        """
+        entries are (layer, identifier, date, kind, parts) for each geometry.
+        """
+        entries = list(entries)
+        self.capacity = capacity
+        boxes = numpy.array([
+            [min(xs), min(ys), max(xs), max(ys)]
+            for xs, ys in (zip(*all_points(kind, parts)) for layer, identifier, date, kind, parts in entries)
+        ], dtype=float).reshape(-1, 4)
+
+        order = str_order(boxes, capacity)
+        self.entries = [entries[i] for i in order]
+        self.boxes = boxes[order]
+
+        # Build the tree upwards, from nodes holding entries to a single root
+        self.levels = []
+        level_boxes = self.boxes
+        while len(level_boxes):
+            node_boxes, starts, ends = group_boxes(level_boxes, capacity)
+            if len(node_boxes) > 1:
+                # Parents group their children best when the children are packed too
+                order = str_order(node_boxes, capacity)
+                node_boxes, starts, ends = node_boxes[order], starts[order], ends[order]
+            self.levels.append((node_boxes, starts, ends))
+            if len(node_boxes) == 1:
+                break
+            level_boxes = node_boxes
+        self.levels.reverse()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def candidates(self, bounds):
+        """
+        Returns the indexes of the entries whose boxes overlap the given bounds.
+        """
+        if not self.levels:
+            return []
+        nodes = numpy.arange(len(self.levels[0][0]))
+        for node_boxes, starts, ends in self.levels:
+            nodes = nodes[overlaps(node_boxes[nodes], bounds)]
+            if not len(nodes):
+                return nodes
+            nodes = numpy.concatenate([numpy.arange(starts[node], ends[node]) for node in nodes])
+        return nodes[overlaps(self.boxes[nodes], bounds)]
+
+    def results(self, indexes):
+        return [(layer, identifier, date) for layer, identifier, date, kind, parts in (self.entries[i] for i in indexes)]
+
+    def point(self, longitude, latitude):
+        """
+        Returns (layer, identifier, date) for every polygon containing a point.
+        """
+        point = (longitude, latitude)
+        return self.results(
+            i for i in self.candidates((longitude, latitude, longitude, latitude))
+            if self.entries[i][3] == 'polygon' and point_in_polygons(point, self.entries[i][4])
+        )
+
+    def bbox(self, min_longitude, min_latitude, max_longitude, max_latitude):
+        """
+        Returns (layer, identifier, date) for every geometry that touches a bounding box.
+        """
+        bounds = (min_longitude, min_latitude, max_longitude, max_latitude)
+        return self.results(
+            i for i in self.candidates(bounds)
+            if intersects_bbox(self.entries[i][3], self.entries[i][4], bounds)
+        )
+
+    def save(self, path):
+        # Only plain data gets pickled, so the index loads the same whether or
+        # not spatial.py was run as a script
+        state = (INDEX_VERSION, self.capacity, self.entries, self.boxes, self.levels)
+        temporary_path = f"{path}.{os.getpid()}"
+        with open(temporary_path, 'wb') as index_file:
+            pickle.dump(state, index_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as index_file:
+            version, *state = pickle.load(index_file)
+        if version != INDEX_VERSION:
+            raise ValueError(f'{path} was built by a different version of spatial.py, build it again')
+        index = cls.__new__(cls)
+        index.capacity, index.entries, index.boxes, index.levels = state
+        return index
+
+
+def index_entries(sources):
+    """
+    Loads (layer, identifier, date, kind, parts) for every geometry in (layer, path) pairs.
+    """
+    for layer, path in sources:
+        identifier_field, date_field = LAYER_FIELDS[layer]
+        for feature, kind, parts in load_features(path):
+            properties = feature.get('properties') or {}
+            yield layer, properties.get(identifier_field), properties.get(date_field), kind, parts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Finds the filings and deeds that cover a point or area')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='build an index from GeoJSON')
+    build.add_argument('index')
+    build.add_argument('--filings', action='append', default=[], metavar='GEOJSON', help='GeoJSON written by filings-geojson.py')
+    build.add_argument('--deeds', action='append', default=[], metavar='GEOJSON', help='GeoJSON written by parse-deeds.py')
+
+    point = commands.add_parser('point', help='find the polygons that contain a point')
+    point.add_argument('index')
+    point.add_argument('longitude', type=float)
+    point.add_argument('latitude', type=float)
+
+    bbox = commands.add_parser('bbox', help='find the geometries that touch a bounding box')
+    bbox.add_argument('index')
+    bbox.add_argument('bounds', type=float, nargs=4, metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'))
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        sources = [('filings', path) for path in args.filings] + [('deeds', path) for path in args.deeds]
+        index = SpatialIndex(index_entries(sources))
+        index.save(args.index)
+        print(f'Indexed {len(index)} geometries')
+    else:
+        index = SpatialIndex.load(args.index)
+        if args.command == 'point':
+            results = index.point(args.longitude, args.latitude)
+        else:
+            results = index.bbox(*args.bounds)
+        for layer, identifier, date in results:
+            print(f'{date} {layer} {identifier}')
@@ -0,0 +1,153 @@
+"""
+A local stand-in for the eagleweb records search, for testing the crawlers.
+
+It serves the login, docSearchPOST.jsp, results and downloads/ endpoints,
+making up a consistent set of records for every search. Run it, then point
+the search scripts at it with EAGLEWEB_URL=http://127.0.0.1:8080/recorder/
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import html
+import random
+
+from aiohttp import web
+
+NAMES = [
+    'BAY LAKE PROPERTIES INC', 'REEDY CREEK RANCH INC', 'TOMAHAWK PROPERTIES INC',
+    'AYEFOUR CORP', 'COMPASS EAST CORP', 'SMITH PHILIP N', 'HELLIWELL PAUL',
+    'BRONSON IRLO', 'DEMETREE JACK', 'JENKINS BILL', 'HALL BROTHERS', 'LOTT M T',
+]
+PAGE_SIZE = 20
+
+
+def make_records(params, count=None):
+    """
+    Makes up the records a search would return, the same way every time for the same search.
+    """
+    seed = hashlib.sha256(repr(sorted(params.items())).encode()).hexdigest()
+    generator = random.Random(seed)
+    start = datetime.datetime.strptime(params.get('RecordingDateIDStart', '01/01/1964'), '%m/%d/%Y').date()
+    end = datetime.datetime.strptime(params.get('RecordingDateIDEnd', '12/31/1971'), '%m/%d/%Y').date()
+    days = max((end - start).days, 0)
+    if count is None:
+        count = generator.randint(0, 3 * PAGE_SIZE)
+
+    records = []
+    for i in range(count):
+        number = generator.randint(100000, 9999999)
+        records.append({
+            'doc_type': params.get('__search_select', 'D'),
+            'number': str(number),
+            'parent': f'DOCC{number}',
+            'recorded_date': start + datetime.timedelta(days=generator.randint(0, days)),
+            'book': generator.randint(1000, 3000),
+            'page': generator.randint(1, 999),
+            'grantors': generator.sample(NAMES, generator.randint(1, 3)),
+            'grantees': generator.sample(NAMES, generator.randint(1, 2)),
+            'legal': f'SEC {generator.randint(1, 36)} TWP 24 RGE 27',
+            'tax': f'{generator.randint(0, 50000) / 100:.2f}',
+        })
+    return sorted(records, key=lambda record: record['recorded_date'])
+
+
+def render_record(record):
+    nbsp = '&nbsp;'
+    attrs = [
+        f"Rec Date: {record['recorded_date'].strftime('%m/%d/%Y')} 10:31 AM",
+        f"BookPage: B: {record['book']} P: {record['page']}",
+        'Related: ',
+        'Related BP: ',
+        f"Grantor: {', '.join(record['grantors'])}",
+        f"Grantee: {', '.join(record['grantees'])}",
+        f"Legal: {record['legal']}",
+        f"Doc Deed Tax: {record['tax']}",
+    ]
+    parent = record['parent']
+    return (
+        '<tr class="evenrow">'
+        f'<td><strong>{record["doc_type"]} {record["number"]}</strong></td>'
+        f'<td><a oid="{parent}" href="downloads/{parent}.pdf?parent={parent}">View</a></td>'
+        f'<td>{nbsp.join(html.escape(attr) for attr in attrs)}{nbsp}</td>'
+        '</tr>'
+    )
+
+
+def render_results_page(records, next_url=None):
+    rows = ''.join(render_record(record) for record in records)
+    next_link = f'<a href="{html.escape(next_url)}">Next</a>' if next_url else ''
+    return (
+        '<html><head><title>Search Results</title></head><body>'
+        f'<table class="results"><tbody>{rows}</tbody></table>'
+        f'<div class="paging">{next_link}</div>'
+        '</body></html>'
+    )
+
+
+def make_pdf(parent, size=32 * 1024):
+    generator = random.Random(parent)
+    return b'%PDF-1.4\n' + bytes(generator.getrandbits(8) for i in range(size))
+
+
+def make_app(failure_rate=0.0, delay=0.0):
+    searches = {}
+    generator = random.Random(0)
+
+    @web.middleware
+    async def flaky(request, handler):
+        if delay:
+            await asyncio.sleep(delay)
+        if failure_rate and generator.random() < failure_rate:
+            raise web.HTTPServiceUnavailable()
+        return await handler(request)
+
+    async def login(request):
+        response = web.Response(text='ok')
+        response.set_cookie('JSESSIONID', 'standin')
+        return response
+
+    async def search(request):
+        params = dict(await request.post())
+        search_id = str(len(searches) + 1)
+        searches[search_id] = make_records(params)
+        raise web.HTTPFound(f'docSearchResults.jsp?searchId={search_id}')
+
+    async def results(request):
+        records = searches[request.query['searchId']]
+        page = int(request.query.get('page', 1))
+        next_url = None
+        if page * PAGE_SIZE < len(records):
+            next_url = f"docSearchResults.jsp?searchId={request.query['searchId']}&page={page + 1}"
+        content = render_results_page(records[(page - 1) * PAGE_SIZE:page * PAGE_SIZE], next_url)
+        return web.Response(text=content, content_type='text/html')
+
+    async def download(request):
+        body = make_pdf(request.query['parent'])
+        if request.http_range.start is None:
+            return web.Response(body=body, content_type='application/pdf')
+        start = request.http_range.start
+        if start >= len(body):
+            raise web.HTTPRequestRangeNotSatisfiable(headers={'Content-Range': f'bytes */{len(body)}'})
+        return web.Response(
+            status=206,
+            body=body[start:],
+            content_type='application/pdf',
+            headers={'Content-Range': f'bytes {start}-{len(body) - 1}/{len(body)}'},
+        )
+
+    app = web.Application(middlewares=[flaky])
+    app.router.add_post('/recorder/web/loginPOST.jsp', login)
+    app.router.add_post('/recorder/eagleweb/docSearchPOST.jsp', search)
+    app.router.add_get('/recorder/eagleweb/docSearchResults.jsp', results)
+    app.router.add_get('/recorder/eagleweb/downloads/{filename}', download)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves a local stand-in for the eagleweb records search')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests that fail with a 503')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before each response')
+    args = parser.parse_args()
+    web.run_app(make_app(args.failure_rate, args.delay), host='127.0.0.1', port=args.port)
@@ -0,0 +1,136 @@
+import bisect
+import datetime
+import json
+
+# Stands in for the end of anything that hasn't ended yet
+FOREVER = datetime.date.max
+
+
+class IntervalNode:
+    __slots__ = ['center', 'by_start', 'by_end', 'left', 'right']
+
+    def __init__(self, intervals):
+        # Splitting at the median start guarantees at least one interval
+        # (the one with that start) stays in this node
+        starts = sorted(start for start, end, value in intervals)
+        self.center = center = starts[len(starts) // 2]
+
+        here, left, right = [], [], []
+        for interval in intervals:
+            start, end, value = interval
+            if end <= center:
+                left.append(interval)
+            elif start > center:
+                right.append(interval)
+            else:
+                here.append(interval)
+
+        self.by_start = sorted(here, key=lambda interval: interval[0])
+        self.by_end = sorted(here, key=lambda interval: interval[1], reverse=True)
+        self.left = IntervalNode(left) if left else None
+        self.right = IntervalNode(right) if right else None
+
+
+class IntervalTree:
+    """
+    A centered interval tree over half-open [start, end) intervals.
+
+    Finding every interval that contains a point takes O(log n + k) time for
+    k results. An end of None means the interval hasn't ended.
+    """
+
+    def __init__(self, intervals):
+        intervals = [
+            (start, FOREVER if end is None else end, value)
+            for start, end, value in intervals
+        ]
+        # Intervals that end as soon as they start never contain anything
+        intervals = [interval for interval in intervals if interval[0] < interval[1]]
+        self.root = IntervalNode(intervals) if intervals else None
+
+    def at(self, point):
+        values = []
+        node = self.root
+        while node is not None:
+            if point < node.center:
+                # Everything here ends after the center, so only the start matters
+                for start, end, value in node.by_start:
+                    if start > point:
+                        break
+                    values.append(value)
+                node = node.left
+            else:
+                # Everything here starts at or before the center, so only the end matters
+                for start, end, value in node.by_end:
+                    if end <= point:
+                        break
+                    values.append(value)
+                node = node.right if point > node.center else None
+        return values
+
+
+class TemporalIndex:
+    """
+    Finds which features were current on a given date, or changed between two dates.
+
+    Each feature is current from its start date up to (but not including) its
+    end date, if it has one.
+    """
+
+    def __init__(self, features, intervals):
+        self.features = features
+        self.tree = IntervalTree(intervals)
+        self.starts = sorted((start, value) for start, end, value in intervals)
+        self.ends = sorted((end, value) for start, end, value in intervals if end is not None)
+
+    def at(self, date):
+        return [self.features[i] for i in sorted(self.tree.at(date))]
+
+    def changed_between(self, start_date, end_date):
+        """
+        Returns the features that started, and the features that ended, after
+        start_date and up to and including end_date.
+        """
+        return (
+            [self.features[i] for i in sorted(between(self.starts, start_date, end_date))],
+            [self.features[i] for i in sorted(between(self.ends, start_date, end_date))],
+        )
+
+
+def between(events, start_date, end_date):
+    first = bisect.bisect_right(events, (start_date, float('inf')))
+    last = bisect.bisect_right(events, (end_date, float('inf')))
+    return [value for date, value in events[first:last]]
+
+
+def property_key(property):
+    return json.dumps(property, sort_keys=True, default=str)
+
+
+def end_dates(filings):
+    """
+    Works out when each filing was superseded, by a later filing for the same
+    property (either the same description, or one that refers back to it).
+
+    Returns a dictionary of documents and the dates they were superseded.
+    """
+    filings = [
+        filing for filing in filings
+        if 'hidden' not in filing and 'doc' in filing and 'property' in filing
+    ]
+    property_keys = {}
+    latest = {}
+    ends = {}
+    for filing in sorted(filings, key=lambda filing: filing['date']):
+        doc, property = filing['doc'], filing['property']
+        if isinstance(property, str):
+            key = property_keys.get(property, property)
+        else:
+            key = property_key(property)
+        property_keys[doc] = key
+
+        previous = latest.get(key)
+        if previous is not None and previous != doc:
+            ends[previous] = filing['date']
+        latest[key] = doc
+    return ends
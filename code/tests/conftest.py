@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The scripts import each other by name, from the directory they live in
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
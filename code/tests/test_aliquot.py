@@ -0,0 +1,48 @@
+import numpy
+import pytest
+
+from aliquot import HALVES, QUARTERS, WHOLE, compose, section_rectangle_area
+from plssindex import PLSSIndex
+
+# Section 1 of T24S R28E, from plss.yaml, which only has its west half surveyed
+PARTIAL_SECTION = {
+    "24 28 1 C": [506189.0536166106, 1488672.8520754655],
+    "24 28 1 N": [506187.493, 1491259.854],
+    "24 28 1 NW": [503528.6583, 1491254.7275],
+    "24 28 1 S": [506190.65572459577, 1486017.0707561683],
+    "24 28 1 SW": [503533.3928, 1486029.5727],
+    "24 28 1 W": [503510.0092, 1488659.7886],
+}
+
+
+@pytest.fixture
+def plss():
+    return PLSSIndex(list(PARTIAL_SECTION), numpy.array(list(PARTIAL_SECTION.values())))
+
+
+def section_area(plss, rectangle):
+    return section_rectangle_area(lambda corner: plss.quarter(24, 28, 1, corner), rectangle)
+
+
+def point(key):
+    return tuple(PARTIAL_SECTION[f"24 28 1 {key}"])
+
+
+def test_surveyed_quarter_of_partial_section(plss):
+    assert section_area(plss, QUARTERS["nw"]) == plss.quarter(24, 28, 1, "nw")
+    assert section_area(plss, QUARTERS["sw"]) == plss.quarter(24, 28, 1, "sw")
+
+
+def test_surveyed_half_of_partial_section(plss):
+    area = section_area(plss, compose(WHOLE, HALVES["west"]))
+    assert area == pytest.approx([point("NW"), point("N"), point("S"), point("SW")])
+
+
+def test_quarter_quarter_of_partial_section(plss):
+    area = section_area(plss, compose(QUARTERS["nw"], QUARTERS["se"]))
+    assert area[2] == pytest.approx(point("C"))
+
+
+def test_unsurveyed_quarter_of_partial_section(plss):
+    with pytest.raises(KeyError):
+        section_area(plss, QUARTERS["ne"])
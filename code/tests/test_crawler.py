@@ -0,0 +1,108 @@
+import asyncio
+
+from aiohttp import web
+
+import standin
+from crawler import Crawler
+from downloads import DownloadManager
+
+PARAMS = {
+    '__search_select': 'D',
+    'RecordingDateIDStart': '01/01/1964',
+    'RecordingDateIDEnd': '12/31/1971',
+    'GranteeIDSearchString': 'compass e',
+    'GranteeIDSearchType': 'Exact Match',
+}
+
+
+def run_against_standin(test, failure_rate=0.0, delay=0.0):
+    async def main():
+        runner = web.AppRunner(standin.make_app(failure_rate=failure_rate, delay=delay))
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        try:
+            async with Crawler(base_url=f'http://{host}:{port}/recorder/', rate=None, retries=8, backoff=0.01) as crawler:
+                return await test(crawler)
+        finally:
+            await runner.cleanup()
+    return asyncio.run(main())
+
+
+def test_paginated_search_with_flaky_responses():
+    async def search(crawler):
+        return [result async for result in crawler.search(PARAMS)]
+
+    results = run_against_standin(search, failure_rate=0.3)
+    expected = standin.make_records(PARAMS)
+    assert len(expected) > 2 * standin.PAGE_SIZE
+    assert [result['parent'] for result in results] == [record['parent'] for record in expected]
+    assert [result['recorded_date'] for result in results] == [str(record['recorded_date']) for record in expected]
+
+
+def test_stopping_early_cancels_the_next_page():
+    async def first_result(crawler):
+        results = crawler.search(PARAMS)
+        async for result in results:
+            break
+        await results.aclose()
+        # Give a cancelled request the chance to finish cancelling
+        await asyncio.sleep(0)
+        pending = [
+            task for task in asyncio.all_tasks()
+            if task.get_coro().__qualname__ == 'Crawler.get_text' and not task.done()
+        ]
+        return result, pending
+
+    # Slow enough that the next page is still loading when the caller stops
+    result, pending = run_against_standin(first_result, delay=0.2)
+    assert result['parent'] == standin.make_records(PARAMS)[0]['parent']
+    assert pending == []
+
+
+def test_each_download_is_only_queued_once(tmp_path):
+    parent = standin.make_records(PARAMS)[0]['parent']
+    local_path = str(tmp_path / f'{parent}.pdf')
+
+    async def download_twice(crawler):
+        url = crawler.url(f'eagleweb/downloads/{parent}.pdf?parent={parent}')
+        # The same document turns up in the search that's being resumed and
+        # in the run's list of unfinished downloads
+        for i in range(3):
+            crawler.queue_download(url, local_path)
+        queued = crawler.downloads.queue.qsize()
+        await crawler.finish_downloads()
+        return queued, crawler.is_downloaded(local_path)
+
+    queued, downloaded = run_against_standin(download_twice)
+    assert queued == 1
+    assert downloaded
+    with open(local_path, 'rb') as f:
+        assert f.read() == standin.make_pdf(parent)
+
+
+def test_downloads_carry_on_after_an_unexpected_error(tmp_path, monkeypatch):
+    parents = [record['parent'] for record in standin.make_records(PARAMS)[:2]]
+    download = DownloadManager.download
+
+    async def broken_download(self, url, local_path):
+        if parents[0] in url:
+            raise RuntimeError('unexpected')
+        await download(self, url, local_path)
+    monkeypatch.setattr(DownloadManager, 'download', broken_download)
+
+    async def download_both(crawler):
+        # A single worker, so the second download needs it to have survived the first
+        crawler.downloads.limit.maximum = 1
+        for parent in parents:
+            crawler.queue_download(
+                crawler.url(f'eagleweb/downloads/{parent}.pdf?parent={parent}'), str(tmp_path / f'{parent}.pdf')
+            )
+        # Without a worker left, this would wait forever
+        await asyncio.wait_for(crawler.finish_downloads(), 10)
+        return crawler.downloads.failures, crawler.is_downloaded(str(tmp_path / f'{parents[1]}.pdf'))
+
+    failures, downloaded = run_against_standin(download_both)
+    assert [local_path for url, local_path, error in failures] == [str(tmp_path / f'{parents[0]}.pdf')]
+    assert downloaded
@@ -0,0 +1,59 @@
+import os
+import re
+from urllib.parse import urljoin
+
+from lxml import html
+
+import eagleweb
+import standin
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+RESULTS_URL = 'http://127.0.0.1:8080/recorder/eagleweb/docSearchResults.jsp?searchId=7'
+
+
+def old_parse_results(content, results_url):
+    # The parser this one replaced, which built the whole tree at once
+    tree = html.fromstring(content.replace('><', '>\n<'))
+    results = []
+    for result in tree.xpath("//tr[@class]"):
+        doc_type, doc_number = result.xpath(".//strong")[0].text_content().split()
+        parent = result.xpath(".//a[@oid][not(@class)]/@oid")[0]
+        attrs = dict(re.findall(r'\b(.+?): +(.*?) *\n+', re.sub('\xa0|&nbsp;?', '\n', result.text_content())))
+        results.append({
+            'doc_type': doc_type,
+            'number': doc_number,
+            'parent': parent,
+            'filename': f'{parent}.pdf',
+            'url': urljoin(results_url, f'downloads/{parent}.pdf?parent={parent}'),
+            'recorded_date': str(eagleweb.strpdate(attrs['Rec Date'].split()[0])),
+            'book_page': re.findall('.: ([0-9]+)', attrs['BookPage']),
+            'related': attrs['Related'],
+            'related_book_page': re.findall('.: ([0-9]+)', attrs['Related BP']),
+            'grantors': attrs['Grantor'].split(', '),
+            'grantees': attrs['Grantee'].split(', '),
+            'location': attrs.get('Legal'),
+            'doc_deed_tax': attrs['Doc Deed Tax'],
+        })
+    next_url = tree.xpath("//a[text()='Next']/@href")
+    if next_url:
+        return results, urljoin(results_url, next_url[0])
+    return results, None
+
+
+def test_nested_tables_match_old_parser():
+    with open(os.path.join(FIXTURES, 'nested-results.html')) as page:
+        content = page.read()
+    results, next_url = eagleweb.parse_results(content, RESULTS_URL)
+    assert (results, next_url) == old_parse_results(content, RESULTS_URL)
+    assert [result['location'] for result in results] == [
+        'SEC 11 TWP 24 RGE 27', 'SEC 3 TWP 24 RGE 28', 'SEC 35 TWP 24 RGE 27',
+    ]
+    assert results[2]['book_page'] == ['1521', '12']
+
+
+def test_standin_pages_match_old_parser(monkeypatch):
+    # Small chunks, so rows are split across several feeds
+    monkeypatch.setattr(eagleweb, 'CHUNK_SIZE', 500)
+    records = standin.make_records({'seed': 'pages'}, count=standin.PAGE_SIZE)
+    content = standin.render_results_page(records, 'docSearchResults.jsp?searchId=7&page=2')
+    assert eagleweb.parse_results(content, RESULTS_URL) == old_parse_results(content, RESULTS_URL)
@@ -0,0 +1,71 @@
+import datetime
+
+import pytest
+
+from frontier import Frontier
+from resultstore import ResultStore
+
+TODAY = datetime.date(1980, 1, 1)
+
+
+def search(grantee, end_date='1971-12-31'):
+    return {'grantee': grantee, 'start_date': '1964-01-01', 'end_date': end_date}
+
+
+@pytest.fixture
+def store():
+    with ResultStore(':memory:') as store:
+        yield store
+
+
+def pop_all(frontier):
+    popped = []
+    while len(frontier):
+        params, depth = frontier.pop()
+        popped.append((params['grantee'], depth))
+    return popped
+
+
+def test_most_recent_searches_come_first(store):
+    frontier = Frontier(store, today=TODAY)
+    frontier.add(search('older', '1965-12-31'), 1)
+    frontier.add(search('newer', '1975-12-31'), 1)
+    assert pop_all(frontier) == [('newer', 1), ('older', 1)]
+
+
+def test_keeps_the_shallowest_depth(store):
+    frontier = Frontier(store, today=TODAY)
+    assert frontier.add(search('compass e'), 3)
+    assert not frontier.add(search('compass e'), 4)
+    assert frontier.add(search('compass e'), 1)
+    assert not frontier.add(search('compass e'), 2)
+    # The entry from depth 3 is left behind in the heap, but never comes out
+    assert pop_all(frontier) == [('compass e', 1)]
+
+
+def test_shorter_chain_queues_a_finished_search_again(store):
+    frontier = Frontier(store, today=TODAY)
+    frontier.add(search('compass e'), 3)
+    params, depth = frontier.pop()
+    frontier.done(params)
+    assert not frontier.add(search('compass e'), 3)
+    assert frontier.add(search('compass e'), 2)
+    assert pop_all(frontier) == [('compass e', 2)]
+
+
+def test_requeue_runs_a_search_again(store):
+    frontier = Frontier(store, today=TODAY)
+    frontier.add(search('compass e'), 0)
+    params, depth = frontier.pop()
+    frontier.done(params)
+    assert frontier.add(search('compass e'), 0, requeue=True)
+    assert pop_all(frontier) == [('compass e', 0)]
+
+
+def test_picks_up_where_an_earlier_crawl_left_off(store):
+    frontier = Frontier(store, today=TODAY)
+    frontier.add(search('finished'), 0)
+    frontier.add(search('unfinished'), 2)
+    frontier.done(search('finished'))
+    frontier.add(search('unfinished'), 1)
+    assert pop_all(Frontier(store, today=TODAY)) == [('unfinished', 1)]
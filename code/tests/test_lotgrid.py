@@ -0,0 +1,44 @@
+from lotgrid import LotGrid, lot_positions, outline
+
+# A square section of 16 by 8 lots, one foot to a lot
+QUAD = ((0.0, 8.0), (16.0, 8.0), (16.0, 0.0), (0.0, 0.0))
+
+
+def test_lots_are_numbered_back_and_forth_from_the_ne_corner():
+    positions = lot_positions((4, 2)).tolist()
+    assert positions == [[3, 0], [2, 0], [1, 0], [0, 0], [0, 1], [1, 1], [2, 1], [3, 1]]
+
+
+def test_neighbouring_lots_merge():
+    grid = LotGrid(QUAD)
+    # Lots 1 and 2 share an edge, and 32 is the one below lot 1
+    polygons = grid.polygons([1, 2, 32])
+    assert len(polygons) == 1
+    assert len(polygons[0]) == 1
+    assert sorted(set(polygons[0][0])) == sorted([(14.0, 8.0), (16.0, 8.0), (16.0, 6.0), (15.0, 6.0), (15.0, 7.0), (14.0, 7.0)])
+
+
+def test_lots_touching_at_a_corner_stay_apart():
+    grid = LotGrid(QUAD)
+    # Lot 1 is the NE corner, and 31 is diagonally below and west of it
+    assert len(grid.polygons([1, 31])) == 2
+
+
+def test_pinched_outline_keeps_its_hole_separate():
+    # A ring of cells round a hole, missing the corner that touches the hole,
+    # so the outer boundary and the hole meet at a single node
+    cells = [(0, 1), (0, 2), (1, 0), (1, 2), (2, 0), (2, 1), (2, 2)]
+    rings = outline(cells)
+    assert len(rings) == 2
+    outer, hole = rings
+    assert sorted(set(hole)) == [(1, 1), (1, 2), (2, 1), (2, 2)]
+    assert len(hole) == 5
+    # Each ring only passes through the pinch once
+    assert len(outer) == len(set(outer)) + 1
+    assert set(outer) == {(0, 1), (0, 3), (3, 3), (3, 0), (1, 0), (1, 1)}
+
+
+def test_out_of_range_lots_are_skipped(capsys):
+    grid = LotGrid(QUAD)
+    assert grid.polygons([1, 500]) == grid.polygons([1])
+    assert 'Lot 500 is out of range' in capsys.readouterr().err
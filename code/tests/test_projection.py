@@ -0,0 +1,23 @@
+from collections import OrderedDict
+
+import projection
+
+POINTS = [(503528.6583 + i * 100, 1491254.7275) for i in range(4)]
+
+
+def test_cache_keeps_the_points_used_most_recently(monkeypatch):
+    monkeypatch.setattr(projection, 'CACHE_SIZE', 2)
+    cache = OrderedDict()
+    projection.reproject_all([[POINTS[0]], [POINTS[1]]], cache=cache)
+    # Using the first point again keeps it around when the third one comes along
+    projection.reproject_all([[POINTS[0]]], cache=cache)
+    projection.reproject_all([[POINTS[2]]], cache=cache)
+    assert list(cache) == [POINTS[0], POINTS[2]]
+
+
+def test_cache_never_grows_past_its_size(monkeypatch):
+    monkeypatch.setattr(projection, 'CACHE_SIZE', 2)
+    cache = OrderedDict()
+    projected = projection.reproject_all([POINTS, POINTS[::-1]], cache=cache)
+    assert len(cache) == 2
+    assert projected[0] == projected[1][::-1] == projection.reproject(POINTS, cache=OrderedDict())
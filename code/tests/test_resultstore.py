@@ -0,0 +1,80 @@
+import datetime
+
+import pytest
+
+from resultstore import DONE, TODO, ResultStore
+
+
+def make_result(parent, recorded_date):
+    return {'parent': parent, 'number': parent.replace('DOCC', ''), 'recorded_date': recorded_date}
+
+
+def search(grantee, start_date, end_date):
+    return {'grantee': grantee, 'start_date': start_date, 'end_date': end_date}
+
+
+@pytest.fixture
+def store():
+    with ResultStore(':memory:') as store:
+        yield store
+
+
+def test_results_come_back_in_order(store):
+    params = search('compass e', datetime.date(1964, 1, 1), datetime.date(1971, 12, 31))
+    results = [make_result('DOCC2', '1968-03-01'), make_result('DOCC1', '1965-07-15')]
+    assert store.results(params) is None
+    store.save(params, results)
+    assert store.status(params) == DONE
+    assert store.results(params) == results
+
+
+def test_equivalent_params_share_a_search(store):
+    params = search('Compass  E ', datetime.date(1964, 1, 1), '1971-12-31')
+    store.save(params, [make_result('DOCC1', '1965-07-15')])
+    assert store.results(search('compass e', '1964-01-01', datetime.date(1971, 12, 31))) == [
+        make_result('DOCC1', '1965-07-15'),
+    ]
+
+
+def test_marking_leaves_finished_searches_alone(store):
+    done = search('compass e', '1964-01-01', '1971-12-31')
+    store.save(done, [])
+    store.mark(done, TODO)
+    store.mark(search('bay lk prop', '1964-01-01', '1971-12-31'), TODO)
+    assert store.status(done) == DONE
+    assert [params['grantee'] for params in store.searches(TODO)] == ['bay lk prop']
+
+
+def dates(start_date, end_date):
+    return datetime.date.fromisoformat(start_date), datetime.date.fromisoformat(end_date)
+
+
+def test_gaps_around_earlier_searches(store):
+    store.save(search('compass e', '1966-01-01', '1967-12-31'), [])
+    store.save(search('compass e', '1970-01-01', '1970-06-30'), [])
+    # Another name's searches don't cover anything for this one
+    store.save(search('bay lk prop', '1964-01-01', '1971-12-31'), [])
+    assert store.gaps(search('compass e', '1964-01-01', '1971-12-31')) == [
+        dates('1964-01-01', '1965-12-31'),
+        dates('1968-01-01', '1969-12-31'),
+        dates('1970-07-01', '1971-12-31'),
+    ]
+    assert store.gaps(search('compass e', '1966-06-01', '1967-06-01')) == []
+
+
+def test_touching_ranges_merge(store):
+    store.save(search('compass e', '1964-01-01', '1965-12-31'), [])
+    store.save(search('compass e', '1967-01-01', '1967-12-31'), [])
+    store.save(search('compass e', '1966-01-01', '1966-12-31'), [])
+    assert store.gaps(search('compass e', '1964-01-01', '1967-12-31')) == []
+    assert store.connection.execute('SELECT count(*) FROM coverage').fetchone()[0] == 1
+
+
+def test_covered_results_span_every_search(store):
+    early = make_result('DOCC1', '1965-07-15')
+    middle = make_result('DOCC2', '1967-02-01')
+    late = make_result('DOCC3', '1969-11-30')
+    store.save(search('compass e', '1964-01-01', '1967-12-31'), [middle, early])
+    store.save(search('compass e', '1968-01-01', '1971-12-31'), [late])
+    assert store.covered_results(search('compass e', '1964-01-01', '1971-12-31')) == [early, middle, late]
+    assert store.covered_results(search('compass e', '1966-01-01', '1968-12-31')) == [middle]
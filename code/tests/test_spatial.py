@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from geometry import intersects_bbox, point_in_polygons
+from spatial import SpatialIndex
+
+
+def square(x, y, size):
+    return [[[(x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)]]]
+
+
+@pytest.fixture
+def entries():
+    # Enough overlapping squares, lines and points for a few levels of nodes
+    generator = random.Random(0)
+    entries = []
+    for i in range(400):
+        x, y = generator.uniform(0, 100), generator.uniform(0, 100)
+        kind = generator.choice(['polygon', 'polygon', 'line', 'point'])
+        if kind == 'polygon':
+            parts = square(x, y, generator.uniform(0.5, 5))
+        elif kind == 'line':
+            parts = [[(x, y), (x + generator.uniform(-5, 5), y + generator.uniform(-5, 5))]]
+        else:
+            parts = [(x, y)]
+        entries.append(('filings', f'DOCC{i}', '1970-01-01', kind, parts))
+    return entries
+
+
+def test_points_match_checking_every_polygon(entries):
+    index = SpatialIndex(entries, capacity=4)
+    generator = random.Random(1)
+    for i in range(200):
+        point = (generator.uniform(0, 100), generator.uniform(0, 100))
+        expected = [
+            (layer, identifier, date) for layer, identifier, date, kind, parts in entries
+            if kind == 'polygon' and point_in_polygons(point, parts)
+        ]
+        assert sorted(index.point(*point)) == sorted(expected)
+
+
+def test_bboxes_match_checking_every_geometry(entries):
+    index = SpatialIndex(entries, capacity=4)
+    generator = random.Random(2)
+    for i in range(200):
+        x, y = generator.uniform(-10, 100), generator.uniform(-10, 100)
+        bounds = (x, y, x + generator.uniform(0, 20), y + generator.uniform(0, 20))
+        expected = [
+            (layer, identifier, date) for layer, identifier, date, kind, parts in entries
+            if intersects_bbox(kind, parts, bounds)
+        ]
+        assert sorted(index.bbox(*bounds)) == sorted(expected)
+
+
+def test_saved_index_answers_the_same(entries, tmp_path):
+    index = SpatialIndex(entries)
+    index.save(str(tmp_path / 'spatial.index'))
+    loaded = SpatialIndex.load(str(tmp_path / 'spatial.index'))
+    assert len(loaded) == len(entries)
+    assert loaded.bbox(20, 20, 40, 40) == index.bbox(20, 20, 40, 40)
+
+
+def test_empty_index():
+    index = SpatialIndex([])
+    assert len(index) == 0
+    assert index.point(1, 1) == []
+    assert index.bbox(0, 0, 10, 10) == []
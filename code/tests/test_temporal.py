@@ -0,0 +1,60 @@
+import datetime
+import random
+
+from temporal import IntervalTree, TemporalIndex, end_dates
+
+DAY = datetime.timedelta(days=1)
+START = datetime.date(1967, 1, 1)
+
+
+def test_matches_checking_every_interval():
+    generator = random.Random(0)
+    intervals = []
+    for value in range(300):
+        start = START + generator.randint(0, 3000) * DAY
+        end = None if generator.random() < 0.2 else start + generator.randint(0, 900) * DAY
+        intervals.append((start, end, value))
+    tree = IntervalTree(intervals)
+    for offset in range(-10, 4000, 7):
+        date = START + offset * DAY
+        expected = [value for start, end, value in intervals if start <= date and (end is None or date < end)]
+        assert sorted(tree.at(date)) == expected
+
+
+def test_intervals_are_half_open():
+    tree = IntervalTree([
+        (datetime.date(1970, 1, 1), datetime.date(1971, 1, 1), 'closed'),
+        (datetime.date(1970, 1, 1), None, 'open'),
+        (datetime.date(1970, 6, 1), datetime.date(1970, 6, 1), 'empty'),
+    ])
+    assert tree.at(datetime.date(1969, 12, 31)) == []
+    assert sorted(tree.at(datetime.date(1970, 1, 1))) == ['closed', 'open']
+    assert sorted(tree.at(datetime.date(1970, 6, 1))) == ['closed', 'open']
+    assert tree.at(datetime.date(1971, 1, 1)) == ['open']
+    assert IntervalTree([]).at(datetime.date(1970, 1, 1)) == []
+
+
+def test_changes_between_dates():
+    index = TemporalIndex(['a', 'b', 'c'], [
+        (datetime.date(1970, 1, 1), datetime.date(1972, 1, 1), 0),
+        (datetime.date(1971, 1, 1), None, 1),
+        (datetime.date(1972, 1, 1), None, 2),
+    ])
+    assert index.at(datetime.date(1971, 6, 1)) == ['a', 'b']
+    # After the start date, up to and including the end date
+    assert index.changed_between(datetime.date(1970, 1, 1), datetime.date(1972, 1, 1)) == (['b', 'c'], ['a'])
+    assert index.changed_between(datetime.date(1972, 1, 1), datetime.date(1975, 1, 1)) == ([], [])
+
+
+def test_later_filings_supersede_earlier_ones():
+    outline = {'origin': '24 27 11 NE', 'shape': ['N 00 00 00 E 100.00']}
+    filings = [
+        {'doc': 'DOCC3', 'date': datetime.date(1975, 1, 1), 'property': 'DOCC2'},
+        {'doc': 'DOCC1', 'date': datetime.date(1970, 1, 1), 'property': outline},
+        {'doc': 'DOCC2', 'date': datetime.date(1972, 1, 1), 'property': dict(outline)},
+        {'doc': 'DOCC4', 'date': datetime.date(1973, 1, 1), 'property': outline, 'hidden': True},
+    ]
+    assert end_dates(filings) == {
+        'DOCC1': datetime.date(1972, 1, 1),
+        'DOCC2': datetime.date(1975, 1, 1),
+    }
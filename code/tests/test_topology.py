@@ -0,0 +1,65 @@
+from topology import topology
+
+
+def polygon(*rings):
+    return {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': list(rings)}, 'properties': {}}
+
+
+def line(*positions):
+    return {'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': list(positions)}, 'properties': {}}
+
+
+def decode(arcs):
+    decoded = []
+    for arc in arcs:
+        x, y = 0, 0
+        points = []
+        for dx, dy in arc:
+            x, y = x + dx, y + dy
+            points.append((x, y))
+        decoded.append(points)
+    return decoded
+
+
+def ring_points(arcs, indexes):
+    # Follows a ring's arcs, running any stored the other way round backwards
+    points = []
+    for index in indexes:
+        arc = arcs[index] if index >= 0 else arcs[~index][::-1]
+        points.extend(arc[1:] if points else arc)
+    return points
+
+
+# Coordinates from 0 to 10, quantized to 11 steps, come through unchanged
+LEFT = [(0, 0), (5, 0), (5, 10), (0, 10), (0, 0)]
+RIGHT = [(5, 0), (10, 0), (10, 10), (5, 10), (5, 0)]
+
+
+def test_shared_edges_are_stored_once():
+    result = topology([polygon(LEFT), polygon(RIGHT)], quantization=11)
+    arcs = decode(result['arcs'])
+    left, right = [geometry['arcs'][0] for geometry in result['objects']['features']['geometries']]
+    shared = set(left) & {~index for index in right}
+    assert len(shared) == 1
+    assert sorted(arcs[shared.pop()]) == [(5, 0), (5, 10)]
+    assert len(arcs) == 3
+    assert set(ring_points(arcs, left)) == set(LEFT)
+    assert set(ring_points(arcs, right)) == set(RIGHT)
+
+
+def test_rings_on_their_own_start_from_their_lowest_point():
+    ring = [(10, 10), (10, 0), (0, 0), (0, 10), (10, 10)]
+    result = topology([polygon(ring), polygon(ring[2:] + ring[1:3])], quantization=11)
+    first, second = [geometry['arcs'] for geometry in result['objects']['features']['geometries']]
+    # The same ring, started from a different corner, still shares its arc
+    assert first == second == [[0]]
+    assert decode(result['arcs'])[0][0] == (0, 0)
+
+
+def test_lines_with_too_few_points():
+    result = topology([line((0, 0), (10, 10)), line(), line((5, 5), (5, 5))], quantization=11)
+    full, empty, point = [geometry['arcs'] for geometry in result['objects']['features']['geometries']]
+    arcs = decode(result['arcs'])
+    assert [arcs[index] for index in full] == [[(0, 0), (10, 10)]]
+    assert empty == []
+    assert [arcs[index] for index in point] == [[(5, 5), (5, 5)]]
@@ -0,0 +1,400 @@
+"""
+Builds a z/x/y vector tile pyramid for the time-slider map.
+
+Takes the GeoJSON written by filings-geojson.py and parse-deeds.py (either a
+FeatureCollection or newline-delimited features) and writes one tile per
+z/x/y that any feature touches, clipped to the tile and simplified for its
+zoom level. Every feature carries its start date, and its end date where a
+later filing supersedes it, so the map can filter by time without another
+request.
+
+Tiles are GeoJSON, or Mapbox Vector Tiles if mapbox_vector_tile is installed
+and --format mvt is given. Only tiles whose features have changed since the
+last build are written again.
+"""
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+
+import manifest
+import temporal
+from compiled import load_filings
+from geometry import all_points, clip_line, load_features, map_parts
+
+try:
+    import mapbox_vector_tile
+except ImportError:
+    mapbox_vector_tile = None
+
+# Bump this whenever the tiles themselves would come out differently
+TILES_VERSION = 1
+MIN_ZOOM = 10
+MAX_ZOOM = 16
+EXTENT = 4096  # Size of a tile in its own coordinates
+BUFFER = 64  # How far features extend past the edge of each tile, in the same units
+TOLERANCE = 1.0  # How far simplified lines can stray, also in tile units
+
+EXTENSIONS = {'geojson': 'geojson', 'mvt': 'pbf'}
+
+
+def to_world(longitude, latitude):
+    # Web Mercator, scaled so the whole world fits in a unit square
+    x = (longitude + 180) / 360
+    sin_latitude = math.sin(math.radians(latitude))
+    y = 0.5 - math.log((1 + sin_latitude) / (1 - sin_latitude)) / (4 * math.pi)
+    return x, y
+
+
+def from_world(x, y):
+    longitude = x * 360 - 180
+    latitude = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return round(longitude, 7), round(latitude, 7)
+
+
+def simplify(points, tolerance):
+    """
+    Douglas-Peucker simplification, keeping the first and last points.
+    """
+    if len(points) <= 2:
+        return points
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    tolerance_squared = tolerance * tolerance
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = points[first], points[last]
+        dx, dy = x2 - x1, y2 - y1
+        length_squared = dx * dx + dy * dy
+        farthest, farthest_distance = None, tolerance_squared
+        for i in range(first + 1, last):
+            x, y = points[i]
+            if length_squared:
+                t = max(0, min(1, ((x - x1) * dx + (y - y1) * dy) / length_squared))
+                distance = (x - x1 - t * dx) ** 2 + (y - y1 - t * dy) ** 2
+            else:
+                distance = (x - x1) ** 2 + (y - y1) ** 2
+            if distance > farthest_distance:
+                farthest, farthest_distance = i, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def clip_ring(ring, bounds):
+    """
+    Clips a polygon ring to a rectangle (Sutherland-Hodgman).
+    """
+    minx, miny, maxx, maxy = bounds
+    edges = [
+        (lambda p: p[0] >= minx, lambda a, b: (minx, a[1] + (b[1] - a[1]) * (minx - a[0]) / (b[0] - a[0]))),
+        (lambda p: p[0] <= maxx, lambda a, b: (maxx, a[1] + (b[1] - a[1]) * (maxx - a[0]) / (b[0] - a[0]))),
+        (lambda p: p[1] >= miny, lambda a, b: (a[0] + (b[0] - a[0]) * (miny - a[1]) / (b[1] - a[1]), miny)),
+        (lambda p: p[1] <= maxy, lambda a, b: (a[0] + (b[0] - a[0]) * (maxy - a[1]) / (b[1] - a[1]), maxy)),
+    ]
+    points = ring[:-1] if ring and ring[0] == ring[-1] else ring
+    for inside, intersection in edges:
+        if not points:
+            break
+        clipped = []
+        previous = points[-1]
+        for point in points:
+            if inside(point):
+                if not inside(previous):
+                    clipped.append(intersection(previous, point))
+                clipped.append(point)
+            elif inside(previous):
+                clipped.append(intersection(previous, point))
+            previous = point
+        points = clipped
+    if len(points) < 3:
+        return None
+    return points + [points[0]]
+
+
+def filing_properties(properties, end_dates):
+    tile_properties = {
+        'doc': properties['doc'],
+        'desc': properties.get('desc', ''),
+        'date': properties['date'],
+    }
+    end_date = end_dates.get(properties['doc'])
+    if end_date:
+        tile_properties['end_date'] = str(end_date)
+    return tile_properties
+
+
+def deed_properties(properties, end_dates):
+    return {
+        'parent': properties['parent'],
+        'date': properties['recorded_date'],
+        'grantors': ', '.join(properties.get('grantors', [])),
+        'grantees': ', '.join(properties.get('grantees', [])),
+    }
+
+
+LAYERS = {
+    'filings': filing_properties,
+    'deeds': deed_properties,
+}
+
+
+def prepare_features(sources, end_dates=None, points=False):
+    """
+    Loads features from (layer, path) pairs and puts their coordinates in world units.
+    """
+    end_dates = end_dates or {}
+    prepared = []
+    for layer, path in sources:
+        for feature, kind, feature_parts in load_features(path, points=points):
+            world = map_parts(kind, feature_parts, lambda point: to_world(point[0], point[1]))
+            xs, ys = zip(*all_points(kind, world))
+            properties = LAYERS[layer](feature.get('properties') or {}, end_dates)
+            prepared.append({
+                'layer': layer,
+                'kind': kind,
+                'parts': world,
+                'bbox': (min(xs), min(ys), max(xs), max(ys)),
+                'properties': properties,
+                'hash': hashlib.sha256(json.dumps([layer, kind, world, properties]).encode()).hexdigest(),
+            })
+    return prepared
+
+
+def tile_range(bbox, zoom):
+    scale = 2 ** zoom
+    buffer = BUFFER / EXTENT
+    minx, miny, maxx, maxy = bbox
+    first_x = max(0, int(math.floor(minx * scale - buffer)))
+    last_x = min(scale - 1, int(math.floor(maxx * scale + buffer)))
+    first_y = max(0, int(math.floor(miny * scale - buffer)))
+    last_y = min(scale - 1, int(math.floor(maxy * scale + buffer)))
+    for x in range(first_x, last_x + 1):
+        for y in range(first_y, last_y + 1):
+            yield x, y
+
+
+def assign_tiles(features, min_zoom, max_zoom):
+    """
+    Returns each (z, x, y) tile and the indexes of the features that touch it.
+    """
+    tiles = {}
+    for index, feature in enumerate(features):
+        for zoom in range(min_zoom, max_zoom + 1):
+            for x, y in tile_range(feature['bbox'], zoom):
+                tiles.setdefault((zoom, x, y), []).append(index)
+    return tiles
+
+
+def tile_geometry(feature, zoom, x, y):
+    """
+    Simplifies and clips a feature for a single tile, in that tile's coordinates.
+    """
+    scale = 2 ** zoom * EXTENT
+
+    def to_tile(point):
+        return (point[0] * scale - x * EXTENT, point[1] * scale - y * EXTENT)
+
+    bounds = (-BUFFER, -BUFFER, EXTENT + BUFFER, EXTENT + BUFFER)
+    kind = feature['kind']
+    parts = map_parts(kind, feature['parts'], to_tile)
+    clipped = []
+    if kind == 'polygon':
+        for polygon in parts:
+            rings = []
+            for ring in polygon:
+                ring = clip_ring(simplify(ring, TOLERANCE), bounds)
+                if ring is None or len(ring) < 4:
+                    if not rings:
+                        # Without its outer ring, the rest of the polygon doesn't matter
+                        break
+                    continue
+                rings.append(ring)
+            if rings:
+                clipped.append(rings)
+    elif kind == 'line':
+        for line in parts:
+            clipped.extend(clip_line(simplify(line, TOLERANCE), bounds))
+    else:
+        minx, miny, maxx, maxy = bounds
+        clipped = [point for point in parts if minx <= point[0] <= maxx and miny <= point[1] <= maxy]
+    return clipped
+
+
+def geojson_geometry(kind, parts, zoom, x, y):
+    scale = 2 ** zoom * EXTENT
+
+    def to_lonlat(point):
+        return from_world((point[0] + x * EXTENT) / scale, (point[1] + y * EXTENT) / scale)
+
+    parts = map_parts(kind, parts, to_lonlat)
+    if kind == 'polygon':
+        return {'type': 'Polygon', 'coordinates': parts[0]} if len(parts) == 1 else {'type': 'MultiPolygon', 'coordinates': parts}
+    if kind == 'line':
+        return {'type': 'LineString', 'coordinates': parts[0]} if len(parts) == 1 else {'type': 'MultiLineString', 'coordinates': parts}
+    return {'type': 'Point', 'coordinates': parts[0]} if len(parts) == 1 else {'type': 'MultiPoint', 'coordinates': parts}
+
+
+def wkt_geometry(kind, parts):
+    def coordinates(points):
+        return ', '.join(f'{round(px)} {round(py)}' for px, py in points)
+
+    if kind == 'polygon':
+        return 'MULTIPOLYGON (%s)' % ', '.join(
+            '(%s)' % ', '.join(f'({coordinates(ring)})' for ring in polygon) for polygon in parts
+        )
+    if kind == 'line':
+        return 'MULTILINESTRING (%s)' % ', '.join(f'({coordinates(line)})' for line in parts)
+    return 'MULTIPOINT (%s)' % coordinates(parts)
+
+
+def encode_tile(features, zoom, x, y, tile_format):
+    layers = {}
+    for feature in features:
+        parts = tile_geometry(feature, zoom, x, y)
+        if not parts:
+            continue
+        layers.setdefault(feature['layer'], []).append((feature, parts))
+
+    if tile_format == 'mvt':
+        return mapbox_vector_tile.encode([
+            {
+                'name': layer,
+                'features': [
+                    {'geometry': wkt_geometry(feature['kind'], parts), 'properties': feature['properties']}
+                    for feature, parts in layer_features
+                ],
+            }
+            for layer, layer_features in layers.items()
+        ], default_options={'extents': EXTENT, 'y_coord_down': True})
+
+    collection = {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': geojson_geometry(feature['kind'], parts, zoom, x, y),
+                'properties': dict(feature['properties'], layer=layer),
+            }
+            for layer, layer_features in layers.items()
+            for feature, parts in layer_features
+        ],
+    }
+    return json.dumps(collection, separators=(',', ':')).encode()
+
+
+def tile_path(output_directory, zoom, x, y, tile_format):
+    return os.path.join(output_directory, str(zoom), str(x), f'{y}.{EXTENSIONS[tile_format]}')
+
+
+# Set in each worker process, so the features only get sent over once
+FEATURES = None
+
+
+def set_features(features):
+    global FEATURES
+    FEATURES = features
+
+
+def write_tile(task):
+    zoom, x, y, indexes, output_directory, tile_format = task
+    content = encode_tile([FEATURES[i] for i in indexes], zoom, x, y, tile_format)
+    path = tile_path(output_directory, zoom, x, y, tile_format)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.{os.getpid()}'
+    with open(temporary_path, 'wb') as tile_file:
+        tile_file.write(content)
+    os.replace(temporary_path, path)
+    return zoom, x, y
+
+
+def build_tiles(features, output_directory, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, tile_format='geojson', workers=1, rebuild=False):
+    """
+    Writes every tile that's changed since the last build, and removes any
+    that no longer have features in them. Returns the number of tiles written.
+    """
+    version = f'{TILES_VERSION}:{tile_format}:{EXTENT}:{BUFFER}:{TOLERANCE}'
+    build_manifest = manifest.Manifest(os.path.join(output_directory, 'manifest.json'), version)
+    tiles = assign_tiles(features, min_zoom, max_zoom)
+
+    stale = []
+    sources = {}
+    for (zoom, x, y), indexes in tiles.items():
+        key = f'{zoom}/{x}/{y}'
+        digest = hashlib.sha256(''.join(features[i]['hash'] for i in indexes).encode()).hexdigest()
+        sources[key] = {'features': digest}
+        if rebuild or not build_manifest.is_current(key, sources[key]):
+            stale.append((zoom, x, y, indexes, output_directory, tile_format))
+
+    # Tiles that nothing touches any more
+    for key in list(build_manifest.entries):
+        if key not in sources:
+            for output in build_manifest.outputs(key):
+                try:
+                    os.remove(os.path.join(output_directory, output))
+                except OSError:
+                    pass
+            build_manifest.forget(key)
+
+    if workers == 1:
+        set_features(features)
+        written = map(write_tile, stale)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers or None, initializer=set_features, initargs=(features,))
+        written = pool.imap_unordered(write_tile, stale, chunksize=16)
+
+    try:
+        count = 0
+        for zoom, x, y in written:
+            key = f'{zoom}/{x}/{y}'
+            build_manifest.record(key, sources[key], [os.path.relpath(
+                tile_path(output_directory, zoom, x, y, tile_format), output_directory
+            )])
+            count += 1
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        build_manifest.save()
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds a z/x/y vector tile pyramid from filings and deeds GeoJSON')
+    parser.add_argument('output', help='directory to write the tiles to')
+    parser.add_argument('--filings', action='append', default=[], metavar='GEOJSON', help='GeoJSON written by filings-geojson.py')
+    parser.add_argument('--deeds', action='append', default=[], metavar='GEOJSON', help='GeoJSON written by parse-deeds.py')
+    parser.add_argument('--filings-yaml', metavar='YAML', help='filings.yaml, to work out when each filing was superseded')
+    parser.add_argument('--min-zoom', type=int, default=MIN_ZOOM)
+    parser.add_argument('--max-zoom', type=int, default=MAX_ZOOM)
+    parser.add_argument('--format', choices=sorted(EXTENSIONS), default='geojson')
+    parser.add_argument('--points', action='store_true', help='include the individual points of each traverse')
+    parser.add_argument('--workers', type=int, default=1, metavar='N', help='number of worker processes (0 for one per CPU)')
+    parser.add_argument('--rebuild', action='store_true', help='write every tile, even if it hasn\'t changed')
+    args = parser.parse_args()
+
+    if args.format == 'mvt' and mapbox_vector_tile is None:
+        parser.error('--format mvt needs the mapbox_vector_tile package')
+
+    end_dates = {}
+    if args.filings_yaml:
+        end_dates = temporal.end_dates(load_filings(args.filings_yaml))
+
+    sources = [('filings', path) for path in args.filings] + [('deeds', path) for path in args.deeds]
+    features = prepare_features(sources, end_dates=end_dates, points=args.points)
+    count = build_tiles(
+        features,
+        args.output,
+        min_zoom=args.min_zoom,
+        max_zoom=args.max_zoom,
+        tile_format=args.format,
+        workers=args.workers,
+        rebuild=args.rebuild,
+    )
+    print(f'Wrote {count} tiles')
@@ -0,0 +1,221 @@
+"""
+Merges GeoJSON features into a TopoJSON topology, where every stretch of
+boundary shared between geometries is only stored once, as an arc, and the
+coordinates are quantized to integers and written as deltas.
+"""
+
+DEFAULT_QUANTIZATION = 1000000
+
+
+def feature_bounds(features):
+    xs, ys = [], []
+    for feature in features:
+        for x, y in geometry_positions(feature.get('geometry')):
+            xs.append(x)
+            ys.append(y)
+    if not xs:
+        return 0, 0, 0, 0
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def geometry_positions(geometry):
+    if not geometry:
+        return
+    kind, coordinates = geometry['type'], geometry['coordinates']
+    if kind == 'Point':
+        yield coordinates[:2]
+    elif kind in ('MultiPoint', 'LineString'):
+        yield from (position[:2] for position in coordinates)
+    elif kind in ('MultiLineString', 'Polygon'):
+        yield from (position[:2] for line in coordinates for position in line)
+    elif kind == 'MultiPolygon':
+        yield from (position[:2] for polygon in coordinates for ring in polygon for position in ring)
+
+
+class Quantizer:
+    def __init__(self, bounds, quantization=DEFAULT_QUANTIZATION):
+        self.x0, self.y0, x1, y1 = bounds
+        self.kx = (quantization - 1) / (x1 - self.x0) if x1 > self.x0 else 1
+        self.ky = (quantization - 1) / (y1 - self.y0) if y1 > self.y0 else 1
+
+    def transform(self):
+        return {'scale': [1 / self.kx, 1 / self.ky], 'translate': [self.x0, self.y0]}
+
+    def point(self, position):
+        return round((position[0] - self.x0) * self.kx), round((position[1] - self.y0) * self.ky)
+
+    def line(self, positions):
+        # Points that quantize to the same spot would only make zero-length segments
+        line = []
+        for position in positions:
+            point = self.point(position)
+            if not line or point != line[-1]:
+                line.append(point)
+        return line
+
+
+class Topology:
+    """
+    Collects the lines and rings of many geometries, then cuts them into arcs
+    wherever they meet or part ways, so each shared arc is only kept once.
+
+    A point is a junction if it isn't always between the same two neighbours,
+    which is where one boundary stops following another. Rings that never touch
+    anything else become a single arc, started from their lowest point so that
+    identical rings in different features still match.
+    """
+
+    def __init__(self, quantizer):
+        self.quantizer = quantizer
+        self.lines = []
+        self.rings = []
+        self.geometries = []
+
+    def add(self, feature):
+        geometry = feature.get('geometry')
+        entry = {'properties': feature.get('properties') or {}}
+        if feature.get('id') is not None:
+            entry['id'] = feature['id']
+        if not geometry:
+            entry['type'] = None
+        else:
+            kind, coordinates = geometry['type'], geometry['coordinates']
+            entry['type'] = kind
+            if kind == 'Point':
+                entry['coordinates'] = list(self.quantizer.point(coordinates))
+            elif kind == 'MultiPoint':
+                entry['coordinates'] = [list(self.quantizer.point(position)) for position in coordinates]
+            elif kind == 'LineString':
+                entry['arcs'] = self.add_line(coordinates)
+            elif kind == 'MultiLineString':
+                entry['arcs'] = [self.add_line(line) for line in coordinates]
+            elif kind == 'Polygon':
+                entry['arcs'] = [self.add_ring(ring) for ring in coordinates]
+            elif kind == 'MultiPolygon':
+                entry['arcs'] = [[self.add_ring(ring) for ring in polygon] for polygon in coordinates]
+            else:
+                raise ValueError(f'Unsupported geometry type {kind!r}')
+        self.geometries.append(entry)
+
+    def add_line(self, positions):
+        # Lines and rings are cut into arcs later, so keep a slot to fill in
+        line = self.quantizer.line(positions)
+        self.lines.append(line)
+        return ('line', len(self.lines) - 1)
+
+    def add_ring(self, positions):
+        ring = self.quantizer.line(positions)
+        if len(ring) > 1 and ring[0] == ring[-1]:
+            ring.pop()
+        self.rings.append(ring)
+        return ('ring', len(self.rings) - 1)
+
+    def junctions(self):
+        neighbours = {}
+        junctions = set()
+
+        def visit(previous, point, following):
+            pair = (previous, following) if previous <= following else (following, previous)
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                junctions.add(point)
+
+        for line in self.lines:
+            if line:
+                junctions.add(line[0])
+                junctions.add(line[-1])
+            for i in range(1, len(line) - 1):
+                visit(line[i - 1], line[i], line[i + 1])
+        for ring in self.rings:
+            for i, point in enumerate(ring):
+                visit(ring[i - 1], point, ring[(i + 1) % len(ring)])
+        return junctions
+
+    def build(self):
+        junctions = self.junctions()
+        arcs = []
+        arc_indexes = {}
+
+        def arc_index(points):
+            key = tuple(points)
+            index = arc_indexes.get(key)
+            if index is not None:
+                return index
+            # The same arc, run the other way, is stored as its one's complement
+            index = arc_indexes.get(key[::-1])
+            if index is not None:
+                return ~index
+            arc_indexes[key] = len(arcs)
+            arcs.append(key)
+            return len(arcs) - 1
+
+        def cut(points):
+            pieces = []
+            start = 0
+            for i in range(1, len(points) - 1):
+                if points[i] in junctions:
+                    pieces.append(arc_index(points[start:i + 1]))
+                    start = i
+            pieces.append(arc_index(points[start:]))
+            return pieces
+
+        line_arcs = []
+        for line in self.lines:
+            if not line:
+                line_arcs.append([])
+            elif len(line) == 1:
+                line_arcs.append([arc_index(line * 2)])
+            else:
+                line_arcs.append(cut(line))
+
+        ring_arcs = []
+        for ring in self.rings:
+            if not ring:
+                ring_arcs.append([])
+                continue
+            starts = [i for i, point in enumerate(ring) if point in junctions]
+            start = starts[0] if starts else ring.index(min(ring))
+            ring = ring[start:] + ring[:start]
+            ring_arcs.append(cut(ring + ring[:1]))
+
+        def resolve(arcs):
+            if isinstance(arcs, tuple):
+                kind, index = arcs
+                return line_arcs[index] if kind == 'line' else ring_arcs[index]
+            return [resolve(part) for part in arcs]
+
+        geometries = []
+        for entry in self.geometries:
+            if 'arcs' in entry:
+                entry = dict(entry, arcs=resolve(entry['arcs']))
+            geometries.append(entry)
+        return geometries, [delta_encode(arc) for arc in arcs]
+
+
+def delta_encode(points):
+    encoded = [list(points[0])]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        encoded.append([x1 - x0, y1 - y0])
+    return encoded
+
+
+def topology(features, name='features', quantization=DEFAULT_QUANTIZATION):
+    """
+    Returns a TopoJSON topology holding features as a single named object.
+    """
+    features = list(features)
+    bounds = feature_bounds(features)
+    quantizer = Quantizer(bounds, quantization)
+    builder = Topology(quantizer)
+    for feature in features:
+        builder.add(feature)
+    geometries, arcs = builder.build()
+    return {
+        'type': 'Topology',
+        'bbox': list(bounds),
+        'transform': quantizer.transform(),
+        'objects': {
+            name: {'type': 'GeometryCollection', 'geometries': geometries},
+        },
+        'arcs': arcs,
+    }
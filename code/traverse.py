@@ -0,0 +1,436 @@
+from __future__ import division
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+from math import acos, ceil, cos, radians, sin
+from operator import itemgetter
+
+import numpy
+
+line_re = re.compile(r'(N|S) +(\d+) +(\d+) +([\d.]+) +(E|W) +([\d.]+)')
+curve_re = re.compile(r'(L|R) +([\d.]+) +(\d+) +(\d+) +([\d.]+)(?: +([\d.]+))?')
+THRESHOLD = 1  # feet
+CURVE_TOLERANCE = 0.5  # feet between each chord and the arc it stands in for
+
+class OffsetEnding(ValueError):
+    pass
+
+def make_points(origin, beginning, shape, include_origin=False, closed=False, ignore_end=True):
+    if include_origin:
+        yield origin, False  # Origin
+
+    x, y = origin
+
+    for call in moves(beginning):
+        bearing, distance, interpolated = call[:3]
+        horizontal = sin(bearing) * distance
+        vertical = cos(bearing) * distance
+        x += horizontal
+        y += vertical
+
+        if include_origin:
+            yield (x, y), interpolated  # Point from origin to beginning
+
+    beginning = (x, y)
+    if not include_origin:
+        yield beginning, False  # Only if the origin wasn't already included
+
+    shape = moves(shape)
+    last_i = len(shape) - 1
+
+    for i, call in enumerate(shape):
+        bearing, distance, interpolated = call[:3]
+        horizontal = sin(bearing) * distance
+        vertical = cos(bearing) * distance
+        x += horizontal
+        y += vertical
+        if i == last_i:
+            off = point_distance((x, y), beginning)
+            if off < THRESHOLD:
+                # Reached the end and it's close enough to the beginning that the
+                # difference is likely just floating point error
+                yield beginning, False
+            elif ignore_end:
+                yield (x, y), interpolated
+                if closed:
+                    yield beginning, False
+            else:
+                raise OffsetEnding("End differs from beginning by %s" % off)
+        else:
+            yield (x, y), interpolated
+
+def moves(calls):
+    # A curve with no radius only turns, which would just repeat the last vertex
+    return [call for call in calls if call[1]]
+
+
+def point_distance(a, b):
+    return (abs(a[0] - b[0]) ** 2 + abs(a[1] - b[1]) ** 2) ** .5
+
+def make_angle(degrees, minutes=0, seconds=0):
+    return radians(degrees + (minutes + seconds / 60) / 60)
+
+def rotate(bearing, angle, right):
+    return (bearing + angle * (1 if right else -1)) % radians(360)
+
+@lru_cache(maxsize=None)
+def line_bearing(string):
+    # Straight calls don't depend on anything that came before them, and the same
+    # calls show up over and over again in the filings, so they only get parsed once
+    match = line_re.match(string)
+    if not match:
+        return None
+
+    ns, degrees, minutes, seconds, ew, distance = match.groups()
+    north = ns == 'N'
+    south = not north
+
+    east = ew == 'E'
+    west = not east
+
+    degrees = int(degrees)
+    minutes = int(minutes)
+    seconds = float(seconds)
+
+    degrees += (minutes + seconds / 60) / 60
+
+    if north and east:
+        pass
+    if north and west:
+        degrees = -degrees
+    if south and west:
+        degrees = 180 + degrees
+    if south and east:
+        degrees = 180 - degrees
+
+    return radians(degrees), float(distance)
+
+class Arc(namedtuple('Arc', ['bearing', 'distance', 'interpolated', 'radius', 'delta', 'right'])):
+    """
+    A circular curve, as a single call along its chord from the PC to the PT.
+
+    Anything that just follows calls can treat it like a straight line, while
+    anything that can draw arcs has the radius, central angle (delta) and
+    direction it needs to do so.
+    """
+
+    @classmethod
+    def from_tangent(cls, bearing, radius, delta, right):
+        chord = 2 * sin(delta / 2) * radius
+        return cls(rotate(bearing, delta / 2, right), chord, False, radius, delta, right)
+
+    @property
+    def length(self):
+        return self.radius * self.delta
+
+    @property
+    def start_bearing(self):
+        return rotate(self.bearing, self.delta / 2, not self.right)
+
+    @property
+    def end_bearing(self):
+        return rotate(self.bearing, self.delta / 2, self.right)
+
+    def steps(self, tolerance=CURVE_TOLERANCE):
+        """
+        The fewest equal chords that keep within tolerance of the arc.
+
+        A chord across an angle a strays radius * (1 - cos(a / 2)) from the arc
+        at its middle, so solving that for a gives the widest each chord can be.
+        """
+        if self.radius <= tolerance:
+            return 1
+        step_angle = 2 * acos(1 - tolerance / self.radius)
+        return max(1, int(ceil(self.delta / step_angle)))
+
+    def densify(self, tolerance=CURVE_TOLERANCE, steps=None):
+        """
+        Splits the arc into equal chords, as (bearing, distance, interpolated) calls.
+        """
+        steps = steps or self.steps(tolerance)
+        step_angle = self.delta / steps
+        step_distance = 2 * sin(step_angle / 2) * self.radius
+
+        # Each chord runs halfway between the tangents at either end of it
+        bearing = rotate(self.start_bearing, step_angle / 2, self.right)
+        for step in range(steps):
+            # Every vertex but the PT is interpolated
+            yield bearing, step_distance, step < steps - 1
+            bearing = rotate(bearing, step_angle, self.right)
+
+
+def densify(calls, tolerance=CURVE_TOLERANCE):
+    """
+    Splits any Arcs among calls into chords.
+    """
+    for call in calls:
+        if isinstance(call, Arc):
+            yield from call.densify(tolerance)
+        else:
+            yield call
+
+
+def end_bearing(calls):
+    """
+    The bearing a list of calls finishes on, which for a curve is its tangent at the PT.
+    """
+    last = calls[-1]
+    return last.end_bearing if isinstance(last, Arc) else last[0]
+
+
+def parse_curve(string, bearing):
+    """
+    Parses a curve call, like "R 220.00 26 30 33 101.79" (direction, radius,
+    central angle and arc length), that starts on the given bearing.
+    """
+    match = curve_re.match(string)
+    if not match:
+        return None
+
+    lr, radius, degrees, minutes, seconds, length = match.groups()
+    delta = make_angle(int(degrees), int(minutes), float(seconds))
+    radius = float(radius)
+    length = float(length or 0)
+    if not radius and length and delta:
+        # Only the arc length was given, which is enough to work out the radius
+        radius = length / delta
+    return Arc.from_tangent(bearing, radius, delta, lr == 'R')
+
+
+def bearings(strings, angle_step=None, angle_steps=None, bearing=None, tolerance=CURVE_TOLERANCE, arcs=False):
+    """
+    Parses calls into (bearing, distance, interpolated) calls.
+
+    Curves are split into chords no more than tolerance feet from the arc, or
+    into fixed angle_step degree chords, or into angle_steps chords apiece.
+    With arcs=True, each curve comes out as a single Arc instead.
+    """
+    for string in strings:
+
+        # Lines
+
+        line = line_bearing(string)
+        if line:
+            bearing, distance = line
+            yield bearing, distance, False  # Not interpolated
+
+        # Curves
+
+        arc = parse_curve(string, bearing)
+        if arc:
+            bearing = arc.end_bearing
+            if not arc.radius:
+                # A curve with no radius just turns to face the next call
+                yield bearing, 0.0, False
+            elif arcs:
+                yield arc
+            else:
+                steps = angle_steps
+                if angle_step and not steps:
+                    steps = int(ceil(arc.delta / make_angle(angle_step)))
+                yield from arc.densify(tolerance, steps)
+
+
+Closure = namedtuple('Closure', ['misclosure', 'dx', 'dy', 'length', 'precision', 'angular'])
+Closure.__doc__ = """
+How far a traverse's shape ends from its beginning, in feet (and in x and y),
+along with the shape's length, the precision ratio (length over misclosure, so
+1:precision) and the angular misclosure, in degrees: how far the last call
+would have to turn to close the traverse.
+"""
+
+# Where each traverse's vertices sit in a TraverseBatch's flat arrays
+Layout = namedtuple('Layout', ['starts', 'begins', 'ends', 'segments', 'bearing', 'distance', 'interpolated', 'steps'])
+
+
+class Traverse:
+    """
+    A single traverse queued up in a TraverseBatch.
+    """
+
+    def __init__(self, origin, beginning, shape, include_origin=False, closed=False, ignore_end=True):
+        self.origin = origin
+        self.beginning = list(beginning)
+        self.shape = list(shape)
+        self.include_origin = include_origin
+        self.closed = closed
+        self.ignore_end = ignore_end
+
+
+class TraverseBatch:
+    """
+    Computes the vertices of many traverses at once.
+
+    Each traverse is added with the same arguments make_points() accepts, and
+    compute() returns the same (coordinates, interpolated) lists make_points()
+    would have yielded for each of them, in the order they were added.
+
+    Turning every vertex back into Python tuples costs more than walking the
+    calls one at a time does, so plain vertices still come from make_points().
+    Closures and compass rule adjustments need every vertex at once, so for
+    those, every call in the batch is packed into one set of flat arrays, with
+    each traverse's origin at the start of its own segment.
+    """
+
+    def __init__(self):
+        self.traverses = []
+
+    def __len__(self):
+        return len(self.traverses)
+
+    def add(self, origin, beginning, shape, **kwargs):
+        self.traverses.append(Traverse(origin, beginning, shape, **kwargs))
+        return len(self.traverses) - 1
+
+    def _layout(self):
+        parts = [(moves(traverse.beginning), moves(traverse.shape)) for traverse in self.traverses]
+        begin_counts = numpy.array([len(beginning) for beginning, shape in parts], dtype=int)
+        shape_counts = numpy.array([len(shape) for beginning, shape in parts], dtype=int)
+        lengths = begin_counts + shape_counts + 1
+        starts = numpy.cumsum(lengths) - lengths
+        segments = numpy.repeat(numpy.arange(len(self.traverses)), lengths)
+        columns = numpy.arange(len(segments)) - starts[segments]
+
+        calls = [call for beginning, shape in parts for part in (beginning, shape) for call in part]
+        bearing = numpy.zeros(len(segments))
+        distance = numpy.zeros(len(segments))
+        interpolated = numpy.zeros(len(segments), dtype=bool)
+        moved = columns > 0
+        # Arcs carry more than three fields, but they're still calls along their chords
+        for values, field in ((bearing, 0), (distance, 1), (interpolated, 2)):
+            values[moved] = numpy.fromiter(map(itemgetter(field), calls), values.dtype, len(calls))
+
+        # Columns past the first, in order, for accumulating every segment at once
+        order = numpy.argsort(columns, kind='stable')
+        bounds = numpy.cumsum(numpy.bincount(columns))
+        steps = [order[bounds[column - 1]:bounds[column]] for column in range(1, len(bounds))]
+        return Layout(
+            starts, starts + begin_counts, starts + lengths - 1, segments, bearing, distance, interpolated, steps,
+        )
+
+    def _accumulate(self, layout, values):
+        # Adds up each segment one column at a time, rather than with one cumsum
+        # over the whole batch, so every vertex is rounded just as make_points()
+        # rounds it, and no traverse's coordinates leak into the next one's
+        for positions in layout.steps:
+            values[positions] += values[positions - 1]
+        return values
+
+    def _vertices(self, layout):
+        x = numpy.sin(layout.bearing) * layout.distance
+        y = numpy.cos(layout.bearing) * layout.distance
+        x[layout.starts], y[layout.starts] = numpy.array(
+            [traverse.origin for traverse in self.traverses], dtype=float
+        ).reshape(-1, 2).T
+        return self._accumulate(layout, x), self._accumulate(layout, y)
+
+    def _shape_distances(self, layout):
+        # The distance of every call in a shape, and nothing for the beginning
+        positions = numpy.arange(len(layout.segments))
+        return numpy.where(positions > layout.begins[layout.segments], layout.distance, 0)
+
+    def _misclosures(self, layout, x, y):
+        return x[layout.ends] - x[layout.begins], y[layout.ends] - y[layout.begins]
+
+    def closures(self):
+        """
+        Measures how far each traverse falls short of closing, as a Closure.
+        """
+        if not self.traverses:
+            return []
+
+        layout = self._layout()
+        x, y = self._vertices(layout)
+        dx, dy = self._misclosures(layout, x, y)
+        misclosure = numpy.hypot(dx, dy)
+        perimeter = numpy.add.reduceat(self._shape_distances(layout), layout.starts)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            precision = numpy.where(misclosure > 0, perimeter / misclosure, numpy.inf)
+
+        # The bearing the last call would need to land exactly on the beginning,
+        # from the vertex before it, against the bearing it actually has
+        has_shape = layout.ends > layout.begins
+        last_bearing = numpy.where(has_shape, layout.bearing[layout.ends], 0.0)
+        before = numpy.maximum(layout.ends - 1, layout.starts)
+        needed = numpy.arctan2(x[layout.begins] - x[before], y[layout.begins] - y[before])
+        angular = (needed - last_bearing + numpy.pi) % (2 * numpy.pi) - numpy.pi
+
+        return [
+            Closure(*values)
+            for values in zip(
+                misclosure.tolist(), dx.tolist(), dy.tolist(), perimeter.tolist(),
+                precision.tolist(), numpy.degrees(angular).tolist(),
+            )
+        ]
+
+    def compute(self, adjust=False):
+        """
+        With adjust=True, closed traverses are balanced with the compass rule
+        (Bowditch) first: every vertex of the shape moves against the
+        misclosure in proportion to how far along the shape it is, so the end
+        lands on the beginning.
+        """
+        if not adjust:
+            return [self._walk(traverse) for traverse in self.traverses]
+        if not self.traverses:
+            return []
+
+        layout = self._layout()
+        x, y = self._vertices(layout)
+        dx, dy = self._misclosures(layout, x, y)
+        along = self._accumulate(layout, self._shape_distances(layout))
+        perimeter = along[layout.ends]
+        closed = numpy.array([traverse.closed for traverse in self.traverses]) & (perimeter > 0)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            share = numpy.where(closed[layout.segments], along / perimeter[layout.segments], 0)
+        x = x - share * dx[layout.segments]
+        y = y - share * dy[layout.segments]
+
+        # Closure checks for every traverse at once
+        offsets = numpy.hypot(*self._misclosures(layout, x, y)).tolist()
+
+        # Everything goes back to Python in one go, then gets sliced up by traverse
+        vertices = list(zip(zip(x.tolist(), y.tolist()), layout.interpolated.tolist()))
+        return [
+            self._points(traverse, vertices, start, begin, end, off)
+            for traverse, start, begin, end, off in zip(
+                self.traverses, layout.starts.tolist(), layout.begins.tolist(), layout.ends.tolist(), offsets,
+            )
+        ]
+
+    def _walk(self, traverse):
+        try:
+            return list(make_points(
+                traverse.origin, traverse.beginning, traverse.shape,
+                include_origin=traverse.include_origin, closed=traverse.closed, ignore_end=traverse.ignore_end,
+            ))
+        except OffsetEnding as exc:
+            return exc
+
+    def _points(self, traverse, vertices, start, begin, end, off):
+        beginning = vertices[begin][0]
+
+        if traverse.include_origin:
+            points = [(traverse.origin, False)] + vertices[start + 1:begin + 1]  # Origin
+        else:
+            points = [(beginning, False)]
+
+        if end == begin:
+            return points
+
+        points += vertices[begin + 1:end]
+
+        if off < THRESHOLD:
+            # Reached the end and it's close enough to the beginning that the
+            # difference is likely just floating point error
+            points.append((beginning, False))
+        elif traverse.ignore_end:
+            points.append(vertices[end])
+            if traverse.closed:
+                points.append((beginning, False))
+        else:
+            off = point_distance(vertices[end][0], beginning)
+            return OffsetEnding("End differs from beginning by %s" % off)
+
+        return points